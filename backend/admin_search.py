@@ -0,0 +1,180 @@
+"""
+GuaraniAppStore V2.5 Pro - Admin Search & Pagination
+Búsqueda con índices trigram (pg_trgm) y paginación por cursor para el panel admin.
+Sin pg_trgm la búsqueda sigue funcionando con ILIKE y un ranking por coincidencia.
+"""
+
+import time
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from bson import ObjectId
+from sqlalchemy import select, func, or_, case, tuple_, text
+
+from models import User, Order, Service
+
+ADMIN_PAGE_MAX = 200
+ADMIN_SEARCH_MAX = 50
+# Largo mínimo de q para usar el operador % de pg_trgm (con menos no hay trigramas útiles)
+TRGM_MIN_QUERY_LENGTH = 3
+# Mientras falte pg_trgm se vuelve a consultar cada tanto (database.apply_search_indexes
+# la crea en segundo plano después del arranque)
+TRGM_RECHECK_SECONDS = 60.0
+
+_trgm = {'available': False, 'checked_at': None}
+
+
+class InvalidCursor(ValueError):
+    """Cursor de paginación mal formado"""
+
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    return f"{created_at.isoformat()}|{row_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    created_at, sep, row_id = cursor.partition('|')
+    if not sep or not row_id:
+        raise InvalidCursor(cursor)
+    try:
+        return datetime.fromisoformat(created_at), row_id
+    except ValueError:
+        raise InvalidCursor(cursor)
+
+
+async def keyset_page(db, query, model, cursor: Optional[str], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """
+    Página ordenada por (created_at DESC, id DESC) a partir del cursor.
+
+    El costo es el mismo para cualquier página: el cursor se traduce en un
+    rango sobre el índice (created_at, id) en lugar de un OFFSET.
+    """
+    limit = max(1, min(limit, ADMIN_PAGE_MAX))
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.where(tuple_(model.created_at, model.id) < tuple_(created_at, row_id))
+    result = await db.execute(
+        query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+    )
+    rows = result.scalars().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
+
+
+async def mongo_keyset_page(collection, cursor: Optional[str], limit: int) -> Tuple[List[dict], Optional[str]]:
+    """
+    Misma paginación que keyset_page para el respaldo de MongoDB: orden
+    (created_at DESC, _id DESC) y rango a partir del cursor en lugar de skip.
+    """
+    limit = max(1, min(limit, ADMIN_PAGE_MAX))
+    query = {}
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        doc_id = ObjectId(row_id) if ObjectId.is_valid(row_id) else row_id
+        query = {'$or': [
+            {'created_at': {'$lt': created_at}},
+            {'created_at': created_at, '_id': {'$lt': doc_id}}
+        ]}
+    docs = await collection.find(query).sort(
+        [('created_at', -1), ('_id', -1)]
+    ).limit(limit + 1).to_list(length=limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        if isinstance(last.get('created_at'), datetime):
+            next_cursor = encode_cursor(last['created_at'], str(last['_id']))
+    return docs, next_cursor
+
+
+async def trgm_available(db) -> bool:
+    """Si pg_trgm está instalada (una vez encontrada no se vuelve a consultar)"""
+    if _trgm['available']:
+        return True
+    now = time.monotonic()
+    if _trgm['checked_at'] is None or now - _trgm['checked_at'] >= TRGM_RECHECK_SECONDS:
+        result = await db.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))
+        _trgm['available'] = result.scalar() is not None
+        _trgm['checked_at'] = now
+    return _trgm['available']
+
+
+def _like_pattern(q: str) -> str:
+    escaped = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def _prefix_pattern(q: str) -> str:
+    return _like_pattern(q)[1:]
+
+
+def _matches(q: str, *columns, trgm: bool = True) -> Any:
+    """ILIKE por subcadena y, con pg_trgm y desde 3 caracteres, similitud trigram (tolera errores de tipeo)"""
+    pattern = _like_pattern(q)
+    conditions = [column.ilike(pattern, escape='\\') for column in columns]
+    if trgm and len(q) >= TRGM_MIN_QUERY_LENGTH:
+        conditions += [column.op('%')(q) for column in columns]
+    return or_(*conditions)
+
+
+def _score(q: str, *columns, trgm: bool = True) -> Any:
+    """
+    Similitud máxima entre columnas, con bonus para coincidencias por prefijo.
+    Sin pg_trgm: coincidencia exacta > prefijo > subcadena.
+    """
+    prefix = _prefix_pattern(q)
+    bonus = case(
+        (or_(*[column.ilike(prefix, escape='\\') for column in columns]), 1.0),
+        else_=0.0
+    )
+    if not trgm:
+        exact = case(
+            (or_(*[func.lower(column) == q.lower() for column in columns]), 1.0),
+            else_=0.0
+        )
+        return exact + bonus
+    similarity = func.coalesce(func.greatest(*[func.similarity(column, q) for column in columns]), 0)
+    return similarity + bonus
+
+
+async def search_users(db, q: str, limit: int = 20) -> List[User]:
+    trgm = await trgm_available(db)
+    score = _score(q, User.email, User.full_name, trgm=trgm).label('score')
+    result = await db.execute(
+        select(User, score)
+        .where(_matches(q, User.email, User.full_name, trgm=trgm))
+        .order_by(score.desc(), User.created_at.desc())
+        .limit(min(limit, ADMIN_SEARCH_MAX))
+    )
+    return [row[0] for row in result]
+
+
+async def search_orders(db, q: str, limit: int = 20) -> List[Order]:
+    trgm = await trgm_available(db)
+    score = _score(q, Order.order_number, Order.id, trgm=trgm).label('score')
+    result = await db.execute(
+        select(Order, score)
+        .where(_matches(q, Order.order_number, Order.id, trgm=trgm))
+        .order_by(score.desc(), Order.created_at.desc())
+        .limit(min(limit, ADMIN_SEARCH_MAX))
+    )
+    return [row[0] for row in result]
+
+
+async def search_services(db, q: str, limit: int = 20) -> List[Service]:
+    trgm = await trgm_available(db)
+    score = _score(q, Service.name, Service.short_description, trgm=trgm)
+    if trgm:
+        # La descripción es larga: word_similarity compara q con la mejor ventana del texto
+        score = score + func.coalesce(func.word_similarity(q, Service.description), 0) / 2
+    score = score.label('score')
+    result = await db.execute(
+        select(Service, score)
+        .where(_matches(q, Service.name, Service.short_description, Service.description, trgm=trgm))
+        .order_by(score.desc(), Service.order)
+        .limit(min(limit, ADMIN_SEARCH_MAX))
+    )
+    return [row[0] for row in result]
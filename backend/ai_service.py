@@ -1,10 +1,37 @@
 import httpx
 import os
-from typing import List, Dict, Any
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 import json
 
+from upstream_http import upstream_http
+from llm_scheduler import (
+    llm_scheduler, estimate_tokens, LLMBackpressureError,
+    PRIORITY_INTERACTIVE, PRIORITY_BATCH
+)
+from model_router import ModelRouter, untimed
+
 OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY')
 OPENROUTER_BASE_URL = 'https://openrouter.ai/api/v1'
+CHAT_MODEL = os.environ.get('CHAT_MODEL', 'anthropic/claude-3.5-sonnet')
+CHAT_SUMMARY_MODEL = os.environ.get('CHAT_SUMMARY_MODEL', 'anthropic/claude-3-haiku')
+# Modelos de respaldo si CHAT_MODEL está lento o caído (en orden de preferencia)
+CHAT_FALLBACK_MODELS = [
+    m.strip() for m in os.environ.get('CHAT_FALLBACK_MODELS', 'anthropic/claude-3-haiku').split(',') if m.strip()
+]
+CHAT_MODELS = [CHAT_MODEL] + [m for m in CHAT_FALLBACK_MODELS if m != CHAT_MODEL]
+CHAT_DEADLINE_SECONDS = float(os.environ.get('CHAT_DEADLINE_SECONDS', '45'))
+
+# Latencia y errores por modelo; la saturación local (back-pressure) no cuenta como falla del modelo
+# Instancia global
+model_router = ModelRouter('backend', ignore_errors=(LLMBackpressureError,))
+
+
+class UpstreamModelError(Exception):
+    """OpenRouter respondió con un estado distinto de 200"""
 
 # Agent Prompts - Mejorados con memoria contextual
 AGENT_PROMPTS = {
@@ -135,22 +162,14 @@ EJEMPLOS:
 Responde siempre en español."""
 }
 
-async def chat_with_claude(
+def build_chat_messages(
     message: str,
     agent_name: str = 'Junior',
     conversation_history: List[Dict[str, str]] = None,
-    is_first_message_today: bool = False
-) -> str:
-    """
-    Chat with Claude 3.5 Sonnet via OpenRouter
-    
-    Args:
-        message: Mensaje del usuario
-        agent_name: Nombre del agente
-        conversation_history: Historial de conversación (últimos 50 mensajes)
-        is_first_message_today: Si es el primer mensaje del día (para saludar)
-    """
-    
+    is_first_message_today: bool = False,
+    context_summary: Optional[str] = None
+) -> List[Dict[str, str]]:
+    """Arma system prompt + historial + mensaje actual para OpenRouter"""
     if conversation_history is None:
         conversation_history = []
     
@@ -162,13 +181,16 @@ async def chat_with_claude(
     else:
         system_prompt += "\n\n[CONTEXTO: El cliente ya interactuó contigo hoy. NO saludes de nuevo, continúa la conversación naturalmente.]"
     
+    if context_summary:
+        system_prompt += f"\n\n[RESUMEN DE CONVERSACIONES ANTERIORES]\n{context_summary}"
+    
     # Build messages
     messages = [
         {'role': 'system', 'content': system_prompt}
     ]
     
-    # Add conversation history (últimos 20 mensajes para mejor contexto)
-    for msg in conversation_history[-20:]:
+    # Add conversation history (ya ajustado al presupuesto de tokens)
+    for msg in conversation_history:
         if msg.get('role') in ['user', 'assistant']:
             messages.append({
                 'role': msg.get('role', 'user'),
@@ -181,8 +203,38 @@ async def chat_with_claude(
         'content': message
     })
     
-    try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
+    return messages
+
+async def chat_with_claude(
+    message: str,
+    agent_name: str = 'Junior',
+    conversation_history: List[Dict[str, str]] = None,
+    is_first_message_today: bool = False,
+    context_summary: Optional[str] = None
+) -> Tuple[str, Optional[str]]:
+    """
+    Chat with Claude 3.5 Sonnet via OpenRouter
+    
+    Retorna (respuesta, modelo que respondió); el modelo es None si ninguno respondió.
+    
+    Args:
+        message: Mensaje del usuario
+        agent_name: Nombre del agente
+        conversation_history: Historial ya recortado al presupuesto de tokens (ChatContextBuilder)
+        is_first_message_today: Si es el primer mensaje del día (para saludar)
+        context_summary: Resumen acumulado de turnos anteriores de la sesión
+    """
+    
+    messages = build_chat_messages(
+        message, agent_name, conversation_history, is_first_message_today, context_summary
+    )
+    
+    estimated = estimate_tokens(*(m['content'] for m in messages), max_tokens=1000)
+    
+    async def send(model: str) -> str:
+        # La espera por el turno del scheduler no cuenta como latencia del modelo
+        async with untimed(llm_scheduler.slot(model, PRIORITY_INTERACTIVE, estimated)) as slot, \
+                upstream_http.session(timeout=CHAT_DEADLINE_SECONDS) as client:
             response = await client.post(
                 f'{OPENROUTER_BASE_URL}/chat/completions',
                 headers={
@@ -192,22 +244,245 @@ async def chat_with_claude(
                     'X-Title': 'GuaraniAppStore Chatbot'
                 },
                 json={
-                    'model': 'anthropic/claude-3.5-sonnet',
-                    'messages': [msg for msg in messages if msg['role'] != 'system'],
+                    'model': model,
+                    'messages': messages,
                     'temperature': 0.7,
                     'max_tokens': 1000
                 }
             )
             
+            if response.status_code != 200:
+                if response.status_code == 429:
+                    slot.rate_limited(response.headers.get('retry-after'))
+                raise UpstreamModelError(f'OpenRouter respondió {response.status_code}')
+            data = response.json()
+            slot.record_usage(data.get('usage'))
+            return data['choices'][0]['message']['content']
+    
+    try:
+        return await model_router.call(CHAT_MODELS, send, CHAT_DEADLINE_SECONDS)
+    except LLMBackpressureError:
+        raise  # El endpoint responde 503 + Retry-After
+    except Exception as e:
+        print(f'Error in chat_with_claude: {e}')
+        return 'Lo siento, hubo un error al procesar tu mensaje. Por favor, intenta nuevamente.', None
+
+class ChatStreamMetrics:
+    """Tiempo hasta el primer token y desenlace de los chats en streaming"""
+    
+    WINDOW = 512
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ttft_ms = deque(maxlen=self.WINDOW)
+        self._duration_ms = deque(maxlen=self.WINDOW)
+        self.started = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+    
+    def record_start(self):
+        with self._lock:
+            self.started += 1
+    
+    def record_first_token(self, ttft_ms: float):
+        with self._lock:
+            self._ttft_ms.append(ttft_ms)
+    
+    def record_end(self, outcome: str, duration_ms: float):
+        with self._lock:
+            if outcome == 'completed':
+                self.completed += 1
+                self._duration_ms.append(duration_ms)
+            elif outcome == 'cancelled':
+                self.cancelled += 1
+            else:
+                self.failed += 1
+    
+    @staticmethod
+    def _percentiles(samples: List[float]) -> Dict[str, float]:
+        if not samples:
+            return {'p50_ms': None, 'p95_ms': None}
+        return {
+            'p50_ms': round(samples[len(samples) // 2], 1),
+            'p95_ms': round(samples[min(int(len(samples) * 0.95), len(samples) - 1)], 1)
+        }
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            ttft = sorted(self._ttft_ms)
+            duration = sorted(self._duration_ms)
+            counters = {
+                'started': self.started,
+                'completed': self.completed,
+                'cancelled': self.cancelled,
+                'failed': self.failed
+            }
+        return {
+            **counters,
+            'time_to_first_token': self._percentiles(ttft),
+            'total_duration': self._percentiles(duration)
+        }
+
+
+chat_stream_metrics = ChatStreamMetrics()
+
+
+async def stream_chat_with_claude(
+    message: str,
+    agent_name: str = 'Junior',
+    conversation_history: List[Dict[str, str]] = None,
+    is_first_message_today: bool = False,
+    context_summary: Optional[str] = None,
+    stats: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[str]:
+    """
+    Versión streaming de chat_with_claude: produce los fragmentos de texto
+    a medida que OpenRouter los envía.
+    
+    Si el consumidor deja de iterar (cliente desconectado), al cerrar el
+    generador se cierra la respuesta HTTP y OpenRouter cancela la generación.
+    
+    Args:
+        stats: Dict opcional donde se deja ttft_ms y duration_ms al terminar
+    """
+    messages = build_chat_messages(
+        message, agent_name, conversation_history, is_first_message_today, context_summary
+    )
+    stats = stats if stats is not None else {}
+    started = time.perf_counter()
+    outcome = 'failed'
+    chat_stream_metrics.record_start()
+    
+    estimated = estimate_tokens(*(m['content'] for m in messages), max_tokens=1000)
+    # Failover sólo antes del primer token: después el cliente ya recibió texto de un modelo
+    models = model_router.order(CHAT_MODELS)
+    
+    try:
+        for index, model in enumerate(models):
+            try:
+                async with llm_scheduler.slot(model, PRIORITY_INTERACTIVE, estimated) as slot, \
+                        upstream_http.session(timeout=httpx.Timeout(60.0, connect=10.0)) as client:
+                    async with client.stream(
+                        'POST',
+                        f'{OPENROUTER_BASE_URL}/chat/completions',
+                        headers={
+                            'Authorization': f'Bearer {OPENROUTER_API_KEY}',
+                            'Content-Type': 'application/json',
+                            'HTTP-Referer': 'https://guaraniappstore.com',
+                            'X-Title': 'GuaraniAppStore Chatbot'
+                        },
+                        json={
+                            'model': model,
+                            'messages': messages,
+                            'temperature': 0.7,
+                            'max_tokens': 1000,
+                            'stream': True
+                        }
+                    ) as response:
+                        if response.status_code != 200:
+                            await response.aread()
+                            if response.status_code == 429:
+                                slot.rate_limited(response.headers.get('retry-after'))
+                            raise UpstreamModelError(f'OpenRouter respondió {response.status_code}')
+                        
+                        async for line in response.aiter_lines():
+                            # Comentarios SSE (": OPENROUTER PROCESSING") y líneas vacías
+                            if not line.startswith('data: '):
+                                continue
+                            payload = line[len('data: '):]
+                            if payload == '[DONE]':
+                                break
+                            
+                            chunk = json.loads(payload)
+                            if chunk.get('error'):
+                                raise UpstreamModelError(chunk['error'].get('message', 'Error en el stream'))
+                            choices = chunk.get('choices') or [{}]
+                            delta = choices[0].get('delta', {}).get('content')
+                            if not delta:
+                                continue
+                            
+                            if 'ttft_ms' not in stats:
+                                stats['ttft_ms'] = round((time.perf_counter() - started) * 1000, 1)
+                                chat_stream_metrics.record_first_token(stats['ttft_ms'])
+                            yield delta
+            except (UpstreamModelError, LLMBackpressureError, httpx.HTTPError) as e:
+                if not isinstance(e, LLMBackpressureError):
+                    model_router.record(model, False)
+                if 'ttft_ms' in stats or index == len(models) - 1:
+                    raise
+                print(f'Stream con {model} falló antes del primer token ({e}), probando {models[index + 1]}')
+                continue
+            
+            # Latencia de streams no comparable con respuestas completas: sólo cuenta el resultado
+            model_router.record(model, True)
+            stats['model'] = model
+            break
+        
+        outcome = 'completed'
+    except (GeneratorExit, asyncio.CancelledError):
+        outcome = 'cancelled'
+        raise
+    finally:
+        stats['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        chat_stream_metrics.record_end(outcome, stats['duration_ms'])
+
+async def summarize_conversation(
+    previous_summary: Optional[str],
+    messages: List[Dict[str, str]],
+    agent_name: str
+) -> Optional[str]:
+    """
+    Actualiza el resumen acumulado de una sesión con turnos que salieron de la ventana
+    
+    Args:
+        previous_summary: Resumen vigente (puede ser None)
+        messages: Turnos nuevos a plegar, en orden cronológico
+        agent_name: Nombre del agente de la sesión
+    
+    Returns:
+        Nuevo resumen o None si falló la generación
+    """
+    transcript = '\n'.join(
+        f"{'Cliente' if m.get('role') == 'user' else agent_name}: {m.get('content', '')}"
+        for m in messages
+    )
+    prompt = f"""Resumen actual de la conversación con el cliente:
+{previous_summary or '(sin resumen previo)'}
+
+Nuevos turnos a incorporar:
+{transcript}
+
+Actualiza el resumen en español, en no más de 200 palabras. Conserva datos del cliente, necesidades, decisiones, servicios discutidos y temas pendientes. Responde sólo con el resumen."""
+
+    try:
+        async with llm_scheduler.slot(CHAT_SUMMARY_MODEL, PRIORITY_BATCH, estimate_tokens(prompt, max_tokens=400)) as slot, \
+                upstream_http.session(timeout=60.0) as client:
+            response = await client.post(
+                f'{OPENROUTER_BASE_URL}/chat/completions',
+                headers={
+                    'Authorization': f'Bearer {OPENROUTER_API_KEY}',
+                    'Content-Type': 'application/json'
+                },
+                json={
+                    'model': CHAT_SUMMARY_MODEL,
+                    'messages': [{'role': 'user', 'content': prompt}],
+                    'temperature': 0.2,
+                    'max_tokens': 400
+                }
+            )
+            
             if response.status_code == 200:
                 data = response.json()
-                return data['choices'][0]['message']['content']
-            else:
-                return f'Error: No pude procesar tu solicitud. Por favor, intenta nuevamente.'
+                slot.record_usage(data.get('usage'))
+                return data['choices'][0]['message']['content'].strip()
+            if response.status_code == 429:
+                slot.rate_limited(response.headers.get('retry-after'))
+            return None
     
     except Exception as e:
-        print(f'Error in chat_with_claude: {e}')
-        return 'Lo siento, hubo un error al procesar tu mensaje. Por favor, intenta nuevamente.'
+        print(f'Error in summarize_conversation: {e}')
+        return None
 
 async def generate_blog_content(topic: str, author: str) -> Dict[str, str]:
     """Generate blog content using Claude"""
@@ -228,8 +503,9 @@ El artículo debe incluir:
 
 Genera el contenido completo."""
 
-    try:
-        async with httpx.AsyncClient(timeout=90.0) as client:
+    async def send(model: str) -> str:
+        async with untimed(llm_scheduler.slot(model, PRIORITY_BATCH, estimate_tokens(prompt, max_tokens=3000))) as slot, \
+                upstream_http.session(timeout=90.0) as client:
             response = await client.post(
                 f'{OPENROUTER_BASE_URL}/chat/completions',
                 headers={
@@ -237,7 +513,7 @@ Genera el contenido completo."""
                     'Content-Type': 'application/json'
                 },
                 json={
-                    'model': 'anthropic/claude-3.5-sonnet',
+                    'model': model,
                     'messages': [
                         {'role': 'user', 'content': prompt}
                     ],
@@ -246,25 +522,27 @@ Genera el contenido completo."""
                 }
             )
             
-            if response.status_code == 200:
-                data = response.json()
-                content = data['choices'][0]['message']['content']
-                
-                # Extract title (first line with #)
-                lines = content.split('\n')
-                title = lines[0].replace('#', '').strip()
-                
-                return {
-                    'title': title,
-                    'content': content,
-                    'excerpt': lines[2] if len(lines) > 2 else ''
-                }
-            else:
-                return {
-                    'title': f'Error generando contenido',
-                    'content': '',
-                    'excerpt': ''
-                }
+            if response.status_code != 200:
+                if response.status_code == 429:
+                    slot.rate_limited(response.headers.get('retry-after'))
+                raise UpstreamModelError(f'OpenRouter respondió {response.status_code}')
+            data = response.json()
+            slot.record_usage(data.get('usage'))
+            return data['choices'][0]['message']['content']
+
+    try:
+        # Tarea batch: failover sin hedging (no vale la pena duplicar 3000 tokens)
+        content, _ = await model_router.call(CHAT_MODELS, send, deadline=180.0, hedge=False)
+        
+        # Extract title (first line with #)
+        lines = content.split('\n')
+        title = lines[0].replace('#', '').strip()
+        
+        return {
+            'title': title,
+            'content': content,
+            'excerpt': lines[2] if len(lines) > 2 else ''
+        }
     
     except Exception as e:
         print(f'Error in generate_blog_content: {e}')
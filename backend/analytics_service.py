@@ -0,0 +1,233 @@
+"""
+GuaraniAppStore V2.5 Pro - Admin Analytics
+Ingresos y usuarios por día y servicios populares para /api/admin/analytics.
+
+Los días anteriores a hoy se leen del rollup diario (analytics_daily y
+analytics_daily_services), que el scheduler mantiene de forma incremental;
+el día en curso se calcula en vivo. Si el rollup aún no se construyó, toda la
+ventana se calcula en vivo con date_trunc.
+
+Uso manual:
+    python analytics_service.py              # refresco incremental
+    python analytics_service.py --rebuild    # reconstruir el rollup completo
+"""
+
+import os
+import asyncio
+import logging
+from datetime import datetime, date, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, func, text, bindparam, literal_column, Date
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from models import User, Order, Service, AnalyticsDaily, AnalyticsDailyService, AnalyticsRollupState
+from database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_ROLLUP_MINUTES = int(os.environ.get('ANALYTICS_ROLLUP_MINUTES', '10'))
+# Solapamiento de la marca de agua para no perder transacciones que confirmaron tarde
+ANALYTICS_ROLLUP_OVERLAP_SECONDS = int(os.environ.get('ANALYTICS_ROLLUP_OVERLAP_SECONDS', '120'))
+
+ROLLUP_STATE_NAME = 'daily'
+TOP_SERVICES = 5
+
+_DAYS_PARAM = bindparam('days', type_=ARRAY(Date))
+
+# Días con cambios desde la marca de agua (órdenes modificadas o usuarios nuevos)
+DIRTY_DAYS_SQL = text(
+    "SELECT DISTINCT created_at::date FROM orders WHERE updated_at >= :since "
+    "UNION SELECT DISTINCT created_at::date FROM users WHERE created_at >= :since"
+)
+
+ALL_DAYS_SQL = text(
+    "SELECT DISTINCT created_at::date FROM orders WHERE created_at IS NOT NULL "
+    "UNION SELECT DISTINCT created_at::date FROM users WHERE created_at IS NOT NULL"
+)
+
+UPSERT_DAILY_SQL = text(
+    "INSERT INTO analytics_daily (day, revenue, completed_orders, new_users, updated_at) "
+    "SELECT d.day, coalesce(o.revenue, 0), coalesce(o.orders, 0), coalesce(u.users, 0), now() "
+    "FROM unnest(:days) AS d(day) "
+    "LEFT JOIN ("
+    "  SELECT created_at::date AS day, sum(final_price) AS revenue, count(*) AS orders FROM orders "
+    "  WHERE payment_status = 'completed' AND created_at >= :first_day AND created_at < :after_last_day "
+    "  AND created_at::date = ANY(:days) GROUP BY 1"
+    ") o USING (day) "
+    "LEFT JOIN ("
+    "  SELECT created_at::date AS day, count(*) AS users FROM users "
+    "  WHERE created_at >= :first_day AND created_at < :after_last_day "
+    "  AND created_at::date = ANY(:days) GROUP BY 1"
+    ") u USING (day) "
+    "ON CONFLICT (day) DO UPDATE SET revenue = EXCLUDED.revenue, "
+    "completed_orders = EXCLUDED.completed_orders, new_users = EXCLUDED.new_users, updated_at = now()"
+).bindparams(_DAYS_PARAM)
+
+DELETE_DAILY_SERVICES_SQL = text(
+    "DELETE FROM analytics_daily_services WHERE day = ANY(:days)"
+).bindparams(_DAYS_PARAM)
+
+INSERT_DAILY_SERVICES_SQL = text(
+    "INSERT INTO analytics_daily_services (day, service_id, orders, revenue) "
+    "SELECT created_at::date, service_id, count(*), sum(final_price) FROM orders "
+    "WHERE payment_status = 'completed' AND created_at >= :first_day AND created_at < :after_last_day "
+    "AND created_at::date = ANY(:days) GROUP BY 1, 2"
+).bindparams(_DAYS_PARAM)
+
+
+# Literal (no parámetro) para que el GROUP BY coincida con la expresión del SELECT
+_DAY = literal_column("'day'")
+
+
+def _day_key(value) -> str:
+    return value.strftime('%Y-%m-%d')
+
+
+class AnalyticsService:
+    """Analítica del panel admin con agregados SQL y rollup diario incremental"""
+
+    def __init__(self):
+        self.last_refresh: Optional[Dict[str, Any]] = None
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+
+    async def _live(self, db, start: datetime) -> Dict[str, Any]:
+        """Agregados directos sobre orders/users desde start"""
+        day = func.date_trunc(_DAY, Order.created_at).label('day')
+        revenue = await db.execute(
+            select(day, func.sum(Order.final_price))
+            .where(Order.created_at >= start, Order.payment_status == 'completed')
+            .group_by(day)
+            .order_by(day)
+        )
+        user_day = func.date_trunc(_DAY, User.created_at).label('day')
+        users = await db.execute(
+            select(user_day, func.count())
+            .where(User.created_at >= start)
+            .group_by(user_day)
+            .order_by(user_day)
+        )
+        services = await db.execute(
+            select(Service.id, Service.name, func.count(Order.id))
+            .join(Order, Order.service_id == Service.id)
+            .where(Order.created_at >= start, Order.payment_status == 'completed')
+            .group_by(Service.id, Service.name)
+        )
+        return {
+            'revenue_by_date': {_day_key(d): float(total) for d, total in revenue},
+            'users_by_date': {_day_key(d): count for d, count in users},
+            'services': {service_id: [name, count] for service_id, name, count in services}
+        }
+
+    async def _from_rollup(self, db, first_day: date, today: date) -> Dict[str, Any]:
+        daily = await db.execute(
+            select(AnalyticsDaily.day, AnalyticsDaily.revenue, AnalyticsDaily.new_users)
+            .where(AnalyticsDaily.day >= first_day, AnalyticsDaily.day < today)
+            .order_by(AnalyticsDaily.day)
+        )
+        revenue_by_date: Dict[str, float] = {}
+        users_by_date: Dict[str, int] = {}
+        for day, revenue, new_users in daily:
+            if revenue:
+                revenue_by_date[_day_key(day)] = revenue
+            if new_users:
+                users_by_date[_day_key(day)] = new_users
+
+        services = await db.execute(
+            select(Service.id, Service.name, func.sum(AnalyticsDailyService.orders))
+            .join(AnalyticsDailyService, AnalyticsDailyService.service_id == Service.id)
+            .where(AnalyticsDailyService.day >= first_day, AnalyticsDailyService.day < today)
+            .group_by(Service.id, Service.name)
+        )
+        return {
+            'revenue_by_date': revenue_by_date,
+            'users_by_date': users_by_date,
+            'services': {service_id: [name, int(count)] for service_id, name, count in services}
+        }
+
+    async def admin_analytics(self, db, days: int = 30) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        today = now.date()
+        first_day = (now - timedelta(days=days)).date()
+
+        rollup_ready = await db.scalar(
+            select(AnalyticsRollupState.watermark).where(AnalyticsRollupState.name == ROLLUP_STATE_NAME)
+        )
+        if rollup_ready is not None:
+            data = await self._from_rollup(db, first_day, today)
+            current = await self._live(db, datetime.combine(today, datetime.min.time()))
+            data['revenue_by_date'].update(current['revenue_by_date'])
+            data['users_by_date'].update(current['users_by_date'])
+            for service_id, (name, count) in current['services'].items():
+                data['services'].setdefault(service_id, [name, 0])[1] += count
+        else:
+            data = await self._live(db, datetime.combine(first_day, datetime.min.time()))
+
+        ranking = sorted(data['services'].values(), key=lambda item: item[1], reverse=True)[:TOP_SERVICES]
+        return {
+            'revenue_by_date': data['revenue_by_date'],
+            'users_by_date': data['users_by_date'],
+            'popular_services': [{'service': name, 'orders': count} for name, count in ranking]
+        }
+
+    # ------------------------------------------------------------------
+    # Mantenimiento del rollup
+    # ------------------------------------------------------------------
+
+    async def _recompute_days(self, db, days: List[date]):
+        if not days:
+            return
+        params = {
+            'days': days,
+            'first_day': datetime.combine(min(days), datetime.min.time()),
+            'after_last_day': datetime.combine(max(days) + timedelta(days=1), datetime.min.time())
+        }
+        await db.execute(UPSERT_DAILY_SQL, params)
+        await db.execute(DELETE_DAILY_SERVICES_SQL, {'days': days})
+        await db.execute(INSERT_DAILY_SERVICES_SQL, params)
+
+    async def refresh_rollup(self, rebuild: bool = False) -> Dict[str, Any]:
+        """
+        Recalcular sólo los días con órdenes modificadas o usuarios nuevos
+        desde la última marca de agua (todos los días si rebuild o si es la
+        primera ejecución).
+        """
+        started = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            state = await db.get(AnalyticsRollupState, ROLLUP_STATE_NAME)
+            if state is None or rebuild:
+                days = [row[0] for row in await db.execute(ALL_DAYS_SQL)]
+            else:
+                days = [row[0] for row in await db.execute(DIRTY_DAYS_SQL, {'since': state.watermark})]
+
+            await self._recompute_days(db, sorted(days))
+
+            watermark = started - timedelta(seconds=ANALYTICS_ROLLUP_OVERLAP_SECONDS)
+            if state is None:
+                db.add(AnalyticsRollupState(name=ROLLUP_STATE_NAME, watermark=watermark))
+            else:
+                state.watermark = watermark
+            await db.commit()
+
+        self.last_refresh = {
+            'started_at': started.isoformat(),
+            'duration_seconds': round((datetime.utcnow() - started).total_seconds(), 2),
+            'days_recomputed': len(days),
+            'full_rebuild': state is None or rebuild
+        }
+        logger.info(f"Rollup de analítica: {self.last_refresh}")
+        return self.last_refresh
+
+
+# Instancia global
+analytics_service = AnalyticsService()
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    print(asyncio.run(analytics_service.refresh_rollup(rebuild='--rebuild' in sys.argv)))
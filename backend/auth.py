@@ -3,12 +3,17 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
 import os
+import time
+import asyncio
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, inspect
 from models import User, UserRole
 from database import get_db
 from database_mongo import users_collection
+from datastore_router import datastore_router
 import pyotp
 import secrets
 import logging
@@ -26,6 +31,12 @@ JWT_EXPIRATION_HOURS = int(os.environ.get('JWT_EXPIRATION_HOURS', '720'))
 # Security
 security = HTTPBearer()
 
+# Cache de usuarios autenticados (get_current_user)
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', '10000'))
+
+_USER_COLUMNS = [attr.key for attr in inspect(User).column_attrs]
+
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
@@ -43,6 +54,14 @@ def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
+def create_user_token(user_id: str, role, is_active: bool = True) -> str:
+    """Token de sesión con rol y estado como claims firmados"""
+    return create_access_token({
+        'sub': user_id,
+        'role': role.value if isinstance(role, UserRole) else role,
+        'active': bool(is_active)
+    })
+
 def decode_access_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
@@ -50,93 +69,218 @@ def decode_access_token(token: str) -> dict:
     except JWTError:
         return None
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_db)
-) -> User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail='Could not validate credentials',
-        headers={'WWW-Authenticate': 'Bearer'},
-    )
+# Resultado de una carga compartida cuya request líder se canceló
+_LOAD_CANCELLED = object()
+
+
+class UserCache:
+    """
+    Cache en proceso de usuarios autenticados, por sub del JWT (LRU acotado, TTL corto).
+
+    Guarda los valores de las columnas y cada hit construye un User nuevo (no
+    adjunto a ninguna sesión): los endpoints que modifican al usuario deben
+    volver a leerlo con su sesión. Las búsquedas concurrentes del mismo usuario
+    (el panel admin lanza muchas en paralelo) comparten una sola consulta.
+    En otros workers los cambios se ven al vencer el TTL.
+    """
     
-    token = credentials.credentials
-    payload = decode_access_token(token)
+    def __init__(self, max_entries: int = USER_CACHE_MAX_ENTRIES, ttl_seconds: float = USER_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: 'OrderedDict[str, Tuple[float, Dict[str, Any]]]' = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Se incrementa en cada invalidación: descarta cargas que empezaron antes
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
     
-    if payload is None:
-        raise credentials_exception
+    @staticmethod
+    def _snapshot(user: User) -> Dict[str, Any]:
+        return {key: getattr(user, key) for key in _USER_COLUMNS}
     
-    user_id: str = payload.get('sub')
-    if user_id is None:
-        raise credentials_exception
+    def get(self, user_id: str) -> Optional[User]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(user_id, None)
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return User(**entry[1])
+    
+    def put(self, user_id: str, user: User, epoch: int):
+        if self.ttl_seconds <= 0 or epoch != self._epoch:
+            return
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, self._snapshot(user))
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
     
+    async def load(self, user_id: str, loader: Callable[[], Awaitable[Optional[User]]]) -> Optional[User]:
+        """Cargar con loader() una sola vez por usuario aunque haya requests concurrentes"""
+        while True:
+            cached = self.get(user_id)
+            if cached is not None:
+                return cached
+            
+            pending = self._inflight.get(user_id)
+            if pending is None:
+                break
+            values = await asyncio.shield(pending)
+            if values is _LOAD_CANCELLED:
+                # La request que cargaba se canceló: reintentar con el loader propio
+                continue
+            return User(**values) if values is not None else None
+        
+        self.misses += 1
+        epoch = self._epoch
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[user_id] = future
+        try:
+            user = await loader()
+        except asyncio.CancelledError:
+            # La cancelación es de esta request (p.ej. el cliente se desconectó), no de las que esperan
+            future.set_result(_LOAD_CANCELLED)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Evita "exception was never retrieved" si nadie esperaba
+            raise
+        else:
+            future.set_result(self._snapshot(user) if user is not None else None)
+            if user is not None:
+                self.put(user_id, user, epoch)
+            return user
+        finally:
+            if self._inflight.get(user_id) is future:
+                del self._inflight[user_id]
+    
+    def invalidate(self, user_id: str):
+        """Llamar después de cambiar rol, estado, perfil, contraseña o 2FA del usuario"""
+        self._epoch += 1
+        self.invalidations += 1
+        self._entries.pop(user_id, None)
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'invalidations': self.invalidations
+        }
+
+
+# Instancia global
+user_cache = UserCache()
+
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail='Could not validate credentials',
+    headers={'WWW-Authenticate': 'Bearer'},
+)
+
+def _token_payload(credentials: HTTPAuthorizationCredentials) -> dict:
+    payload = decode_access_token(credentials.credentials)
+    if payload is None or payload.get('sub') is None:
+        raise credentials_exception
+    return payload
+
+async def _load_user(user_id: str, db: AsyncSession) -> Optional[User]:
     # Try PostgreSQL first
     try:
+        datastore_router.ensure_postgres()
         result = await db.execute(select(User).filter(User.id == user_id))
         user = result.scalar_one_or_none()
-        
-        if user is None:
-            raise credentials_exception
-        
-        if not user.is_active:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail='User account is inactive'
-            )
-        
-        return user
+        if user is not None:
+            return user
         
     except Exception as e:
-        # Fallback to MongoDB
+        datastore_router.record_failure(e)
         logger.warning(f"PostgreSQL not available for auth, using MongoDB fallback")
-        
-        # Try to find by string ID first, then by ObjectId
-        from bson import ObjectId
-        
-        user_data = await users_collection.find_one({'id': user_id})
-        if user_data is None:
-            # Try with _id as ObjectId
-            try:
-                user_data = await users_collection.find_one({'_id': ObjectId(user_id)})
-            except:
-                pass
-        
-        if user_data is None:
-            raise credentials_exception
-        
-        # Convert _id to string for ID
-        mongo_user_id = str(user_data.get('_id', user_data.get('id', user_id)))
-        
-        # Create User object from MongoDB data
-        user = User(
-            id=mongo_user_id,
-            email=user_data.get('email'),
-            full_name=user_data.get('name', user_data.get('full_name', 'User')),
-            password_hash=user_data.get('password', user_data.get('password_hash', '')),
-            is_active=user_data.get('is_active', True),
-            role=UserRole.ADMIN if user_data.get('is_admin') else UserRole.USER,
-            created_at=user_data.get('created_at', datetime.utcnow()),
-            country=user_data.get('country', 'Paraguay'),
-            timezone=user_data.get('timezone', 'America/Asuncion'),
-            is_verified=user_data.get('is_verified', True),
-            two_factor_enabled=user_data.get('two_factor_enabled', False),
-            two_factor_secret=user_data.get('two_factor_secret')
-        )
-        
-        if not user.is_active:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail='User account is inactive'
-            )
-        
-        return user
+    
+    # Fallback to MongoDB (también usuarios registrados en modo MongoDB)
+    # Try to find by string ID first, then by ObjectId
+    from bson import ObjectId
+    
+    user_data = await users_collection.find_one({'id': user_id})
+    if user_data is None:
+        # Try with _id as ObjectId
+        try:
+            user_data = await users_collection.find_one({'_id': ObjectId(user_id)})
+        except:
+            pass
+    
+    if user_data is None:
+        return None
+    
+    # Convert _id to string for ID
+    mongo_user_id = str(user_data.get('_id', user_data.get('id', user_id)))
+    
+    # Create User object from MongoDB data
+    return User(
+        id=mongo_user_id,
+        email=user_data.get('email'),
+        full_name=user_data.get('name', user_data.get('full_name', 'User')),
+        password_hash=user_data.get('password', user_data.get('password_hash', '')),
+        is_active=user_data.get('is_active', True),
+        role=UserRole.ADMIN if user_data.get('is_admin') else UserRole.USER,
+        created_at=user_data.get('created_at', datetime.utcnow()),
+        country=user_data.get('country', 'Paraguay'),
+        timezone=user_data.get('timezone', 'America/Asuncion'),
+        is_verified=user_data.get('is_verified', True),
+        two_factor_enabled=user_data.get('two_factor_enabled', False),
+        two_factor_secret=user_data.get('two_factor_secret')
+    )
+
+async def _user_for_token(payload: dict, db: AsyncSession) -> User:
+    inactive_exception = HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail='User account is inactive'
+    )
+    if payload.get('active') is False:
+        raise inactive_exception
+    
+    user_id: str = payload['sub']
+    user = await user_cache.load(user_id, lambda: _load_user(user_id, db))
+    if user is None:
+        raise credentials_exception
+    
+    if not user.is_active:
+        raise inactive_exception
+    
+    return user
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    return await _user_for_token(_token_payload(credentials), db)
 
-async def get_current_admin_user(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_admin_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """
+    El claim role (firmado) rechaza a los no-admin sin consultar la base; para
+    los admin se verifica además el rol vigente del usuario, así una degradación
+    aplica sin esperar a que venza el token. Un usuario promovido a admin
+    necesita un token nuevo (volver a iniciar sesión).
+    """
+    permissions_exception = HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail='Not enough permissions'
+    )
+    payload = _token_payload(credentials)
+    if payload.get('role', UserRole.ADMIN.value) != UserRole.ADMIN.value:
+        raise permissions_exception
+    
+    current_user = await _user_for_token(payload, db)
     if current_user.role != UserRole.ADMIN:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail='Not enough permissions'
-        )
+        raise permissions_exception
     return current_user
 
 def generate_2fa_secret() -> str:
@@ -5,14 +5,17 @@ Incluye generación programada (7/semana) y bajo demanda (admin panel)
 """
 
 import os
-import httpx
 import json
 import re
 from datetime import datetime, timezone
-from typing import Dict, List, Optional
-from sqlalchemy.orm import Session
+from typing import Awaitable, Callable, Dict, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import BlogPost
-from database import get_db
+from upstream_http import upstream_http
+from llm_scheduler import llm_scheduler, estimate_tokens, PRIORITY_BATCH
+
+BLOG_TEXT_MODEL = "tngtech/deepseek-r1t2-chimera:free"
+BLOG_IMAGE_MODEL = "openai/gpt-5-image-mini"
 
 # OpenRouter API Configuration
 OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY')
@@ -251,7 +254,8 @@ IMPORTANTE: NO incluir meta-información. Solo el contenido del artículo con fo
 """
         
         try:
-            async with httpx.AsyncClient(timeout=120.0) as client:
+            async with llm_scheduler.slot(BLOG_TEXT_MODEL, PRIORITY_BATCH, estimate_tokens(prompt, max_tokens=4000)) as slot, \
+                    upstream_http.session(timeout=120.0) as client:
                 response = await client.post(
                     f"{OPENROUTER_BASE_URL}/chat/completions",
                     headers={
@@ -261,7 +265,7 @@ IMPORTANTE: NO incluir meta-información. Solo el contenido del artículo con fo
                         "X-Title": "GuaraniAppStore Blog"
                     },
                     json={
-                        "model": "tngtech/deepseek-r1t2-chimera:free",
+                        "model": BLOG_TEXT_MODEL,
                         "messages": [
                             {"role": "user", "content": prompt}
                         ],
@@ -269,8 +273,11 @@ IMPORTANTE: NO incluir meta-información. Solo el contenido del artículo con fo
                         "temperature": 0.7
                     }
                 )
+                if response.status_code == 429:
+                    slot.rate_limited(response.headers.get('retry-after'))
                 response.raise_for_status()
                 result = response.json()
+                slot.record_usage(result.get('usage'))
                 
                 content = result['choices'][0]['message']['content']
                 
@@ -349,7 +356,8 @@ La imagen debe ILUSTRAR VISUALMENTE los conceptos principales del artículo."""
         
         try:
             # Usar Google Gemini 2.5 Flash Image via OpenRouter para generar imágenes
-            async with httpx.AsyncClient(timeout=120.0) as client:
+            async with llm_scheduler.slot(BLOG_IMAGE_MODEL, PRIORITY_BATCH, estimate_tokens(image_prompt)) as slot, \
+                    upstream_http.session(timeout=120.0) as client:
                 # Intentar con ambas API keys
                 api_keys_to_try = [self.image_api_key, self.text_api_key]
                 last_error = None
@@ -368,7 +376,7 @@ La imagen debe ILUSTRAR VISUALMENTE los conceptos principales del artículo."""
                                 "X-Title": "GuaraniAppStore Blog"
                             },
                             json={
-                                "model": "openai/gpt-5-image-mini",
+                                "model": BLOG_IMAGE_MODEL,
                                 "messages": [
                                     {
                                         "role": "user",
@@ -382,6 +390,8 @@ La imagen debe ILUSTRAR VISUALMENTE los conceptos principales del artículo."""
                             result = response.json()
                             break
                         else:
+                            if response.status_code == 429:
+                                slot.rate_limited(response.headers.get('retry-after'))
                             last_error = f"HTTP {response.status_code}: {response.text[:200]}"
                             continue
                             
@@ -424,7 +434,6 @@ La imagen debe ILUSTRAR VISUALMENTE los conceptos principales del artículo."""
             
             # Usar imágenes profesionales de Unsplash relacionadas con tecnología
             # Rotación de imágenes según día para variedad
-            from datetime import datetime
             day = datetime.now().day
             
             # Colección de imágenes profesionales de tecnología/negocios
@@ -448,13 +457,13 @@ La imagen debe ILUSTRAR VISUALMENTE los conceptos principales del artículo."""
                 "image_prompt": image_prompt
             }
     
-    async def generate_scheduled_article(self, day_of_week: int, db: Session) -> Optional[BlogPost]:
+    async def generate_scheduled_article(self, day_of_week: int, db: AsyncSession) -> Optional[BlogPost]:
         """
         Genera un artículo programado para un día específico
         
         Args:
             day_of_week: Día de la semana (0=Monday, 6=Sunday)
-            db: Database session
+            db: Sesión async (sólo se usa una conexión al guardar el artículo)
         """
         # Obtener agente para este día
         agent_id = None
@@ -507,7 +516,6 @@ La imagen debe ILUSTRAR VISUALMENTE los conceptos principales del artículo."""
         content_with_image = article_data['content']
         if image_data.get('image_url'):
             # Obtener el día del mes para determinar float left/right
-            from datetime import datetime
             day = datetime.now().day
             float_direction = 'right' if day % 2 == 0 else 'left'
             
@@ -583,8 +591,8 @@ La imagen debe ILUSTRAR VISUALMENTE los conceptos principales del artículo."""
         )
         
         db.add(blog_post)
-        db.commit()
-        db.refresh(blog_post)
+        await db.commit()
+        await db.refresh(blog_post)
         
         print(f"✅ Artículo programado generado: {blog_post.title} por {agent['name']}")
         return blog_post
@@ -597,7 +605,8 @@ La imagen debe ILUSTRAR VISUALMENTE los conceptos principales del artículo."""
         tone: str,
         length: str,
         include_faq: bool,
-        db: Session
+        db: AsyncSession,
+        progress: Optional[Callable[[int, str], Awaitable[None]]] = None
     ) -> Optional[BlogPost]:
         """
         Genera un artículo personalizado bajo demanda (Panel Admin)
@@ -609,7 +618,8 @@ La imagen debe ILUSTRAR VISUALMENTE los conceptos principales del artículo."""
             tone: Tono del artículo
             length: Longitud del artículo
             include_faq: Incluir FAQ
-            db: Database session
+            db: Sesión async (sólo se usa una conexión al guardar el artículo)
+            progress: Callback opcional progress(porcentaje, mensaje) (p.ej. JobContext.progress)
         """
         # Detectar agente si no se especifica
         if agent_id is None:
@@ -617,6 +627,9 @@ La imagen debe ILUSTRAR VISUALMENTE los conceptos principales del artículo."""
         
         agent = AGENTS[agent_id]
         
+        if progress:
+            await progress(10, 'Generando texto del artículo')
+        
         # Generar artículo
         article_data = await self.generate_article_content(
             topic=search_query,
@@ -631,6 +644,9 @@ La imagen debe ILUSTRAR VISUALMENTE los conceptos principales del artículo."""
             print(f"Error generando artículo: {article_data.get('error')}")
             return None
         
+        if progress:
+            await progress(60, 'Generando imagen')
+        
         # Generar imagen basada en el contenido completo
         image_data = await self.generate_image(
             article_content=article_data['content'],
@@ -641,7 +657,6 @@ La imagen debe ILUSTRAR VISUALMENTE los conceptos principales del artículo."""
         content_with_image = article_data['content']
         if image_data.get('image_url'):
             # Obtener el día del mes para determinar float left/right
-            from datetime import datetime
             day = datetime.now().day
             float_direction = 'right' if day % 2 == 0 else 'left'
             
@@ -693,6 +708,9 @@ La imagen debe ILUSTRAR VISUALMENTE los conceptos principales del artículo."""
         # Agregar promoción de Bitfinex al final
         full_content = content_with_image + author_signature + BITFINEX_PROMO
         
+        if progress:
+            await progress(90, 'Guardando artículo')
+        
         # Crear BlogPost (en cola de aprobación)
         blog_post = BlogPost(
             title=article_data['title'],
@@ -720,8 +738,8 @@ La imagen debe ILUSTRAR VISUALMENTE los conceptos principales del artículo."""
         )
         
         db.add(blog_post)
-        db.commit()
-        db.refresh(blog_post)
+        await db.commit()
+        await db.refresh(blog_post)
         
         print(f"✅ Artículo bajo demanda generado (en cola): {blog_post.title} por {agent['name']}")
         return blog_post
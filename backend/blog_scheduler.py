@@ -5,13 +5,17 @@ Genera 7 artículos por semana:
 - Domingo: CEO
 
 Usa APScheduler para programación automática
+También ejecuta la retención diaria de mensajes de chat (02:00 AM)
+y sincroniza la salud de modelos LLM con el watcher (cada minuto)
 """
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from datetime import datetime
 from blog_generator_service import blog_generator
-from database import SessionLocal
+from database import AsyncSessionLocal
+from chat_retention import chat_retention_engine
 import logging
 
 # Configurar logging
@@ -27,7 +31,7 @@ async def generate_daily_article():
     Genera el artículo del día según el día de la semana
     Ejecutado automáticamente cada día a las 08:00 AM
     """
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         # Obtener día de la semana (0=Monday, 6=Sunday)
         day_of_week = datetime.now().weekday()
@@ -51,7 +55,64 @@ async def generate_daily_article():
     except Exception as e:
         logger.error(f"❌ Error en generación de artículo diario: {str(e)}")
     finally:
-        db.close()
+        await db.close()
+
+
+async def run_chat_retention():
+    """
+    Retención de mensajes de chat (30 días)
+    Ejecutado automáticamente cada día a las 02:00 AM
+    """
+    try:
+        from chat_memory_service import chat_memory_service
+        
+        result = await chat_retention_engine.run()
+        chat_memory_service.hot_cache.clear()
+        logger.info(
+            f"🧹 Retención de chat: {result['messages_deleted']} mensajes eliminados, "
+            f"{len(result['partitions_dropped'])} particiones eliminadas, "
+            f"{result['sessions_deactivated']} sesiones desactivadas"
+        )
+    except Exception as e:
+        logger.error(f"❌ Error en retención de chat: {str(e)}")
+
+
+async def sync_model_health():
+    """
+    Comparte con el watcher la salud de los modelos de chat
+    Ejecutado automáticamente cada minuto
+    """
+    from ai_service import model_router
+    from database_mongo import db as mongo_db
+    from model_router import MODEL_HEALTH_COLLECTION
+    
+    await model_router.sync_health(mongo_db[MODEL_HEALTH_COLLECTION])
+
+
+async def refresh_admin_stats_summary():
+    """
+    Refresca la vista materializada de totales de órdenes
+    Ejecutado cada ADMIN_STATS_REFRESH_MINUTES (si ADMIN_STATS_MATERIALIZED=true)
+    """
+    from stats_service import dashboard_stats
+    
+    try:
+        await dashboard_stats.refresh_summary()
+    except Exception as e:
+        logger.error(f"❌ Error refrescando resumen de estadísticas: {str(e)}")
+
+
+async def refresh_analytics_rollup():
+    """
+    Actualiza el rollup diario de analítica (sólo días con cambios)
+    Ejecutado cada ANALYTICS_ROLLUP_MINUTES
+    """
+    from analytics_service import analytics_service
+    
+    try:
+        await analytics_service.refresh_rollup()
+    except Exception as e:
+        logger.error(f"❌ Error actualizando rollup de analítica: {str(e)}")
 
 
 def start_blog_scheduler():
@@ -73,11 +134,63 @@ def start_blog_scheduler():
             replace_existing=True
         )
         
+        # Retención diaria de mensajes de chat a las 02:00 AM
+        scheduler.add_job(
+            run_chat_retention,
+            trigger=CronTrigger(
+                hour=2,
+                minute=0,
+                timezone='America/Asuncion'
+            ),
+            id='daily_chat_retention',
+            name='Retención de mensajes de chat',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+        
+        # Salud de modelos compartida con el watcher (colección model_health)
+        scheduler.add_job(
+            sync_model_health,
+            trigger=IntervalTrigger(seconds=60),
+            id='model_health_sync',
+            name='Sincronizar salud de modelos LLM',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+        
+        # Rollup diario de /api/admin/analytics
+        from analytics_service import ANALYTICS_ROLLUP_MINUTES
+        scheduler.add_job(
+            refresh_analytics_rollup,
+            trigger=IntervalTrigger(minutes=ANALYTICS_ROLLUP_MINUTES),
+            id='analytics_rollup_refresh',
+            name='Actualizar rollup de analítica',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+            next_run_time=datetime.now()
+        )
+        
+        from stats_service import dashboard_stats, ADMIN_STATS_REFRESH_MINUTES
+        if dashboard_stats.materialized:
+            scheduler.add_job(
+                refresh_admin_stats_summary,
+                trigger=IntervalTrigger(minutes=ADMIN_STATS_REFRESH_MINUTES),
+                id='admin_stats_summary_refresh',
+                name='Refrescar resumen de estadísticas',
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True
+            )
+        
         logger.info("📅 Blog Scheduler iniciado")
         logger.info("   - Generación diaria programada: 08:00 AM (Paraguay)")
         logger.info("   - Frecuencia: 7 artículos por semana")
         logger.info("   - Lun-Sáb: Agentes especializados")
         logger.info("   - Domingo: CEO")
+        logger.info("   - Retención de chat programada: 02:00 AM (Paraguay)")
         
         # Iniciar scheduler
         scheduler.start()
@@ -117,7 +230,7 @@ async def test_generate_article(day_of_week: int = None):
     Genera un artículo de prueba para un día específico
     Útil para testing sin esperar al scheduler
     """
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         if day_of_week is None:
             day_of_week = datetime.now().weekday()
@@ -140,7 +253,7 @@ async def test_generate_article(day_of_week: int = None):
         logger.error(f"❌ TEST: Error: {str(e)}")
         return None
     finally:
-        db.close()
+        await db.close()
 
 
 if __name__ == "__main__":
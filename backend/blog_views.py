@@ -0,0 +1,205 @@
+"""
+GuaraniAppStore V2.5 Pro - Blog Views
+Contador de vistas del blog con escritura diferida y cache de lectura de artículos.
+
+GET /api/blog/posts/{slug} ya no escribe en cada vista: las vistas se suman en
+memoria y se vuelcan cada BLOG_VIEWS_FLUSH_SECONDS con un único UPDATE por
+lote (views = views + n). El apagado ordenado vuelca lo pendiente; ante un
+crash se pierden como máximo las vistas de un intervalo.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import text, bindparam, String, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from database import AsyncSessionLocal
+from schemas import BlogPostResponse
+
+logger = logging.getLogger(__name__)
+
+BLOG_VIEWS_FLUSH_SECONDS = float(os.environ.get('BLOG_VIEWS_FLUSH_SECONDS', '10'))
+BLOG_POST_CACHE_SECONDS = float(os.environ.get('BLOG_POST_CACHE_SECONDS', '300'))
+BLOG_POST_CACHE_MAX_ENTRIES = int(os.environ.get('BLOG_POST_CACHE_MAX_ENTRIES', '500'))
+
+# Ids ordenados: los workers toman los locks de fila en el mismo orden
+FLUSH_VIEWS_SQL = text(
+    "UPDATE blog_posts AS p SET views = coalesce(p.views, 0) + v.n "
+    "FROM unnest(:ids, :counts) AS v(id, n) WHERE p.id = v.id"
+).bindparams(
+    bindparam('ids', type_=ARRAY(String)),
+    bindparam('counts', type_=ARRAY(Integer))
+)
+
+
+class BlogViewBuffer:
+    """Vistas pendientes por post_id, volcadas en lote por un worker en segundo plano"""
+
+    def __init__(self, interval_seconds: float = BLOG_VIEWS_FLUSH_SECONDS):
+        self.interval_seconds = interval_seconds
+        self._pending: Dict[str, int] = {}
+        self._worker: Optional[asyncio.Task] = None
+        self.flushed_views = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    def record(self, post_id: str, count: int = 1):
+        self._pending[post_id] = self._pending.get(post_id, 0) + count
+
+    def pending_for(self, post_id: str) -> int:
+        return self._pending.get(post_id, 0)
+
+    async def flush(self) -> int:
+        """Volcar las vistas pendientes; si falla, se reintentan en el próximo ciclo"""
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        ids = sorted(batch)
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(FLUSH_VIEWS_SQL, {'ids': ids, 'counts': [batch[i] for i in ids]})
+                await db.commit()
+        except Exception as e:
+            self.failed_flushes += 1
+            for post_id, count in batch.items():
+                self.record(post_id, count)
+            logger.warning(f"No se pudieron volcar {sum(batch.values())} vistas del blog: {str(e)}")
+            return 0
+        self.flushes += 1
+        self.flushed_views += sum(batch.values())
+        return len(ids)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            await self.flush()
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Detener el worker y volcar lo pendiente (apagado ordenado)"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        await self.flush()
+        if self._pending:
+            logger.error(f"Apagado con {sum(self._pending.values())} vistas del blog sin volcar")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'pending_posts': len(self._pending),
+            'pending_views': sum(self._pending.values()),
+            'flushes': self.flushes,
+            'flushed_views': self.flushed_views,
+            'failed_flushes': self.failed_flushes,
+            'interval_seconds': self.interval_seconds
+        }
+
+
+class _CachedPost:
+    __slots__ = ('post', 'base_views', 'seen', 'expires_at')
+
+    def __init__(self, post: BlogPostResponse, base_views: int, expires_at: float):
+        self.post = post
+        self.base_views = base_views
+        self.seen = 0
+        self.expires_at = expires_at
+
+
+class BlogPostCache:
+    """
+    Cache de lectura (LRU con TTL) de artículos publicados, por slug.
+
+    El contador de vistas de la respuesta es el de la base al cargar, más lo
+    pendiente en el buffer en ese momento, más las vistas servidas desde la cache.
+    """
+
+    def __init__(
+        self,
+        views: BlogViewBuffer,
+        ttl_seconds: float = BLOG_POST_CACHE_SECONDS,
+        max_entries: int = BLOG_POST_CACHE_MAX_ENTRIES
+    ):
+        self.views = views
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, _CachedPost]' = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, slug: str) -> Optional[_CachedPost]:
+        entry = self._entries.get(slug)
+        if entry is None or entry.expires_at < time.monotonic():
+            return None
+        self._entries.move_to_end(slug)
+        return entry
+
+    async def view(
+        self,
+        slug: str,
+        load: Callable[[], Awaitable[Optional[BlogPostResponse]]]
+    ) -> Optional[BlogPostResponse]:
+        """Artículo publicado por slug (None si no existe) y registro de la vista"""
+        entry = self._get(slug)
+        if entry is None:
+            lock = self._locks.setdefault(slug, asyncio.Lock())
+            async with lock:
+                entry = self._get(slug)
+                if entry is None:
+                    self.misses += 1
+                    post = await load()
+                    if post is None:
+                        self._locks.pop(slug, None)
+                        return None
+                    entry = _CachedPost(
+                        post,
+                        (post.views or 0) + self.views.pending_for(post.id),
+                        time.monotonic() + self.ttl_seconds
+                    )
+                    self._entries[slug] = entry
+                    while len(self._entries) > self.max_entries:
+                        evicted, _ = self._entries.popitem(last=False)
+                        self._locks.pop(evicted, None)
+                else:
+                    self.hits += 1
+        else:
+            self.hits += 1
+
+        self.views.record(entry.post.id)
+        entry.seen += 1
+        return entry.post.model_copy(update={'views': entry.base_views + entry.seen})
+
+    def invalidate(self, slug: Optional[str] = None):
+        """Sin slug invalida todo (p.ej. al aprobar o rechazar artículos)"""
+        if slug is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(slug, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+
+# Instancias globales
+blog_view_buffer = BlogViewBuffer()
+blog_post_cache = BlogPostCache(blog_view_buffer)
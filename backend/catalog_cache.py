@@ -0,0 +1,156 @@
+"""
+GuaraniAppStore V2.5 Pro - Catalog Cache
+Catálogo público (/api/services, /api/countries) pre-serializado con ETag y Cache-Control.
+
+Cada entrada guarda los bytes JSON ya serializados y su ETag (hash del
+contenido, igual en todos los workers). Los endpoints admin de servicios
+llaman a invalidate(), que sube la versión del catálogo; en otros workers
+el cambio se ve al vencer CATALOG_CACHE_TTL_SECONDS.
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import Response
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CACHE_TTL_SECONDS = float(os.environ.get('CATALOG_CACHE_TTL_SECONDS', '60'))
+# Navegador: revalidación barata con If-None-Match (304 sin cuerpo)
+CATALOG_BROWSER_MAX_AGE = int(os.environ.get('CATALOG_BROWSER_MAX_AGE', '60'))
+# Edge de Cloudflare (requiere una Cache Rule que habilite el cache de /api/services y /api/countries)
+CATALOG_EDGE_MAX_AGE = int(os.environ.get('CATALOG_EDGE_MAX_AGE', '300'))
+CATALOG_STALE_WHILE_REVALIDATE = int(os.environ.get('CATALOG_STALE_WHILE_REVALIDATE', '600'))
+
+# build() retorna (datos, cacheable); p.ej. el respaldo de MongoDB no se cachea
+CatalogBuilder = Callable[[], Awaitable[Tuple[Any, bool]]]
+
+
+@dataclass
+class CatalogEntry:
+    body: bytes
+    etag: str
+    version: int
+    expires_at: float
+    cacheable: bool = True
+
+
+def _serialize(data: Any) -> bytes:
+    # Mismo formato que JSONResponse de FastAPI
+    return json.dumps(
+        jsonable_encoder(data),
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(',', ':')
+    ).encode('utf-8')
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # Comparación débil (RFC 7232): Cloudflare marca W/ al comprimir
+    if if_none_match.strip() == '*':
+        return True
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+class CatalogCache:
+    """Entradas por clave ('services', 'countries'), válidas mientras no cambie la versión"""
+
+    def __init__(self, ttl_seconds: float = CATALOG_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.version = 0
+        self._entries: Dict[str, CatalogEntry] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.hits = 0
+        self.builds = 0
+        self.not_modified = 0
+
+    def _valid(self, entry: CatalogEntry) -> bool:
+        return entry.cacheable and entry.version == self.version and entry.expires_at > time.monotonic()
+
+    async def get(self, key: str, build: CatalogBuilder) -> CatalogEntry:
+        entry = self._entries.get(key)
+        if entry is not None and self._valid(entry):
+            self.hits += 1
+            return entry
+
+        # Una sola reconstrucción por clave aunque lleguen muchas requests juntas
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._valid(entry):
+                self.hits += 1
+                return entry
+
+            version = self.version
+            data, cacheable = await build()
+            body = _serialize(data)
+            entry = CatalogEntry(
+                body=body,
+                etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+                version=version,
+                expires_at=time.monotonic() + self.ttl_seconds,
+                cacheable=cacheable
+            )
+            self.builds += 1
+            if cacheable:
+                self._entries[key] = entry
+            return entry
+
+    def invalidate(self):
+        """Llamar después de crear, modificar o eliminar servicios"""
+        self.version += 1
+        self._entries.clear()
+        logger.info(f"Catálogo invalidado (versión {self.version})")
+
+    def response(self, entry: CatalogEntry, request: Request) -> Response:
+        """200 con el JSON pre-serializado, o 304 si el cliente ya tiene esta versión"""
+        if entry.cacheable:
+            headers = {
+                'ETag': entry.etag,
+                'Cache-Control': (
+                    f'public, max-age={CATALOG_BROWSER_MAX_AGE}, '
+                    f'stale-while-revalidate={CATALOG_STALE_WHILE_REVALIDATE}'
+                ),
+                # Directivas sólo para el edge de Cloudflare (no llegan al navegador)
+                'Cloudflare-CDN-Cache-Control': (
+                    f'public, max-age={CATALOG_EDGE_MAX_AGE}, '
+                    f'stale-while-revalidate={CATALOG_STALE_WHILE_REVALIDATE}'
+                ),
+                'Vary': 'Accept-Encoding'
+            }
+        else:
+            headers = {'ETag': entry.etag, 'Cache-Control': 'no-cache'}
+
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match and _etag_matches(if_none_match, entry.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type='application/json', headers=headers)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'version': self.version,
+            'ttl_seconds': self.ttl_seconds,
+            'entries': {key: {'bytes': len(e.body), 'etag': e.etag} for key, e in self._entries.items()},
+            'hits': self.hits,
+            'builds': self.builds,
+            'not_modified': self.not_modified
+        }
+
+
+# Instancia global
+catalog_cache = CatalogCache()
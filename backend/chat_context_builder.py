@@ -0,0 +1,126 @@
+"""
+GuaraniAppStore V2.5 Pro - Chat Context Builder
+Empaqueta el historial de chat dentro de un presupuesto de tokens por modelo.
+"""
+
+import os
+import logging
+from datetime import datetime
+from typing import List, Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding('cl100k_base')
+except Exception:  # tiktoken no instalado o sin acceso al vocabulario
+    _ENCODING = None
+
+# Tokens de historial (sin system prompt ni mensaje actual) por modelo
+CONTEXT_HISTORY_BUDGETS = {
+    'anthropic/claude-3.5-sonnet': 4000,
+    'anthropic/claude-3-haiku': 3000,
+    'default': 3000
+}
+
+CHAT_CONTEXT_TOKEN_BUDGET = os.environ.get('CHAT_CONTEXT_TOKEN_BUDGET')
+
+# Overhead aproximado por mensaje en el formato chat (rol + separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text: str) -> int:
+    """Cuenta tokens con tiktoken si está disponible, si no estima ~4 caracteres por token"""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+class ChatContextBuilder:
+    """
+    Selecciona los turnos más recientes que caben en el presupuesto y separa
+    los más antiguos para plegarlos en el resumen acumulado de la sesión.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.tokens_full = 0
+        self.tokens_sent = 0
+
+    def budget_for_model(self, model: str) -> int:
+        if CHAT_CONTEXT_TOKEN_BUDGET:
+            return int(CHAT_CONTEXT_TOKEN_BUDGET)
+        return CONTEXT_HISTORY_BUDGETS.get(model, CONTEXT_HISTORY_BUDGETS['default'])
+
+    def build(
+        self,
+        history: List[Dict[str, Any]],
+        model: str,
+        summary: Optional[str] = None,
+        summary_until: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """
+        Arma el contexto para un turno.
+
+        Args:
+            history: Historial en orden cronológico (role, content, timestamp)
+            model: Modelo que recibirá el prompt
+            summary: Resumen acumulado de turnos anteriores
+            summary_until: Timestamp del último mensaje ya incluido en el resumen
+
+        Returns:
+            Dict con history (mensajes a enviar), summary, to_summarize (mensajes
+            fuera de la ventana aún no resumidos), tokens_sent y tokens_saved
+        """
+        budget = self.budget_for_model(model)
+        summary_tokens = count_tokens(summary) if summary else 0
+        remaining = max(budget - summary_tokens, 0)
+
+        sizes = [count_tokens(m.get('content', '')) + MESSAGE_OVERHEAD_TOKENS for m in history]
+        tokens_full = sum(sizes)
+
+        # Desde el más reciente hacia atrás; siempre se incluye al menos el último mensaje
+        start = len(history)
+        used = 0
+        while start > 0 and (used + sizes[start - 1] <= remaining or start == len(history)):
+            start -= 1
+            used += sizes[start]
+
+        window = history[start:]
+        folded = history[:start]
+
+        # Sólo lo que el resumen todavía no cubre
+        cutoff = summary_until.isoformat() if summary_until else None
+        to_summarize = [m for m in folded if cutoff is None or m['timestamp'] > cutoff]
+
+        tokens_sent = used + summary_tokens
+        tokens_saved = max(tokens_full - tokens_sent, 0)
+
+        self.requests += 1
+        self.tokens_full += tokens_full
+        self.tokens_sent += tokens_sent
+
+        return {
+            'history': window,
+            'summary': summary,
+            'to_summarize': to_summarize,
+            'tokens_sent': tokens_sent,
+            'tokens_saved': tokens_saved
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        saved = max(self.tokens_full - self.tokens_sent, 0)
+        return {
+            'requests': self.requests,
+            'history_tokens_full': self.tokens_full,
+            'history_tokens_sent': self.tokens_sent,
+            'tokens_saved': saved,
+            'avg_tokens_saved_per_request': round(saved / self.requests, 1) if self.requests else 0,
+            'tokenizer': 'tiktoken' if _ENCODING is not None else 'heuristic'
+        }
+
+
+# Instancia global
+chat_context_builder = ChatContextBuilder()
@@ -0,0 +1,511 @@
+"""
+GuaraniAppStore V2.5 Pro - Chat Memory Hot Tier
+Cache LRU en memoria de sesiones activas y cola write-behind para mensajes.
+"""
+
+import os
+import json
+import uuid
+import asyncio
+import logging
+from pathlib import Path
+from collections import OrderedDict, deque
+from datetime import datetime, date
+from typing import List, Optional, Dict, Any, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from models import ChatSession, ChatMessage
+from database import AsyncSessionLocal
+from datastore_router import CONNECTIVITY_ERRORS
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).parent
+
+CHAT_HOT_CACHE_MAX_BYTES = int(os.environ.get('CHAT_HOT_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+CHAT_WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('CHAT_WRITE_BEHIND_BATCH_SIZE', '100'))
+CHAT_WRITE_BEHIND_INTERVAL_SECONDS = float(os.environ.get('CHAT_WRITE_BEHIND_INTERVAL_SECONDS', '0.5'))
+CHAT_WRITE_BEHIND_JOURNAL = os.environ.get(
+    'CHAT_WRITE_BEHIND_JOURNAL',
+    str(ROOT_DIR / 'data' / 'chat_write_behind.jsonl')
+)
+# Turnos por segmento del journal; un segmento se elimina cuando todos sus turnos están en la base
+CHAT_WRITE_BEHIND_SEGMENT_TURNS = int(os.environ.get('CHAT_WRITE_BEHIND_SEGMENT_TURNS', '1000'))
+# Fallas de datos de un lote antes de reintentarlo turno por turno
+CHAT_WRITE_BEHIND_MAX_BATCH_FAILURES = int(os.environ.get('CHAT_WRITE_BEHIND_MAX_BATCH_FAILURES', '3'))
+# Turnos que PostgreSQL rechaza (p.ej. \x00 en el texto): se apartan aquí para revisión manual
+CHAT_WRITE_BEHIND_DEAD_LETTER = os.environ.get(
+    'CHAT_WRITE_BEHIND_DEAD_LETTER',
+    str(ROOT_DIR / 'data' / 'chat_write_behind.dead.jsonl')
+)
+
+# Costo fijo aproximado por mensaje (dict + claves) además del contenido
+MESSAGE_OVERHEAD_BYTES = 200
+
+OwnerKey = Tuple[str, str]
+
+
+def owner_key(agent_name: str, user_id: Optional[str], visitor_id: Optional[str]) -> Optional[OwnerKey]:
+    """Clave de cache para (agente, dueño). None si la sesión no tiene dueño identificable"""
+    if user_id:
+        return (agent_name, f'user:{user_id}')
+    if visitor_id:
+        return (agent_name, f'visitor:{visitor_id}')
+    return None
+
+
+class HotSession:
+    """Historial reciente de una sesión activa"""
+
+    __slots__ = (
+        'session_id', 'history', 'last_message_day', 'size_bytes', 'history_limit', 'timezone',
+        'summary', 'summary_until'
+    )
+
+    def __init__(
+        self,
+        session_id: str,
+        history: List[Dict[str, Any]],
+        last_message_day: Optional[date],
+        history_limit: int,
+        timezone: Optional[str] = None,
+        summary: Optional[str] = None,
+        summary_until: Optional[datetime] = None
+    ):
+        self.session_id = session_id
+        self.timezone = timezone
+        self.summary = summary
+        self.summary_until = summary_until
+        self.history = list(history[-history_limit:])
+        self.last_message_day = last_message_day
+        self.history_limit = history_limit
+        self.size_bytes = sum(self._message_size(m) for m in self.history)
+
+    @staticmethod
+    def _message_size(message: Dict[str, Any]) -> int:
+        return len(message['content'].encode('utf-8')) + MESSAGE_OVERHEAD_BYTES
+
+    def append(self, message: Dict[str, Any]) -> int:
+        """Agrega un mensaje y retorna la variación de bytes"""
+        delta = self._message_size(message)
+        self.history.append(message)
+        while len(self.history) > self.history_limit:
+            delta -= self._message_size(self.history.pop(0))
+        self.size_bytes += delta
+        return delta
+
+
+class HotSessionCache:
+    """
+    LRU de sesiones activas con contabilidad de bytes.
+
+    Sólo se accede desde el event loop, por lo que no necesita locks.
+    """
+
+    def __init__(self, max_bytes: int = CHAT_HOT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: 'OrderedDict[OwnerKey, HotSession]' = OrderedDict()
+        self._keys_by_session: Dict[str, OwnerKey] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Optional[OwnerKey]) -> Optional[HotSession]:
+        if key is None:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Optional[OwnerKey], entry: HotSession):
+        if key is None:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.total_bytes -= previous.size_bytes
+            self._keys_by_session.pop(previous.session_id, None)
+        self._entries[key] = entry
+        self._keys_by_session[entry.session_id] = key
+        self.total_bytes += entry.size_bytes
+        self._evict()
+
+    def append(self, session_id: str, messages: List[Dict[str, Any]], day: date):
+        """Actualiza una sesión caliente con los mensajes de un turno"""
+        key = self._keys_by_session.get(session_id)
+        entry = self._entries.get(key) if key is not None else None
+        if entry is None:
+            return
+        for message in messages:
+            self.total_bytes += entry.append(message)
+        entry.last_message_day = day
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def set_summary(self, session_id: str, summary: str, summary_until: datetime):
+        """Actualiza el resumen acumulado de una sesión caliente"""
+        key = self._keys_by_session.get(session_id)
+        entry = self._entries.get(key) if key is not None else None
+        if entry is not None:
+            entry.summary = summary
+            entry.summary_until = summary_until
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._keys_by_session.pop(entry.session_id, None)
+            self.total_bytes -= entry.size_bytes
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_session.clear()
+        self.total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'sessions': len(self._entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+class _JournalSegment:
+    __slots__ = ('path', 'fd', 'written', 'flushed')
+
+    def __init__(self, path: Path, fd: Optional[int]):
+        self.path = path
+        self.fd = fd
+        self.written = 0
+        self.flushed = 0
+
+
+class ChatWriteBehindQueue:
+    """
+    Persistencia diferida de mensajes de chat.
+
+    Cada turno se agrega primero a un journal local y luego a una cola FIFO.
+    Las escrituras al journal se agrupan (group commit): un escritor toma todos
+    los turnos pendientes y hace un único write + fsync en un hilo, sin bloquear
+    el event loop. El journal se divide en segmentos de
+    CHAT_WRITE_BEHIND_SEGMENT_TURNS turnos; cuando todos los turnos de un
+    segmento cerrado están en la base, se elimina, así que el journal no crece
+    aunque la cola nunca llegue a vaciarse.
+
+    Un único worker vacía la cola en lotes, en orden de llegada, con una
+    transacción por lote. Los mensajes llevan id propio, así que al reiniciar
+    los segmentos pendientes vuelven a la cola y se re-aplican con ON CONFLICT
+    DO NOTHING sin duplicar.
+
+    Errores de conexión: se reintenta el lote con backoff. Errores de datos:
+    tras CHAT_WRITE_BEHIND_MAX_BATCH_FAILURES intentos el lote se escribe turno
+    por turno y los turnos rechazados van al archivo dead-letter, para que una
+    fila inválida no detenga el chat de todos los usuarios.
+    """
+
+    def __init__(
+        self,
+        journal_path: str = CHAT_WRITE_BEHIND_JOURNAL,
+        batch_size: int = CHAT_WRITE_BEHIND_BATCH_SIZE,
+        interval_seconds: float = CHAT_WRITE_BEHIND_INTERVAL_SECONDS,
+        segment_turns: int = CHAT_WRITE_BEHIND_SEGMENT_TURNS,
+        dead_letter_path: str = CHAT_WRITE_BEHIND_DEAD_LETTER
+    ):
+        self.journal_path = Path(journal_path)
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        self.segment_turns = max(segment_turns, 1)
+        self.dead_letter_path = Path(dead_letter_path)
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._journal_writer: Optional[asyncio.Task] = None
+        self._journal_wakeup: Optional[asyncio.Event] = None
+        self._journal_pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._segments: 'deque[_JournalSegment]' = deque()
+        self._next_segment = 1
+        self.flushed_turns = 0
+        self.dead_lettered = 0
+        self.flushed_batches = 0
+        self.journal_syncs = 0
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def _segment_paths(self) -> List[Path]:
+        # El journal sin sufijo es el formato anterior (un único archivo)
+        paths = sorted(self.journal_path.parent.glob(f'{self.journal_path.name}.*'))
+        if self.journal_path.exists():
+            paths.insert(0, self.journal_path)
+        return paths
+
+    def _open_segment(self) -> _JournalSegment:
+        path = self.journal_path.with_name(f'{self.journal_path.name}.{self._next_segment:08d}')
+        self._next_segment += 1
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o600)
+        segment = _JournalSegment(path, fd)
+        self._segments.append(segment)
+        return segment
+
+    async def start(self):
+        """Arrancar el worker; los segmentos pendientes del journal se re-aplican primero"""
+        if self.running:
+            return
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        self._queue = asyncio.Queue()
+
+        # Sin escribir en la base aquí: el worker los persiste con el mismo manejo de errores
+        replayed = 0
+        for path in self._segment_paths():
+            suffix = path.name[len(self.journal_path.name) + 1:]
+            if suffix.isdigit():
+                self._next_segment = max(self._next_segment, int(suffix) + 1)
+            segment = _JournalSegment(path, None)
+            self._segments.append(segment)
+            for turn in self._read_journal(path):
+                segment.written += 1
+                self._queue.put_nowait((turn, segment))
+                replayed += 1
+        if replayed:
+            logger.info(f"Re-aplicando {len(self._segments)} segmentos ({replayed} turnos) del journal de chat")
+        self._release_segments()
+
+        self._open_segment()
+        self._journal_wakeup = asyncio.Event()
+        self._journal_writer = asyncio.create_task(self._write_journal())
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Vaciar la cola y detener el worker (apagado ordenado)"""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), timeout=10)
+        except asyncio.TimeoutError:
+            # Lo pendiente queda en el journal y se re-aplica en el próximo arranque
+            logger.warning(f"Apagado con {self._queue.qsize()} turnos de chat pendientes en el journal")
+        for task in (self._journal_writer, self._worker):
+            task.cancel()
+        await asyncio.gather(self._journal_writer, self._worker, return_exceptions=True)
+        self._journal_writer = None
+        self._worker = None
+        for segment in self._segments:
+            if segment.fd is not None:
+                os.close(segment.fd)
+                segment.fd = None
+        self._release_segments()
+        self._segments.clear()
+
+    async def _drain(self):
+        while self._journal_pending:
+            await asyncio.sleep(0.01)
+        await self._queue.join()
+
+    @staticmethod
+    def _read_journal(path: Path) -> List[Dict[str, Any]]:
+        turns = []
+        with open(path, 'r', encoding='utf-8') as fh:
+            for line in fh:
+                try:
+                    turns.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break  # Última línea truncada por un crash
+        return turns
+
+    async def enqueue(self, turn: Dict[str, Any]):
+        """Registrar un turno en el journal (retorna tras el fsync del grupo) y encolarlo"""
+        future = asyncio.get_running_loop().create_future()
+        self._journal_pending.append((turn, future))
+        self._journal_wakeup.set()
+        await future
+
+    @staticmethod
+    def _append(fd: int, data: bytes):
+        os.write(fd, data)
+        os.fsync(fd)
+
+    async def _write_journal(self):
+        while True:
+            await self._journal_wakeup.wait()
+            self._journal_wakeup.clear()
+            group, self._journal_pending = self._journal_pending, []
+            if not group:
+                continue
+
+            segment = self._segments[-1]
+            data = b''.join((json.dumps(turn, default=str) + '\n').encode('utf-8') for turn, _ in group)
+            try:
+                await asyncio.to_thread(self._append, segment.fd, data)
+            except Exception as e:
+                logger.error(f"Error escribiendo {len(group)} turnos de chat en el journal: {str(e)}")
+                for _, future in group:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.journal_syncs += 1
+            segment.written += len(group)
+            for turn, future in group:
+                self._queue.put_nowait((turn, segment))
+                if not future.done():
+                    future.set_result(None)
+
+            if segment.written >= self.segment_turns:
+                os.close(segment.fd)
+                segment.fd = None
+                self._open_segment()
+
+    def _release_segments(self):
+        """Eliminar los segmentos cerrados cuyos turnos ya están todos en la base"""
+        while self._segments:
+            segment = self._segments[0]
+            if segment.fd is not None or segment.flushed < segment.written:
+                break
+            segment.path.unlink(missing_ok=True)
+            self._segments.popleft()
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            await asyncio.sleep(self.interval_seconds)
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._persist([turn for turn, _ in batch])
+
+            self.flushed_turns += len(batch)
+            self.flushed_batches += 1
+            for _, segment in batch:
+                segment.flushed += 1
+                self._queue.task_done()
+
+            # Prefijo del journal ya persistido: se descarta aunque la cola no esté vacía
+            self._release_segments()
+
+    @staticmethod
+    def _is_connectivity_error(error: BaseException) -> bool:
+        return isinstance(error, CONNECTIVITY_ERRORS) or (
+            isinstance(error, DBAPIError) and error.connection_invalidated
+        )
+
+    async def _persist(self, turns: List[Dict[str, Any]]):
+        """Escribir el lote en orden; sólo retorna cuando cada turno quedó en la base o en dead-letter"""
+        delay = 1.0
+        data_failures = 0
+        while True:
+            try:
+                await self._write_batch(turns)
+                return
+            except Exception as e:
+                if not self._is_connectivity_error(e):
+                    data_failures += 1
+                    if data_failures >= CHAT_WRITE_BEHIND_MAX_BATCH_FAILURES:
+                        logger.error(f"Lote de {len(turns)} turnos de chat rechazado {data_failures} veces, escribiendo turno por turno: {str(e)}")
+                        break
+                logger.error(f"Error persistiendo {len(turns)} turnos de chat, reintento en {delay:.0f}s: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+        for turn in turns:
+            delay = 1.0
+            while True:
+                try:
+                    await self._write_batch([turn])
+                    break
+                except Exception as e:
+                    if not self._is_connectivity_error(e):
+                        await self._dead_letter(turn, e)
+                        break
+                    logger.error(f"Error persistiendo un turno de chat, reintento en {delay:.0f}s: {str(e)}")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 30.0)
+
+    async def _dead_letter(self, turn: Dict[str, Any], error: BaseException):
+        record = json.dumps({
+            'failed_at': datetime.utcnow().isoformat(),
+            'error': f"{type(error).__name__}: {error}"[:2000],
+            'turn': turn
+        }, default=str) + '\n'
+
+        def append():
+            with open(self.dead_letter_path, 'a', encoding='utf-8') as fh:
+                fh.write(record)
+                fh.flush()
+                os.fsync(fh.fileno())
+
+        try:
+            await asyncio.to_thread(append)
+        except OSError as e:
+            logger.error(f"No se pudo escribir el turno descartado en {self.dead_letter_path}: {str(e)}")
+        self.dead_lettered += 1
+        logger.error(f"Turno de chat de la sesión {turn.get('session_id')} apartado en dead-letter: {type(error).__name__}: {error}")
+
+    async def _write_batch(self, batch: List[Dict[str, Any]]):
+        rows = []
+        for turn in batch:
+            for message in turn['messages']:
+                rows.append({
+                    'id': message['id'],
+                    'session_id': turn['session_id'],
+                    'role': message['role'],
+                    'content': message['content'],
+                    'timestamp': datetime.fromisoformat(message['timestamp']),
+                    'model_used': message.get('model_used'),
+                    'message_metadata': message.get('message_metadata') or {}
+                })
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                pg_insert(ChatMessage)
+                .values(rows)
+                .on_conflict_do_nothing()
+                .returning(ChatMessage.session_id, ChatMessage.timestamp)
+            )
+
+            # Sin index_elements: vale tanto para PK (id) como para (id, timestamp) particionada.
+            # Contadores sólo por las filas realmente insertadas (idempotente al re-aplicar)
+            per_session: Dict[str, List] = {}
+            for session_id, timestamp in result.all():
+                count, last = per_session.get(session_id, (0, timestamp))
+                per_session[session_id] = (count + 1, max(last, timestamp))
+
+            # Fecha local del último mensaje del usuario por sesión (el lote está en orden)
+            local_dates = {
+                turn['session_id']: date.fromisoformat(turn['user_local_date'])
+                for turn in batch if turn.get('user_local_date')
+            }
+
+            for session_id, (count, last) in per_session.items():
+                values = {
+                    'total_messages': ChatSession.total_messages + count,
+                    'last_interaction_date': last
+                }
+                if session_id in local_dates:
+                    values['last_user_message_date'] = local_dates[session_id]
+                await db.execute(
+                    update(ChatSession)
+                    .where(ChatSession.id == session_id)
+                    .values(**values)
+                )
+            await db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'running': self.running,
+            'pending_turns': self._queue.qsize() if self._queue else 0,
+            'flushed_turns': self.flushed_turns,
+            'dead_lettered_turns': self.dead_lettered,
+            'flushed_batches': self.flushed_batches,
+            'journal_syncs': self.journal_syncs,
+            'journal_segments': len(self._segments)
+        }
+
+
+def new_message_id() -> str:
+    return str(uuid.uuid4())
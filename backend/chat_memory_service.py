@@ -4,13 +4,19 @@ Sistema de memoria persistente para agentes de chat con retención de 30 días.
 """
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete, and_, func
-from datetime import datetime, timedelta, timezone
-from typing import List, Optional, Dict, Any
+from sqlalchemy import select, update, insert, and_, or_, func, true
+from sqlalchemy.orm import aliased
+from datetime import datetime, date, timedelta, timezone
+from typing import List, Optional, Dict, Any, Set
+import asyncio
 import logging
 
 from models import ChatSession, ChatMessage, User
 from database import AsyncSessionLocal
+from timezone_utils import DEFAULT_TIMEZONE, get_local_date_for_user
+from chat_memory_cache import HotSessionCache, HotSession, ChatWriteBehindQueue, owner_key, new_message_id
+from ai_service import summarize_conversation
+from chat_retention import chat_retention_engine
 
 logger = logging.getLogger(__name__)
 
@@ -24,12 +30,371 @@ class ChatMemoryService:
     - Detección de "primer mensaje del día"
     - Carga eficiente de contexto histórico
     - Limpieza automática de mensajes antiguos
+    - Cache en memoria de sesiones activas con persistencia write-behind
+    - Resumen acumulado de los turnos que salen de la ventana de contexto
     """
     
     RETENTION_DAYS = 30
     
     def __init__(self):
         self.retention_days = self.RETENTION_DAYS
+        self.hot_cache = HotSessionCache()
+        self.write_behind = ChatWriteBehindQueue()
+        self._summarizing = set()
+        # Referencias fuertes: el event loop sólo guarda referencias débiles a las tareas
+        self._summary_tasks: Set[asyncio.Task] = set()
+    
+    async def start(self):
+        """Arranca la cola write-behind (re-aplica el journal pendiente)"""
+        await self.write_behind.start()
+    
+    async def stop(self, summary_timeout: float = 10.0):
+        """Espera los resúmenes en curso y vacía la cola write-behind antes de apagar"""
+        if self._summary_tasks:
+            pending = list(self._summary_tasks)
+            done, still_running = await asyncio.wait(pending, timeout=summary_timeout)
+            for task in still_running:
+                task.cancel()
+            if still_running:
+                # Los turnos siguen en el historial: se resumen en el próximo turno de la sesión
+                logger.warning(f"Apagado con {len(still_running)} resúmenes de chat cancelados")
+                await asyncio.gather(*still_running, return_exceptions=True)
+        await self.write_behind.stop()
+    
+    def schedule_rolling_summary(
+        self,
+        session_id: str,
+        agent_name: str,
+        messages: List[Dict[str, Any]],
+        previous_summary: Optional[str] = None
+    ) -> Optional[asyncio.Task]:
+        """Lanza update_rolling_summary en segundo plano (fuera del camino crítico)"""
+        if not messages:
+            return None
+        task = asyncio.create_task(self.update_rolling_summary(
+            session_id=session_id,
+            agent_name=agent_name,
+            messages=messages,
+            previous_summary=previous_summary
+        ))
+        self._summary_tasks.add(task)
+        task.add_done_callback(self._summary_tasks.discard)
+        return task
+    
+    def _owner_filter(self, query, session_model, user_id: Optional[str], visitor_id: Optional[str]):
+        """Aplica el filtro de dueño (usuario registrado o visitante) a una consulta"""
+        if user_id:
+            return query.where(session_model.user_id == user_id)
+        if visitor_id:
+            return query.where(session_model.visitor_id == visitor_id)
+        return query
+    
+    async def load_turn_context(
+        self,
+        agent_name: str,
+        user_id: Optional[str] = None,
+        visitor_id: Optional[str] = None,
+        user_timezone: Optional[str] = None,
+        session_metadata: Optional[Dict[str, Any]] = None,
+        history_limit: int = 50
+    ) -> Dict[str, Any]:
+        """
+        Carga todo lo necesario para un turno de chat en una sola consulta.
+        
+        Sesión activa, últimos mensajes (LATERAL ... LIMIT) y la fecha local del
+        último mensaje del usuario se resuelven en un único SELECT. Sólo si no hay
+        sesión activa se inserta una nueva en la misma conexión.
+        
+        Args:
+            agent_name: Nombre del agente
+            user_id: ID del usuario registrado (opcional)
+            visitor_id: ID del visitante anónimo (opcional)
+            user_timezone: Zona horaria enviada por el cliente (opcional)
+            session_metadata: Metadata para una sesión nueva
+            history_limit: Número máximo de mensajes de historial
+        
+        Returns:
+            Dict con session_id, history (orden cronológico), is_first_message_today,
+            timezone, local_date (fecha local a registrar en persist_turn),
+            context_summary y context_summary_until
+        """
+        # Sesión caliente: sin ida y vuelta a la base de datos
+        cache_key = owner_key(agent_name, user_id, visitor_id)
+        hot = self.hot_cache.get(cache_key)
+        if hot is not None and hot.history_limit >= history_limit:
+            tz_name = user_timezone or hot.timezone
+            local_date = get_local_date_for_user(tz_name)
+            return {
+                'session_id': hot.session_id,
+                'history': hot.history[-history_limit:],
+                'is_first_message_today': hot.last_message_day != local_date,
+                'timezone': tz_name,
+                'local_date': local_date,
+                'context_summary': hot.summary,
+                'context_summary_until': hot.summary_until
+            }
+        
+        history = select(
+            ChatMessage.role,
+            ChatMessage.content,
+            ChatMessage.timestamp,
+            ChatMessage.sentiment,
+            ChatMessage.intent
+        ).where(
+            and_(
+                ChatMessage.session_id == ChatSession.id,
+                ChatMessage.role != 'system'
+            )
+        ).order_by(ChatMessage.timestamp.desc()).limit(history_limit).lateral('history')
+        
+        ActiveSession = aliased(ChatSession)
+        active_session_id = select(ActiveSession.id).where(
+            and_(
+                ActiveSession.agent_name == agent_name,
+                ActiveSession.is_active == True
+            )
+        )
+        active_session_id = self._owner_filter(active_session_id, ActiveSession, user_id, visitor_id)
+        active_session_id = active_session_id.order_by(
+            ActiveSession.last_interaction_date.desc()
+        ).limit(1).scalar_subquery()
+        
+        user_timezone_query = select(User.timezone).where(User.id == user_id)
+        
+        query = select(
+            ChatSession.id,
+            ChatSession.last_user_message_date,
+            ChatSession.context_summary,
+            ChatSession.context_summary_until,
+            user_timezone_query.scalar_subquery().label('user_timezone'),
+            history.c.role,
+            history.c.content,
+            history.c.timestamp,
+            history.c.sentiment,
+            history.c.intent
+        ).outerjoin(history, true()).where(ChatSession.id == active_session_id)
+        
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(query)).all()
+            
+            if rows:
+                tz_name = user_timezone or rows[0].user_timezone or DEFAULT_TIMEZONE
+                local_date = get_local_date_for_user(tz_name)
+                last_user_message_date = rows[0].last_user_message_date
+                
+                history_rows = sorted(
+                    (row for row in rows if row.role is not None),
+                    key=lambda row: row.timestamp
+                )
+                messages = [
+                    {
+                        'role': row.role,
+                        'content': row.content,
+                        'timestamp': row.timestamp.isoformat(),
+                        'sentiment': row.sentiment,
+                        'intent': row.intent
+                    }
+                    for row in history_rows
+                ]
+                self.hot_cache.put(cache_key, HotSession(
+                    session_id=rows[0].id,
+                    history=messages,
+                    last_message_day=last_user_message_date,
+                    history_limit=history_limit,
+                    timezone=tz_name,
+                    summary=rows[0].context_summary,
+                    summary_until=rows[0].context_summary_until
+                ))
+                return {
+                    'session_id': rows[0].id,
+                    'history': list(messages),
+                    'is_first_message_today': last_user_message_date != local_date,
+                    'timezone': tz_name,
+                    'local_date': local_date,
+                    'context_summary': rows[0].context_summary,
+                    'context_summary_until': rows[0].context_summary_until
+                }
+            
+            # Sin sesión activa: crearla en la misma conexión
+            tz_name = user_timezone
+            if not tz_name and user_id:
+                tz_name = await db.scalar(user_timezone_query)
+            tz_name = tz_name or DEFAULT_TIMEZONE
+            
+            now = datetime.utcnow()
+            session = ChatSession(
+                agent_name=agent_name,
+                user_id=user_id,
+                visitor_id=visitor_id,
+                session_metadata=session_metadata or {},
+                first_interaction_date=now,
+                last_interaction_date=now
+            )
+            db.add(session)
+            await db.commit()
+            
+            logger.info(f"Nueva sesión de chat creada: {session.id} con agente {agent_name}")
+            self.hot_cache.put(cache_key, HotSession(
+                session_id=session.id,
+                history=[],
+                last_message_day=None,
+                history_limit=history_limit,
+                timezone=tz_name
+            ))
+            return {
+                'session_id': session.id,
+                'history': [],
+                'is_first_message_today': True,
+                'timezone': tz_name,
+                'local_date': get_local_date_for_user(tz_name),
+                'context_summary': None,
+                'context_summary_until': None
+            }
+    
+    async def update_rolling_summary(
+        self,
+        session_id: str,
+        agent_name: str,
+        messages: List[Dict[str, Any]],
+        previous_summary: Optional[str] = None
+    ) -> bool:
+        """
+        Pliega en el resumen de la sesión los mensajes que salieron de la ventana.
+        
+        Pensado para correr en segundo plano después de responder; si ya hay un
+        resumen en curso para la sesión, los mensajes se pliegan en el próximo turno.
+        
+        Args:
+            session_id: ID de la sesión
+            agent_name: Nombre del agente
+            messages: Mensajes a plegar (orden cronológico, con timestamp ISO)
+            previous_summary: Resumen vigente
+        
+        Returns:
+            bool: True si se guardó un resumen nuevo
+        """
+        if not messages or session_id in self._summarizing:
+            return False
+        
+        self._summarizing.add(session_id)
+        try:
+            summary = await summarize_conversation(previous_summary, messages, agent_name)
+            if not summary:
+                return False
+            
+            summary_until = datetime.fromisoformat(messages[-1]['timestamp'])
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(ChatSession)
+                    .where(ChatSession.id == session_id)
+                    .values(context_summary=summary, context_summary_until=summary_until)
+                )
+                await db.commit()
+            
+            self.hot_cache.set_summary(session_id, summary, summary_until)
+            return True
+        except Exception as e:
+            logger.error(f"Error actualizando resumen de la sesión {session_id}: {str(e)}")
+            return False
+        finally:
+            self._summarizing.discard(session_id)
+    
+    async def persist_turn(
+        self,
+        session_id: str,
+        user_message: str,
+        assistant_message: str,
+        user_timestamp: Optional[datetime] = None,
+        user_local_date: Optional[date] = None,
+        model_used: Optional[str] = None,
+        message_metadata: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """
+        Guarda el mensaje del usuario, la respuesta y los contadores de la sesión.
+        
+        Con la cola write-behind activa el turno se registra en el journal y se
+        persiste en lote; si no, se escribe en una única transacción.
+        
+        Args:
+            session_id: ID de la sesión
+            user_message: Mensaje enviado por el usuario
+            assistant_message: Respuesta del agente
+            user_timestamp: Momento en que llegó el mensaje del usuario
+            user_local_date: Fecha local del usuario (de load_turn_context)
+            model_used: Modelo LLM que generó la respuesta
+            message_metadata: Metadata común a ambos mensajes
+        """
+        now = datetime.utcnow()
+        user_local_date = user_local_date or get_local_date_for_user(None)
+        metadata = message_metadata or {}
+        messages = [
+            {
+                'id': new_message_id(),
+                'role': 'user',
+                'content': user_message,
+                'timestamp': (user_timestamp or now).isoformat(),
+                'model_used': None,
+                'message_metadata': metadata
+            },
+            {
+                'id': new_message_id(),
+                'role': 'assistant',
+                'content': assistant_message,
+                'timestamp': now.isoformat(),
+                'model_used': model_used,
+                'message_metadata': metadata
+            }
+        ]
+        
+        self.hot_cache.append(
+            session_id,
+            [
+                {
+                    'role': m['role'],
+                    'content': m['content'],
+                    'timestamp': m['timestamp'],
+                    'sentiment': None,
+                    'intent': None
+                }
+                for m in messages
+            ],
+            user_local_date
+        )
+        
+        if self.write_behind.running:
+            try:
+                await self.write_behind.enqueue({
+                    'session_id': session_id,
+                    'user_local_date': user_local_date.isoformat(),
+                    'messages': messages
+                })
+                return
+            except OSError as e:
+                # Journal no disponible: escritura directa
+                logger.error(f"Journal de chat no disponible, escritura directa: {str(e)}")
+        
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                insert(ChatMessage),
+                [
+                    {
+                        **m,
+                        'session_id': session_id,
+                        'timestamp': datetime.fromisoformat(m['timestamp'])
+                    }
+                    for m in messages
+                ]
+            )
+            await db.execute(
+                update(ChatSession)
+                .where(ChatSession.id == session_id)
+                .values(
+                    total_messages=ChatSession.total_messages + len(messages),
+                    last_interaction_date=now,
+                    last_user_message_date=user_local_date
+                )
+            )
+            await db.commit()
     
     async def get_or_create_session(
         self,
@@ -191,64 +556,60 @@ class ChatMemoryService:
         self,
         agent_name: str,
         user_id: Optional[str] = None,
-        visitor_id: Optional[str] = None
+        visitor_id: Optional[str] = None,
+        user_timezone: Optional[str] = None
     ) -> bool:
         """
         Determina si este es el primer mensaje del día para el usuario/visitante.
         
+        Se responde con la fecha local del último mensaje guardada en la sesión,
+        así que el costo no depende de cuántos mensajes haya enviado hoy.
+        
         Args:
             agent_name: Nombre del agente
             user_id: ID del usuario registrado (opcional)
             visitor_id: ID del visitante anónimo (opcional)
+            user_timezone: Zona horaria del usuario (opcional)
         
         Returns:
             bool: True si es el primer mensaje del día
         """
         async with AsyncSessionLocal() as db:
-            # Obtener inicio del día actual en UTC
-            today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-            
-            # Buscar mensajes del usuario/visitante hoy
-            query = select(ChatMessage).join(ChatSession).where(
+            query = select(
+                ChatSession.last_user_message_date,
+                select(User.timezone).where(User.id == user_id).scalar_subquery().label('user_timezone')
+            ).where(
                 and_(
                     ChatSession.agent_name == agent_name,
-                    ChatMessage.timestamp >= today_start
+                    ChatSession.is_active == True
                 )
             )
+            query = self._owner_filter(query, ChatSession, user_id, visitor_id)
+            query = query.order_by(ChatSession.last_interaction_date.desc()).limit(1)
             
-            if user_id:
-                query = query.where(ChatSession.user_id == user_id)
-            elif visitor_id:
-                query = query.where(ChatSession.visitor_id == visitor_id)
-            
-            result = await db.execute(query)
-            messages = result.scalars().all()
+            row = (await db.execute(query)).first()
+            if row is None or row.last_user_message_date is None:
+                return True
             
-            # Si no hay mensajes hoy, es el primer mensaje del día
-            return len(messages) == 0
+            local_date = get_local_date_for_user(user_timezone or row.user_timezone)
+            return row.last_user_message_date != local_date
     
     async def cleanup_old_messages(self) -> int:
         """
         Elimina mensajes con más de RETENTION_DAYS días.
         
+        Se borra por tramos acotados (ver ChatRetentionEngine) para no bloquear
+        la tabla con un único DELETE.
+        
         Returns:
             int: Número de mensajes eliminados
         """
-        async with AsyncSessionLocal() as db:
-            cutoff_date = datetime.utcnow() - timedelta(days=self.retention_days)
-            
-            # Eliminar mensajes antiguos
-            delete_query = delete(ChatMessage).where(
-                ChatMessage.timestamp < cutoff_date
-            )
-            
-            result = await db.execute(delete_query)
-            deleted_count = result.rowcount
-            
-            await db.commit()
-            
-            logger.info(f"Limpieza de mensajes antiguos: {deleted_count} mensajes eliminados")
-            return deleted_count
+        cutoff_date = datetime.utcnow() - timedelta(days=self.retention_days)
+        deleted_count = await chat_retention_engine.delete_expired_messages(cutoff_date)
+        self.hot_cache.clear()
+        
+        logger.info(f"Limpieza de mensajes antiguos: {deleted_count} mensajes eliminados")
+        return deleted_count
     
     async def cleanup_inactive_sessions(self, days_inactive: int = 30) -> int:
         """
@@ -260,29 +621,126 @@ class ChatMemoryService:
         Returns:
             int: Número de sesiones marcadas como inactivas
         """
+        count = await chat_retention_engine.deactivate_inactive_sessions(days_inactive)
+        self.hot_cache.clear()
+        
+        logger.info(f"Sesiones marcadas como inactivas: {count}")
+        return count
+    
+    async def get_user_chat_history(
+        self,
+        user_id: str,
+        agent_name: Optional[str] = None,
+        session_id: Optional[str] = None,
+        session_limit: int = 10,
+        messages_per_session: int = 50,
+        before: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Historial de las sesiones más recientes del usuario en una sola consulta.
+        
+        Los mensajes se numeran con ROW_NUMBER() por sesión (más reciente primero)
+        y se corta en messages_per_session, así el costo no crece con la cantidad
+        de sesiones ni de mensajes antiguos.
+        
+        Args:
+            user_id: ID del usuario registrado
+            agent_name: Filtrar por agente (opcional)
+            session_id: Limitar a una sesión (para paginar sus mensajes)
+            session_limit: Número máximo de sesiones
+            messages_per_session: Mensajes por sesión (página)
+            before: Cursor "timestamp|id" devuelto como next_cursor; trae mensajes anteriores
+        
+        Returns:
+            Lista de sesiones con sus mensajes en orden cronológico y next_cursor
+        """
+        sessions = select(
+            ChatSession.id,
+            ChatSession.agent_name,
+            ChatSession.first_interaction_date,
+            ChatSession.last_interaction_date,
+            ChatSession.total_messages
+        ).where(ChatSession.user_id == user_id)
+        if agent_name:
+            sessions = sessions.where(ChatSession.agent_name == agent_name)
+        if session_id:
+            sessions = sessions.where(ChatSession.id == session_id)
+        sessions = sessions.order_by(ChatSession.last_interaction_date.desc()).limit(session_limit).subquery('s')
+        
+        conditions = [
+            ChatMessage.session_id.in_(select(sessions.c.id)),
+            ChatMessage.role != 'system'
+        ]
+        if before:
+            before_timestamp, _, before_id = before.partition('|')
+            before_timestamp = datetime.fromisoformat(before_timestamp)
+            conditions.append(or_(
+                ChatMessage.timestamp < before_timestamp,
+                and_(ChatMessage.timestamp == before_timestamp, ChatMessage.id < before_id)
+            ))
+        
+        numbered = select(
+            ChatMessage.id.label('message_id'),
+            ChatMessage.session_id,
+            ChatMessage.role,
+            ChatMessage.content,
+            ChatMessage.timestamp,
+            ChatMessage.sentiment,
+            ChatMessage.intent,
+            func.row_number().over(
+                partition_by=ChatMessage.session_id,
+                order_by=(ChatMessage.timestamp.desc(), ChatMessage.id.desc())
+            ).label('rn')
+        ).where(and_(*conditions)).subquery('m')
+        
+        # Una fila extra por sesión para saber si hay más páginas
+        query = select(sessions, numbered).outerjoin(
+            numbered,
+            and_(numbered.c.session_id == sessions.c.id, numbered.c.rn <= messages_per_session + 1)
+        ).order_by(sessions.c.last_interaction_date.desc(), sessions.c.id, numbered.c.rn.desc())
+        
         async with AsyncSessionLocal() as db:
-            cutoff_date = datetime.utcnow() - timedelta(days=days_inactive)
-            
-            # Buscar sesiones inactivas
-            query = select(ChatSession).where(
-                and_(
-                    ChatSession.last_interaction_date < cutoff_date,
-                    ChatSession.is_active == True
-                )
-            )
-            
-            result = await db.execute(query)
-            sessions = result.scalars().all()
-            
-            count = 0
-            for session in sessions:
-                session.is_active = False
-                count += 1
-            
-            await db.commit()
-            
-            logger.info(f"Sesiones marcadas como inactivas: {count}")
-            return count
+            rows = (await db.execute(query)).all()
+        
+        result: List[Dict[str, Any]] = []
+        by_session: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            entry = by_session.get(row.id)
+            if entry is None:
+                entry = {
+                    'session_id': row.id,
+                    'agent_name': row.agent_name,
+                    'first_interaction': row.first_interaction_date.isoformat(),
+                    'last_interaction': row.last_interaction_date.isoformat(),
+                    'total_messages': row.total_messages,
+                    'messages': [],
+                    'next_cursor': None
+                }
+                by_session[row.id] = entry
+                result.append(entry)
+            
+            if row.rn is None:
+                continue
+            if row.rn > messages_per_session:
+                entry['has_more'] = True
+                continue
+            entry['messages'].append({
+                'role': row.role,
+                'content': row.content,
+                'timestamp': row.timestamp.isoformat(),
+                'sentiment': row.sentiment,
+                'intent': row.intent,
+                '_cursor': f"{row.timestamp.isoformat()}|{row.message_id}"
+            })
+        
+        for entry in result:
+            # El cursor apunta al mensaje más antiguo de la página
+            if entry.pop('has_more', False) and entry['messages']:
+                entry['next_cursor'] = entry['messages'][0]['_cursor']
+            for message in entry['messages']:
+                message.pop('_cursor')
+        
+        return result
     
     async def get_user_stats(
         self,
@@ -300,24 +758,21 @@ class ChatMemoryService:
             Dict: Estadísticas de uso
         """
         async with AsyncSessionLocal() as db:
-            query = select(ChatSession)
-            
-            if user_id:
-                query = query.where(ChatSession.user_id == user_id)
-            elif visitor_id:
-                query = query.where(ChatSession.visitor_id == visitor_id)
-            
-            result = await db.execute(query)
-            sessions = result.scalars().all()
+            query = select(
+                func.count(ChatSession.id).label('total_sessions'),
+                func.count(ChatSession.id).filter(ChatSession.is_active == True).label('active_sessions'),
+                func.coalesce(func.sum(ChatSession.total_messages), 0).label('total_messages'),
+                func.array_agg(ChatSession.agent_name.distinct()).label('agents_used')
+            )
+            query = self._owner_filter(query, ChatSession, user_id, visitor_id)
             
-            total_messages = sum(s.total_messages for s in sessions)
-            active_sessions = sum(1 for s in sessions if s.is_active)
+            row = (await db.execute(query)).one()
             
             return {
-                'total_sessions': len(sessions),
-                'active_sessions': active_sessions,
-                'total_messages': total_messages,
-                'agents_used': list(set(s.agent_name for s in sessions))
+                'total_sessions': row.total_sessions,
+                'active_sessions': row.active_sessions,
+                'total_messages': int(row.total_messages),
+                'agents_used': [agent for agent in (row.agents_used or []) if agent is not None]
             }
 
 
@@ -0,0 +1,265 @@
+"""
+GuaraniAppStore V2.5 Pro - Chat Retention Engine
+Limpieza de chat_messages por tramos acotados y particiones mensuales opcionales.
+
+Uso manual (el scheduler la ejecuta a diario):
+    python chat_retention.py                 # limpieza normal
+    python chat_retention.py --partition     # migrar chat_messages a particiones mensuales
+"""
+
+import os
+import asyncio
+import logging
+from datetime import datetime, date, timedelta
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy import select, update, delete, and_, text
+
+from models import ChatSession, ChatMessage
+from database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+CHAT_RETENTION_DAYS = int(os.environ.get('CHAT_RETENTION_DAYS', '30'))
+# Filas por tramo de DELETE (una transacción corta por tramo)
+CHAT_RETENTION_BATCH_SIZE = int(os.environ.get('CHAT_RETENTION_BATCH_SIZE', '5000'))
+# Pausa entre tramos para dejar pasar el tráfico y al autovacuum
+CHAT_RETENTION_PAUSE_SECONDS = float(os.environ.get('CHAT_RETENTION_PAUSE_SECONDS', '0.2'))
+# Particiones mensuales creadas por adelantado
+CHAT_PARTITION_MONTHS_AHEAD = int(os.environ.get('CHAT_PARTITION_MONTHS_AHEAD', '2'))
+
+PARTITION_PREFIX = 'chat_messages_p'
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _partition_name(month: date) -> str:
+    return f"{PARTITION_PREFIX}{month.strftime('%Y%m')}"
+
+
+class ChatRetentionEngine:
+    """
+    Retención de mensajes de chat sin DELETE masivos.
+
+    - Tabla normal: borra por tramos de timestamp (índice ix_chat_messages_timestamp),
+      cada tramo en su propia transacción y con pausa entre tramos.
+    - Tabla particionada por mes: crea las particiones futuras y elimina con
+      DROP TABLE las que quedaron completas fuera de la ventana; el mes de corte
+      se limpia por tramos igual que una tabla normal.
+    - Sesiones inactivas: un único UPDATE set-based.
+    """
+
+    def __init__(
+        self,
+        retention_days: int = CHAT_RETENTION_DAYS,
+        batch_size: int = CHAT_RETENTION_BATCH_SIZE,
+        pause_seconds: float = CHAT_RETENTION_PAUSE_SECONDS
+    ):
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    def cutoff(self) -> datetime:
+        return datetime.utcnow() - timedelta(days=self.retention_days)
+
+    # ------------------------------------------------------------------
+    # Particiones
+    # ------------------------------------------------------------------
+
+    async def is_partitioned(self, db) -> bool:
+        return bool(await db.scalar(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = 'chat_messages' AND pg_table_is_visible(c.oid))"
+        )))
+
+    async def _list_partitions(self, db) -> List[str]:
+        result = await db.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'chat_messages'"
+        ))
+        return [row[0] for row in result]
+
+    @staticmethod
+    def _create_partition_sql(month: date) -> str:
+        return (
+            f"CREATE TABLE IF NOT EXISTS {_partition_name(month)} PARTITION OF chat_messages "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')"
+        )
+
+    async def ensure_partitions(self, db) -> List[str]:
+        """Crear la partición del mes actual y las de los próximos meses"""
+        created = []
+        existing = set(await self._list_partitions(db))
+        month = _month_start(datetime.utcnow().date())
+        for _ in range(CHAT_PARTITION_MONTHS_AHEAD + 1):
+            if _partition_name(month) not in existing:
+                await db.execute(text(self._create_partition_sql(month)))
+                created.append(_partition_name(month))
+            month = _next_month(month)
+        await db.commit()
+        return created
+
+    async def drop_expired_partitions(self, db, cutoff: datetime) -> List[str]:
+        """Eliminar particiones cuyo mes completo es anterior al corte"""
+        dropped = []
+        cutoff_month = _month_start(cutoff.date())
+        for name in sorted(await self._list_partitions(db)):
+            suffix = name[len(PARTITION_PREFIX):]
+            if not name.startswith(PARTITION_PREFIX) or not suffix.isdigit():
+                continue
+            month = date(int(suffix[:4]), int(suffix[4:]), 1)
+            if _next_month(month) <= cutoff_month:
+                await db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                await db.commit()
+                dropped.append(name)
+        return dropped
+
+    async def migrate_to_partitions(self) -> Dict[str, Any]:
+        """
+        Convertir chat_messages en tabla particionada por mes (operación única, manual).
+
+        Copia sólo los mensajes dentro de la ventana de retención. La clave primaria
+        pasa a ser (id, timestamp), requisito de PostgreSQL para tablas particionadas.
+        """
+        cutoff = self.cutoff()
+        async with AsyncSessionLocal() as db:
+            if await self.is_partitioned(db):
+                return {'migrated': False, 'reason': 'chat_messages ya está particionada'}
+
+            await db.execute(text("ALTER TABLE chat_messages RENAME TO chat_messages_legacy"))
+            await db.execute(text(
+                "ALTER TABLE chat_messages_legacy RENAME CONSTRAINT chat_messages_pkey TO chat_messages_legacy_pkey"
+            ))
+            await db.execute(text(
+                "CREATE TABLE chat_messages (LIKE chat_messages_legacy INCLUDING DEFAULTS) "
+                "PARTITION BY RANGE (timestamp)"
+            ))
+            await db.execute(text("ALTER TABLE chat_messages ADD PRIMARY KEY (id, timestamp)"))
+            await db.execute(text(
+                "ALTER TABLE chat_messages ADD FOREIGN KEY (session_id) "
+                "REFERENCES chat_sessions(id) ON DELETE CASCADE"
+            ))
+
+            month = _month_start(cutoff.date())
+            last = _month_start(datetime.utcnow().date())
+            for _ in range(CHAT_PARTITION_MONTHS_AHEAD):
+                last = _next_month(last)
+            while month <= last:
+                await db.execute(text(self._create_partition_sql(month)))
+                month = _next_month(month)
+
+            await db.execute(text("DROP INDEX IF EXISTS ix_chat_messages_session_id"))
+            await db.execute(text("DROP INDEX IF EXISTS ix_chat_messages_timestamp"))
+            await db.execute(text("CREATE INDEX ix_chat_messages_session_id ON chat_messages (session_id)"))
+            await db.execute(text("CREATE INDEX ix_chat_messages_timestamp ON chat_messages (timestamp)"))
+
+            result = await db.execute(
+                text("INSERT INTO chat_messages SELECT * FROM chat_messages_legacy WHERE timestamp >= :cutoff"),
+                {'cutoff': cutoff}
+            )
+            copied = result.rowcount
+            await db.execute(text("DROP TABLE chat_messages_legacy"))
+            await db.commit()
+
+        logger.info(f"chat_messages migrada a particiones mensuales: {copied} mensajes copiados")
+        return {'migrated': True, 'messages_copied': copied}
+
+    # ------------------------------------------------------------------
+    # Limpieza
+    # ------------------------------------------------------------------
+
+    async def delete_expired_messages(self, cutoff: Optional[datetime] = None) -> int:
+        """
+        Borrar mensajes anteriores al corte en tramos de batch_size filas.
+
+        Cada tramo se delimita por timestamp (cota superior = timestamp de la fila
+        batch_size más antigua), así el DELETE es un rango sobre el índice y los
+        locks duran sólo lo que dura el tramo.
+        """
+        cutoff = cutoff or self.cutoff()
+        deleted = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                upper = await db.scalar(
+                    select(ChatMessage.timestamp)
+                    .where(ChatMessage.timestamp < cutoff)
+                    .order_by(ChatMessage.timestamp)
+                    .offset(self.batch_size - 1)
+                    .limit(1)
+                )
+                condition = ChatMessage.timestamp <= upper if upper is not None else ChatMessage.timestamp < cutoff
+                result = await db.execute(delete(ChatMessage).where(condition))
+                await db.commit()
+
+            deleted += result.rowcount
+            if upper is None or not result.rowcount:
+                return deleted
+            await asyncio.sleep(self.pause_seconds)
+
+    async def deactivate_inactive_sessions(self, days_inactive: Optional[int] = None) -> int:
+        """Marcar como inactivas las sesiones sin interacción con un único UPDATE"""
+        cutoff = datetime.utcnow() - timedelta(days=days_inactive or self.retention_days)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(ChatSession)
+                .where(and_(
+                    ChatSession.is_active == True,
+                    ChatSession.last_interaction_date < cutoff
+                ))
+                .values(is_active=False)
+            )
+            await db.commit()
+        return result.rowcount
+
+    async def run(self) -> Dict[str, Any]:
+        """Ciclo completo de retención (ejecutado por el scheduler)"""
+        started = datetime.utcnow()
+        cutoff = self.cutoff()
+        created: List[str] = []
+        dropped: List[str] = []
+
+        async with AsyncSessionLocal() as db:
+            partitioned = await self.is_partitioned(db)
+            if partitioned:
+                created = await self.ensure_partitions(db)
+                dropped = await self.drop_expired_partitions(db, cutoff)
+
+        deleted = await self.delete_expired_messages(cutoff)
+        deactivated = await self.deactivate_inactive_sessions()
+
+        self.last_run = {
+            'started_at': started.isoformat(),
+            'duration_seconds': round((datetime.utcnow() - started).total_seconds(), 2),
+            'cutoff': cutoff.isoformat(),
+            'partitioned': partitioned,
+            'partitions_created': created,
+            'partitions_dropped': dropped,
+            'messages_deleted': deleted,
+            'sessions_deactivated': deactivated
+        }
+        logger.info(f"Retención de chat: {self.last_run}")
+        return self.last_run
+
+
+# Instancia global
+chat_retention_engine = ChatRetentionEngine()
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if '--partition' in sys.argv:
+        print(asyncio.run(chat_retention_engine.migrate_to_partitions()))
+    else:
+        print(asyncio.run(chat_retention_engine.run()))
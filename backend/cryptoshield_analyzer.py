@@ -10,12 +10,13 @@ from typing import Dict, List, Optional
 import numpy as np
 
 class CryptoShieldAnalyzer:
-    def __init__(self, etherscan_api_key=None):
+    def __init__(self, etherscan_api_key=None, tx_graph=None):
         """
         Inicializar analizador
         
         Args:
             etherscan_api_key: API key de Etherscan
+            tx_graph: Índice de contrapartes a alimentar con las transacciones obtenidas
         """
         self.etherscan_api_key = etherscan_api_key or os.environ.get('ETHERSCAN_API_KEY')
         
@@ -28,6 +29,8 @@ class CryptoShieldAnalyzer:
         
         # Web3 para conversiones
         self.w3 = Web3()
+        
+        self.tx_graph = tx_graph
     
     def analyze_wallet(self, address: str) -> Dict:
         """
@@ -57,6 +60,10 @@ class CryptoShieldAnalyzer:
             
             tx_count = len(txs) if isinstance(txs, list) else 0
             
+            # Alimentar el índice de contrapartes con la página ya descargada
+            if self.tx_graph is not None and tx_count:
+                self.tx_graph.add_transactions(txs)
+            
             # Análisis de riesgo básico
             risk_factors = []
             risk_score = 0
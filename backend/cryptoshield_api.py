@@ -2,20 +2,18 @@
 API REST endpoints para CryptoShield
 """
 from fastapi import APIRouter, HTTPException
+from pymongo.errors import DuplicateKeyError
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from datetime import datetime, timezone
 
 from cryptoshield_service import CryptoShieldService
+from database_mongo import db as mongo_db
 
 router = APIRouter(prefix="/api/cryptoshield", tags=["cryptoshield"])
 
 # Inicializar servicio
 cryptoshield_service = None
-db_client = None
-db = None
 
 def get_cryptoshield_service():
     global cryptoshield_service
@@ -24,12 +22,110 @@ def get_cryptoshield_service():
     return cryptoshield_service
 
 def get_db():
-    global db_client, db
-    if db_client is None:
-        MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/guarani_appstore')
-        db_client = AsyncIOMotorClient(MONGO_URL)
-        db = db_client.get_database()
-    return db
+    return mongo_db
+
+# Documento de contadores mantenido incrementalmente en cada escaneo
+STATS_DOC_ID = 'global'
+
+SCAN_TYPE_COUNTERS = {
+    'wallet': 'wallet_scans',
+    'transaction': 'transaction_verifications',
+    'contract': 'contract_scans'
+}
+
+RISK_LEVEL_COUNTERS = {
+    'high': 'high_risk_found',
+    'medium': 'medium_risk_found',
+    'low': 'low_risk_found'
+}
+
+def _empty_counters() -> dict:
+    return {
+        'total_scans': 0,
+        **{field: 0 for field in SCAN_TYPE_COUNTERS.values()},
+        **{field: 0 for field in RISK_LEVEL_COUNTERS.values()}
+    }
+
+async def _save_scan(database, result: dict, scan_type: str, address_or_hash: str):
+    """Guardar escaneo con fecha normalizada y actualizar contadores"""
+    await database.cryptoshield_scans.insert_one({
+        **result,
+        'scan_type': scan_type,
+        'address_or_hash': address_or_hash,
+        'scanned_at': datetime.now(timezone.utc)
+    })
+    
+    increments = {'total_scans': 1, SCAN_TYPE_COUNTERS[scan_type]: 1}
+    risk_field = RISK_LEVEL_COUNTERS.get(result.get('risk_level'))
+    if risk_field:
+        increments[risk_field] = 1
+    
+    # Sin upsert: si el documento aún no fue sembrado, la siembra ya cuenta este escaneo
+    await database.cryptoshield_stats.update_one(
+        {'_id': STATS_DOC_ID},
+        {'$inc': increments}
+    )
+
+async def _aggregate_counters(database) -> dict:
+    """Recalcular contadores con una sola agregación $facet"""
+    pipeline = [
+        {'$facet': {
+            'total': [{'$count': 'count'}],
+            'by_type': [{'$group': {'_id': '$scan_type', 'count': {'$sum': 1}}}],
+            'by_risk': [{'$group': {'_id': '$risk_level', 'count': {'$sum': 1}}}]
+        }}
+    ]
+    facets = (await database.cryptoshield_scans.aggregate(pipeline).to_list(length=1))[0]
+    
+    counters = _empty_counters()
+    if facets['total']:
+        counters['total_scans'] = facets['total'][0]['count']
+    for row in facets['by_type']:
+        if row['_id'] in SCAN_TYPE_COUNTERS:
+            counters[SCAN_TYPE_COUNTERS[row['_id']]] = row['count']
+    for row in facets['by_risk']:
+        if row['_id'] in RISK_LEVEL_COUNTERS:
+            counters[RISK_LEVEL_COUNTERS[row['_id']]] = row['count']
+    return counters
+
+async def _seed_counters(database) -> dict:
+    """Crear el documento de contadores desde la agregación si todavía no existe"""
+    counters = await _aggregate_counters(database)
+    try:
+        await database.cryptoshield_stats.insert_one({'_id': STATS_DOC_ID, **counters})
+    except DuplicateKeyError:
+        # Otro worker lo sembró primero; sus contadores ya incluyen los escaneos agregados
+        pass
+    return counters
+
+@router.on_event("startup")
+async def bootstrap_scans_collection():
+    """Normalizar scanned_at y sembrar el documento de contadores (índices en database_mongo)"""
+    try:
+        database = get_db()
+        scans = database.cryptoshield_scans
+        
+        # Escaneos antiguos: derivar scanned_at de analyzed_at / verified_at
+        await scans.update_many(
+            {'scanned_at': {'$exists': False}},
+            [{'$set': {'scanned_at': {'$dateFromString': {
+                'dateString': {'$ifNull': ['$analyzed_at', '$verified_at']},
+                'onError': '$$NOW',
+                'onNull': '$$NOW'
+            }}}}]
+        )
+        
+        # Antes de aceptar escaneos: los $inc de _save_scan nunca crean el documento
+        if await database.cryptoshield_stats.find_one({'_id': STATS_DOC_ID}) is None:
+            await _seed_counters(database)
+    except Exception as e:
+        print(f"⚠️ CryptoShield: no se pudo preparar cryptoshield_scans: {e}")
+
+@router.on_event("shutdown")
+async def flush_tx_graph():
+    """Compactar las aristas pendientes del índice de contrapartes"""
+    if cryptoshield_service is not None:
+        cryptoshield_service.tx_graph.compact()
 
 # Schemas
 class WalletScanResponse(BaseModel):
@@ -98,12 +194,7 @@ async def scan_wallet(address: str):
         result = cryptoshield.scan_wallet(address)
         
         # Guardar en base de datos
-        database = get_db()
-        await database.cryptoshield_scans.insert_one({
-            **result,
-            'scan_type': 'wallet',
-            'address_or_hash': address
-        })
+        await _save_scan(get_db(), result, 'wallet', address)
         
         return result
         
@@ -132,12 +223,7 @@ async def verify_transaction(tx_hash: str):
         result = cryptoshield.verify_transaction(tx_hash)
         
         # Guardar en base de datos
-        database = get_db()
-        await database.cryptoshield_scans.insert_one({
-            **result,
-            'scan_type': 'transaction',
-            'address_or_hash': tx_hash
-        })
+        await _save_scan(get_db(), result, 'transaction', tx_hash)
         
         return result
         
@@ -166,12 +252,7 @@ async def scan_contract(contract_address: str):
         result = cryptoshield.scan_contract(contract_address)
         
         # Guardar en base de datos
-        database = get_db()
-        await database.cryptoshield_scans.insert_one({
-            **result,
-            'scan_type': 'contract',
-            'address_or_hash': contract_address
-        })
+        await _save_scan(get_db(), result, 'contract', contract_address)
         
         return result
         
@@ -202,22 +283,26 @@ async def get_scan_history(
         if scan_type and scan_type in ['wallet', 'transaction', 'contract']:
             query['scan_type'] = scan_type
         
-        # Determinar campo de fecha según scan_type
-        cursor = database.cryptoshield_scans.find(query).sort('analyzed_at', -1).limit(limit)
+        projection = {
+            '_id': 0,
+            'scan_type': 1,
+            'address_or_hash': 1,
+            'risk_level': 1,
+            'risk_score': 1,
+            'scanned_at': 1
+        }
+        cursor = database.cryptoshield_scans.find(query, projection).sort('scanned_at', -1).limit(limit)
         
         results = await cursor.to_list(length=limit)
         
         history = []
         for r in results:
-            # Manejar diferentes campos de fecha
-            scanned_at = r.get('analyzed_at') or r.get('verified_at') or datetime.now().isoformat()
-            
             history.append({
                 'scan_type': r['scan_type'],
                 'address_or_hash': r.get('address_or_hash', 'N/A'),
                 'risk_level': r.get('risk_level', 'unknown'),
                 'risk_score': r.get('risk_score', 0),
-                'scanned_at': scanned_at
+                'scanned_at': r.get('scanned_at') or datetime.now(timezone.utc)
             })
         
         return history
@@ -236,39 +321,15 @@ async def get_stats():
     try:
         database = get_db()
         
-        total_scans = await database.cryptoshield_scans.count_documents({})
+        counters = await database.cryptoshield_stats.find_one({'_id': STATS_DOC_ID}, {'_id': 0})
+        if counters is None:
+            counters = await _seed_counters(database)
         
-        if total_scans == 0:
-            return {
-                'total_scans': 0,
-                'wallet_scans': 0,
-                'transaction_verifications': 0,
-                'contract_scans': 0,
-                'high_risk_found': 0,
-                'medium_risk_found': 0,
-                'low_risk_found': 0
-            }
+        stats = {**_empty_counters(), **counters}
+        total_scans = stats['total_scans']
+        stats['high_risk_percentage'] = round((stats['high_risk_found'] / total_scans) * 100, 2) if total_scans > 0 else 0
         
-        # Contar por tipo
-        wallet_scans = await database.cryptoshield_scans.count_documents({'scan_type': 'wallet'})
-        tx_scans = await database.cryptoshield_scans.count_documents({'scan_type': 'transaction'})
-        contract_scans = await database.cryptoshield_scans.count_documents({'scan_type': 'contract'})
-        
-        # Contar por nivel de riesgo
-        high_risk = await database.cryptoshield_scans.count_documents({'risk_level': 'high'})
-        medium_risk = await database.cryptoshield_scans.count_documents({'risk_level': 'medium'})
-        low_risk = await database.cryptoshield_scans.count_documents({'risk_level': 'low'})
-        
-        return {
-            'total_scans': total_scans,
-            'wallet_scans': wallet_scans,
-            'transaction_verifications': tx_scans,
-            'contract_scans': contract_scans,
-            'high_risk_found': high_risk,
-            'medium_risk_found': medium_risk,
-            'low_risk_found': low_risk,
-            'high_risk_percentage': round((high_risk / total_scans) * 100, 2) if total_scans > 0 else 0
-        }
+        return stats
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -284,5 +345,7 @@ async def health_check():
         "version": "1.0.0",
         "model_loaded": not cryptoshield.use_mock,
         "mode": "MOCK" if cryptoshield.use_mock else "TRAINED",
-        "etherscan_api": "configured" if cryptoshield.analyzer.etherscan else "not_configured"
+        "etherscan_api": "configured" if cryptoshield.analyzer.etherscan else "not_configured",
+        "blocklist": cryptoshield.blocklist.stats(),
+        "tx_graph": cryptoshield.tx_graph.stats()
     }
@@ -0,0 +1,211 @@
+"""
+Índice local de direcciones conocidas como maliciosas para CryptoShield
+Filtro Bloom como pre-chequeo + conjunto ordenado exacto para confirmación
+"""
+import os
+import math
+import time
+import bisect
+import hashlib
+import threading
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ROOT_DIR = Path(__file__).parent
+
+BLOCKLIST_DIR = os.environ.get('CRYPTOSHIELD_BLOCKLIST_DIR', str(ROOT_DIR / 'data' / 'blocklists'))
+BLOCKLIST_REFRESH_SECONDS = int(os.environ.get('CRYPTOSHIELD_BLOCKLIST_REFRESH_SECONDS', '300'))
+BLOOM_FALSE_POSITIVE_RATE = 0.001
+
+BLOCKLIST_FILE_SUFFIXES = ('.txt', '.csv', '.list')
+
+
+def normalize_identifier(value: str) -> Optional[bytes]:
+    """
+    Normalizar una dirección o hash hexadecimal a bytes
+
+    Args:
+        value: Dirección (0x + 40 hex) o hash de transacción (0x + 64 hex)
+
+    Returns:
+        Bytes del identificador o None si el formato no es válido
+    """
+    value = value.strip().lower()
+    if value.startswith('0x'):
+        value = value[2:]
+    if len(value) not in (40, 64):
+        return None
+    try:
+        return bytes.fromhex(value)
+    except ValueError:
+        return None
+
+
+class BloomFilter:
+    """Filtro Bloom de tamaño fijo sobre un bytearray"""
+
+    def __init__(self, capacity: int, false_positive_rate: float = BLOOM_FALSE_POSITIVE_RATE):
+        capacity = max(capacity, 1)
+        self.num_bits = max(int(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2)), 8)
+        self.num_hashes = max(int(round(self.num_bits / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key: bytes) -> Iterable[int]:
+        # Doble hashing (Kirsch-Mitzenmacher) sobre un único digest
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: bytes):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: bytes) -> bool:
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class BlocklistSnapshot:
+    """
+    Vista inmutable del blocklist
+
+    Se construye completa antes de publicarse, por lo que los lectores nunca
+    ven un índice a medio cargar.
+    """
+
+    def __init__(self, entries: Dict[bytes, str], file_mtimes: Dict[str, float]):
+        self.keys: List[bytes] = sorted(entries)
+        self.sources: List[str] = [entries[k] for k in self.keys]
+        self.bloom = BloomFilter(len(self.keys))
+        for key in self.keys:
+            self.bloom.add(key)
+        self.file_mtimes = file_mtimes
+        self.loaded_at = datetime.now(timezone.utc).isoformat()
+
+    def lookup(self, key: bytes) -> Optional[str]:
+        """Retorna la fuente que lista el identificador o None"""
+        if key not in self.bloom:
+            return None
+        idx = bisect.bisect_left(self.keys, key)
+        if idx < len(self.keys) and self.keys[idx] == key:
+            return self.sources[idx]
+        return None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class CryptoShieldBlocklist:
+    def __init__(self, directory: str = BLOCKLIST_DIR, refresh_seconds: int = BLOCKLIST_REFRESH_SECONDS):
+        """
+        Inicializar blocklist
+
+        Args:
+            directory: Carpeta con listas de direcciones (una por línea)
+            refresh_seconds: Intervalo mínimo entre chequeos de cambios en disco
+        """
+        self.directory = Path(directory)
+        self.refresh_seconds = refresh_seconds
+        self._snapshot = BlocklistSnapshot({}, {})
+        self._refresh_lock = threading.Lock()
+        self._last_check = 0.0
+        self.refresh()
+
+    @property
+    def snapshot(self) -> BlocklistSnapshot:
+        return self._snapshot
+
+    def _list_files(self) -> Dict[str, float]:
+        if not self.directory.is_dir():
+            return {}
+        return {
+            str(path): path.stat().st_mtime
+            for path in sorted(self.directory.iterdir())
+            if path.is_file() and path.suffix.lower() in BLOCKLIST_FILE_SUFFIXES
+        }
+
+    @staticmethod
+    def _parse_file(path: str) -> Iterable[bytes]:
+        """Leer identificadores de un archivo (texto plano o CSV, primera columna)"""
+        with open(path, 'r', encoding='utf-8', errors='ignore') as fh:
+            for line in fh:
+                line = line.split('#', 1)[0].strip()
+                if not line:
+                    continue
+                key = normalize_identifier(line.split(',', 1)[0])
+                if key is not None:
+                    yield key
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Recargar las listas desde disco si cambiaron
+
+        El nuevo snapshot se construye fuera de la vista de los lectores y se
+        publica con una sola asignación de referencia.
+
+        Args:
+            force: Recargar aunque no haya cambios
+
+        Returns:
+            True si se publicó un snapshot nuevo
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return False  # Otra recarga en curso
+
+        try:
+            self._last_check = time.monotonic()
+            file_mtimes = self._list_files()
+            if not force and file_mtimes == self._snapshot.file_mtimes:
+                return False
+
+            entries: Dict[bytes, str] = {}
+            for path in file_mtimes:
+                source = Path(path).stem
+                try:
+                    for key in self._parse_file(path):
+                        entries.setdefault(key, source)
+                except OSError as e:
+                    print(f"⚠️ No se pudo leer blocklist {path}: {e}")
+
+            self._snapshot = BlocklistSnapshot(entries, file_mtimes)
+            print(f"✅ CryptoShield blocklist cargado: {len(entries):,} direcciones de {len(file_mtimes)} archivos")
+            return True
+        finally:
+            self._refresh_lock.release()
+
+    def _maybe_refresh(self):
+        """Lanzar una recarga en segundo plano si venció el intervalo"""
+        if time.monotonic() - self._last_check < self.refresh_seconds:
+            return
+        self._last_check = time.monotonic()
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def check(self, identifier: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verificar si una dirección o hash está en el blocklist
+
+        Args:
+            identifier: Dirección o hash de transacción
+
+        Returns:
+            (is_listed, source)
+        """
+        self._maybe_refresh()
+        key = normalize_identifier(identifier)
+        if key is None:
+            return False, None
+        source = self._snapshot.lookup(key)
+        return source is not None, source
+
+    def stats(self) -> Dict:
+        snapshot = self._snapshot
+        return {
+            'entries': len(snapshot),
+            'files': len(snapshot.file_mtimes),
+            'bloom_bits': snapshot.bloom.num_bits,
+            'bloom_hashes': snapshot.bloom.num_hashes,
+            'loaded_at': snapshot.loaded_at
+        }
@@ -0,0 +1,426 @@
+"""
+Índice de contrapartes (grafo de transacciones) para CryptoShield
+Adyacencia en formato CSR sobre disco para puntuar exposición a k saltos
+"""
+import os
+import shutil
+import threading
+from pathlib import Path
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set
+import numpy as np
+
+from cryptoshield_blocklist import normalize_identifier
+
+ROOT_DIR = Path(__file__).parent
+
+GRAPH_DIR = os.environ.get('CRYPTOSHIELD_GRAPH_DIR', str(ROOT_DIR / 'data' / 'tx_graph'))
+# Aristas acumuladas en memoria antes de compactar a disco
+GRAPH_MAX_BUFFER_EDGES = int(os.environ.get('CRYPTOSHIELD_GRAPH_MAX_BUFFER_EDGES', '200000'))
+# Aristas del CSR en disco procesadas por bloque durante la compactación
+GRAPH_COMPACT_CHUNK_EDGES = int(os.environ.get('CRYPTOSHIELD_GRAPH_COMPACT_CHUNK_EDGES', '1000000'))
+
+ADDRESS_DTYPE = 'S20'
+ADDRESS_BYTES = 20
+
+
+class CSRGraph:
+    """
+    Snapshot inmutable de la adyacencia
+
+    nodes:   direcciones ordenadas (S20), el índice es el id del nodo
+    indptr:  offsets por nodo dentro de indices (int64, len = n + 1)
+    indices: ids de contrapartes, ordenados por nodo (int32)
+
+    Los arrays se abren con mmap, por lo que el costo en memoria residente
+    depende sólo de las páginas tocadas por las consultas.
+    """
+
+    def __init__(self, nodes: np.ndarray, indptr: np.ndarray, indices: np.ndarray):
+        self.nodes = nodes
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def empty(cls) -> 'CSRGraph':
+        return cls(
+            np.empty(0, dtype=ADDRESS_DTYPE),
+            np.zeros(1, dtype=np.int64),
+            np.empty(0, dtype=np.int32)
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> 'CSRGraph':
+        return cls(
+            np.load(path / 'nodes.npy', mmap_mode='r'),
+            np.load(path / 'indptr.npy', mmap_mode='r'),
+            np.load(path / 'indices.npy', mmap_mode='r')
+        )
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.indices)
+
+    def node_id(self, address: bytes) -> Optional[int]:
+        if not len(self.nodes):
+            return None
+        idx = int(np.searchsorted(self.nodes, np.bytes_(address)))
+        if idx < len(self.nodes) and self.nodes[idx] == np.bytes_(address):
+            return idx
+        return None
+
+    def address(self, node_id: int) -> bytes:
+        # numpy recorta los bytes nulos finales de los tipos S
+        return bytes(self.nodes[node_id]).ljust(ADDRESS_BYTES, b'\x00')
+
+    def neighbors(self, node_id: int, limit: int) -> np.ndarray:
+        start = int(self.indptr[node_id])
+        end = min(int(self.indptr[node_id + 1]), start + limit)
+        return self.indices[start:end]
+
+
+class CryptoShieldTxGraph:
+    def __init__(self, directory: str = GRAPH_DIR, max_buffer_edges: int = GRAPH_MAX_BUFFER_EDGES):
+        """
+        Inicializar índice de contrapartes
+
+        Args:
+            directory: Carpeta donde se guardan las versiones CSR
+            max_buffer_edges: Aristas nuevas retenidas en memoria antes de compactar
+        """
+        self.directory = Path(directory)
+        self.max_buffer_edges = max_buffer_edges
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._buffer: Dict[bytes, Set[bytes]] = defaultdict(set)
+        self._buffer_edges = 0
+        # Buffer que se está compactando: sigue visible para las consultas
+        self._compacting: Dict[bytes, Set[bytes]] = {}
+        self._graph = self._load_current()
+
+    # ------------------------------------------------------------------
+    # Persistencia
+    # ------------------------------------------------------------------
+
+    def _load_current(self) -> CSRGraph:
+        pointer = self.directory / 'CURRENT'
+        try:
+            version = pointer.read_text().strip()
+            graph = CSRGraph.load(self.directory / version)
+            print(f"✅ Grafo CryptoShield cargado: {graph.num_nodes:,} nodos, {graph.num_edges:,} aristas")
+            return graph
+        except (OSError, ValueError):
+            return CSRGraph.empty()
+
+    def _new_version(self) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        target = self.directory / f"v{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S%f')}"
+        target.mkdir()
+        return target
+
+    def _publish(self, target: Path):
+        """Mover el puntero CURRENT atómicamente a una versión ya escrita"""
+        version = target.name
+        tmp_pointer = self.directory / 'CURRENT.tmp'
+        tmp_pointer.write_text(version)
+        os.replace(tmp_pointer, self.directory / 'CURRENT')
+
+        previous = self._graph
+        self._graph = CSRGraph.load(target)
+        del previous
+
+        # Limpiar versiones antiguas (los lectores con mmap abierto conservan sus páginas)
+        for old in self.directory.glob('v*'):
+            if old.is_dir() and old.name != version:
+                shutil.rmtree(old, ignore_errors=True)
+
+    # ------------------------------------------------------------------
+    # Ingesta incremental
+    # ------------------------------------------------------------------
+
+    def add_transactions(self, txs: Iterable[Dict]) -> int:
+        """
+        Agregar aristas desde una página de transacciones ya obtenida de Etherscan
+
+        Args:
+            txs: Lista de transacciones con campos 'from' y 'to'
+
+        Returns:
+            Número de aristas nuevas en el buffer
+        """
+        added = 0
+        with self._lock:
+            for tx in txs:
+                src = normalize_identifier(tx.get('from') or '')
+                dst = normalize_identifier(tx.get('to') or '')
+                if src is None or dst is None or src == dst:
+                    continue
+                if dst not in self._buffer[src]:
+                    self._buffer[src].add(dst)
+                    self._buffer[dst].add(src)
+                    added += 1
+            self._buffer_edges += added
+            should_compact = self._buffer_edges >= self.max_buffer_edges
+
+        if should_compact:
+            threading.Thread(target=self.compact, daemon=True).start()
+        return added
+
+    def compact(self) -> bool:
+        """
+        Fusionar el buffer en memoria con el CSR en disco
+
+        Merge en streaming: el CSR anterior se recorre por bloques de
+        GRAPH_COMPACT_CHUNK_EDGES aristas (vía mmap) y cada arista se escribe
+        directamente en su posición final de la nueva versión. La memoria
+        usada es O(buffer + bloque), independiente del tamaño del grafo. Las
+        consultas siguen usando el snapshot anterior hasta que se publica el nuevo.
+
+        Returns:
+            True si se publicó una nueva versión
+        """
+        if not self._compact_lock.acquire(blocking=False):
+            return False
+
+        try:
+            with self._lock:
+                if not self._buffer_edges:
+                    return False
+                buffer = self._buffer
+                self._compacting = buffer
+                self._buffer = defaultdict(set)
+                self._buffer_edges = 0
+
+            target = self._new_version()
+            try:
+                n, num_edges = self._merge(self._graph, buffer, target)
+            except Exception:
+                shutil.rmtree(target, ignore_errors=True)
+                with self._lock:
+                    # Devolver las aristas al buffer para el próximo intento
+                    for src, dsts in buffer.items():
+                        self._buffer[src] |= dsts
+                    self._buffer_edges += sum(len(d) for d in buffer.values()) // 2
+                    self._compacting = {}
+                raise
+
+            self._publish(target)
+            with self._lock:
+                self._compacting = {}
+            print(f"✅ Grafo CryptoShield compactado: {n:,} nodos, {num_edges:,} aristas")
+            return True
+        finally:
+            self._compact_lock.release()
+
+    def _merge(self, old: CSRGraph, buffer: Dict[bytes, Set[bytes]], target: Path):
+        """
+        Escribir en target el CSR resultante de old + buffer
+
+        Los ids nuevos se derivan sin materializar el grafo: el id de una
+        dirección es (#nodos antiguos menores) + (#nodos nuevos menores), y
+        las filas están ordenadas por destino, así que la posición final de
+        cada arista es su rango en el orden (origen, destino) de la unión.
+
+        Returns:
+            (nodos, aristas) de la nueva versión
+        """
+        chunk = max(GRAPH_COMPACT_CHUNK_EDGES, 1)
+        old_nodes, old_indptr, old_indices = old.nodes, old.indptr, old.indices
+        num_old = old.num_nodes
+
+        def lookup(addresses: np.ndarray):
+            # Posición en old_nodes (= #nodos antiguos menores) y si ya existía
+            at = np.searchsorted(old_nodes, addresses).astype(np.int64)
+            found = at < num_old
+            found[found] = old_nodes[at[found]] == addresses[found]
+            return at, found
+
+        src_list: List[bytes] = []
+        dst_list: List[bytes] = []
+        for src, dsts in buffer.items():
+            src_list.extend([src] * len(dsts))
+            dst_list.extend(dsts)
+        buf_src = np.array(src_list, dtype=ADDRESS_DTYPE)
+        buf_dst = np.array(dst_list, dtype=ADDRESS_DTYPE)
+        del src_list, dst_list
+
+        # Nodos que no están en la versión anterior, con su id en la nueva
+        buf_nodes = np.unique(np.concatenate([buf_src, buf_dst]))
+        at, found = lookup(buf_nodes)
+        new_only = buf_nodes[~found]
+        insert_at = at[~found]
+        new_ids = insert_at + np.arange(len(new_only), dtype=np.int64)
+        n = num_old + len(new_only)
+        del buf_nodes, at, found
+
+        def remap(old_ids: np.ndarray) -> np.ndarray:
+            return old_ids + np.searchsorted(insert_at, old_ids, side='right')
+
+        def old_below(ids: np.ndarray) -> np.ndarray:
+            # Nodos antiguos con id nuevo menor que ids
+            return ids - np.searchsorted(new_ids, ids)
+
+        src_old, src_known = lookup(buf_src)
+        dst_old, dst_known = lookup(buf_dst)
+        src_new = src_old + np.searchsorted(new_only, buf_src)
+        dst_new = dst_old + np.searchsorted(new_only, buf_dst)
+        del buf_src, buf_dst
+
+        # Descartar aristas que ya están en el CSR (búsqueda binaria en la fila)
+        keep = np.ones(len(src_new), dtype=bool)
+        candidates = np.flatnonzero(src_known & dst_known)
+        for row, edges in self._group_by(src_old, candidates):
+            neighbors = old_indices[int(old_indptr[row]):int(old_indptr[row + 1])]
+            pos = np.searchsorted(neighbors, dst_old[edges])
+            hit = pos < len(neighbors)
+            hit[hit] = neighbors[pos[hit]] == dst_old[edges[hit]]
+            keep[edges[hit]] = False
+
+        buf_keys = np.sort(src_new[keep] * n + dst_new[keep])
+        del src_old, dst_old, src_new, dst_new, src_known, dst_known, keep, candidates
+        num_edges = old.num_edges + len(buf_keys)
+
+        nodes_out = np.lib.format.open_memmap(target / 'nodes.npy', mode='w+', dtype=ADDRESS_DTYPE, shape=(n,))
+        indptr_out = np.lib.format.open_memmap(target / 'indptr.npy', mode='w+', dtype=np.int64, shape=(n + 1,))
+        indices_out = np.lib.format.open_memmap(target / 'indices.npy', mode='w+', dtype=np.int32, shape=(num_edges,))
+
+        # Inicio de fila = aristas antiguas en filas previas + aristas del buffer con origen menor
+        nodes_out[new_ids] = new_only
+        indptr_out[new_ids] = np.asarray(old_indptr[old_below(new_ids)]) + np.searchsorted(buf_keys, new_ids * n)
+        for start in range(0, num_old, chunk):
+            stop = min(start + chunk, num_old)
+            ids = remap(np.arange(start, stop, dtype=np.int64))
+            nodes_out[ids] = old_nodes[start:stop]
+            indptr_out[ids] = np.asarray(old_indptr[start:stop]) + np.searchsorted(buf_keys, ids * n)
+        indptr_out[n] = num_edges
+
+        # Aristas antiguas: posición = índice antiguo + aristas del buffer con clave menor
+        for start in range(0, old.num_edges, chunk):
+            stop = min(start + chunk, old.num_edges)
+            edge_ids = np.arange(start, stop, dtype=np.int64)
+            rows = remap(np.searchsorted(old_indptr, edge_ids, side='right') - 1)
+            dsts = remap(np.asarray(old_indices[start:stop], dtype=np.int64))
+            indices_out[edge_ids + np.searchsorted(buf_keys, rows * n + dsts)] = dsts
+
+        # Aristas del buffer: posición = rango en el buffer + aristas antiguas con clave menor
+        if len(buf_keys):
+            rows, dsts = buf_keys // n, buf_keys % n
+            row_old = old_below(rows)
+            older = np.asarray(old_indptr[row_old])
+            row_is_old = ~np.isin(rows, new_ids)
+            dst_bound = old_below(dsts)
+            for row, edges in self._group_by(row_old, np.flatnonzero(row_is_old)):
+                neighbors = old_indices[int(old_indptr[row]):int(old_indptr[row + 1])]
+                older[edges] += np.searchsorted(neighbors, dst_bound[edges])
+            indices_out[np.arange(len(buf_keys), dtype=np.int64) + older] = dsts
+
+        for array in (nodes_out, indptr_out, indices_out):
+            array.flush()
+        del nodes_out, indptr_out, indices_out
+        return n, num_edges
+
+    @staticmethod
+    def _group_by(keys: np.ndarray, selected: np.ndarray):
+        """Iterar (clave, posiciones) de los elementos seleccionados agrupados por clave"""
+        if not len(selected):
+            return
+        order = selected[np.argsort(keys[selected], kind='stable')]
+        values, starts = np.unique(keys[order], return_index=True)
+        bounds = np.append(starts, len(order))
+        for value, lo, hi in zip(values, bounds[:-1], bounds[1:]):
+            yield int(value), order[lo:hi]
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def _counterparties(self, address: bytes, limit: int) -> List[bytes]:
+        graph = self._graph
+        result: List[bytes] = []
+
+        node_id = graph.node_id(address)
+        if node_id is not None:
+            result.extend(graph.address(int(i)) for i in graph.neighbors(node_id, limit))
+
+        with self._lock:
+            for buffer in (self._compacting, self._buffer):
+                buffered = buffer.get(address)
+                if buffered:
+                    result.extend(list(buffered)[:max(limit - len(result), 0)])
+
+        return result
+
+    def exposure_score(
+        self,
+        address: str,
+        blocklist,
+        max_hops: int = 2,
+        decay: float = 0.5,
+        max_neighbors: int = 500,
+        max_visited: int = 20000
+    ) -> Dict:
+        """
+        Calcular exposición a direcciones conocidas como maliciosas
+
+        BFS acotado sobre el índice local, sin llamadas nuevas a la API.
+
+        Args:
+            address: Dirección analizada
+            blocklist: CryptoShieldBlocklist con las direcciones marcadas
+            max_hops: Profundidad máxima (k)
+            decay: Peso multiplicativo por salto
+            max_neighbors: Contrapartes exploradas por nodo
+            max_visited: Tope de nodos visitados
+
+        Returns:
+            Dict con score (0-100) y contrapartes marcadas por salto
+        """
+        origin = normalize_identifier(address)
+        if origin is None:
+            return {'exposure_score': 0, 'flagged_counterparties': []}
+
+        snapshot = blocklist.snapshot
+        visited = {origin}
+        frontier = [origin]
+        flagged = []
+        score = 0.0
+
+        for hop in range(1, max_hops + 1):
+            next_frontier = []
+            for node in frontier:
+                for counterparty in self._counterparties(node, max_neighbors):
+                    if counterparty in visited:
+                        continue
+                    visited.add(counterparty)
+                    source = snapshot.lookup(counterparty)
+                    if source:
+                        flagged.append({'address': '0x' + counterparty.hex(), 'hops': hop, 'source': source})
+                        score += 100 * decay ** (hop - 1)
+                    else:
+                        next_frontier.append(counterparty)
+                    if len(visited) >= max_visited:
+                        break
+                if len(visited) >= max_visited:
+                    break
+            frontier = next_frontier
+            if not frontier or len(visited) >= max_visited:
+                break
+
+        return {
+            'exposure_score': int(min(score, 100)),
+            'flagged_counterparties': flagged[:20],
+            'nodes_visited': len(visited)
+        }
+
+    def stats(self) -> Dict:
+        graph = self._graph
+        return {
+            'nodes': graph.num_nodes,
+            'edges': graph.num_edges,
+            'buffered_edges': self._buffer_edges
+        }
@@ -9,6 +9,8 @@ from typing import Dict, Optional
 import joblib
 
 from cryptoshield_analyzer import CryptoShieldAnalyzer
+from cryptoshield_blocklist import CryptoShieldBlocklist
+from cryptoshield_graph import CryptoShieldTxGraph
 
 class CryptoShieldService:
     def __init__(self, model_path=None, use_mock=True):
@@ -33,9 +35,15 @@ class CryptoShieldService:
             print("   Para entrenar el modelo, ejecuta: python train_cryptoshield_model.py")
             self.use_mock = True
         
+        # Blocklist local de direcciones conocidas (scam/phishing)
+        self.blocklist = CryptoShieldBlocklist()
+        
+        # Índice de contrapartes para propagar riesgo
+        self.tx_graph = CryptoShieldTxGraph()
+        
         # Inicializar analizador de blockchain
         etherscan_api_key = os.environ.get('ETHERSCAN_API_KEY')
-        self.analyzer = CryptoShieldAnalyzer(etherscan_api_key)
+        self.analyzer = CryptoShieldAnalyzer(etherscan_api_key, tx_graph=self.tx_graph)
     
     def scan_wallet(self, address: str) -> Dict:
         """
@@ -49,6 +57,10 @@ class CryptoShieldService:
         """
         print(f"\n🔍 Escaneando wallet: {address}")
         
+        blocklisted = self._check_blocklist('wallet', address)
+        if blocklisted:
+            return blocklisted
+        
         # Análisis básico de la wallet
         wallet_analysis = self.analyzer.analyze_wallet(address)
         
@@ -65,6 +77,9 @@ class CryptoShieldService:
             wallet_analysis['fraud_score'] = fraud_score
             wallet_analysis['reconstruction_error'] = reconstruction_error
         
+        # Exposición a contrapartes marcadas (k saltos, sin llamadas a la API)
+        self._apply_counterparty_exposure(wallet_analysis, address)
+        
         # Agregar recomendaciones
         wallet_analysis['recommendations'] = self._generate_recommendations(wallet_analysis)
         wallet_analysis['scan_type'] = 'wallet'
@@ -87,6 +102,10 @@ class CryptoShieldService:
         """
         print(f"\n🔍 Verificando transacción: {tx_hash}")
         
+        blocklisted = self._check_blocklist('transaction', tx_hash)
+        if blocklisted:
+            return blocklisted
+        
         tx_analysis = self.analyzer.verify_transaction(tx_hash)
         
         # Agregar recomendaciones
@@ -111,6 +130,10 @@ class CryptoShieldService:
         """
         print(f"\n🔍 Escaneando contrato: {contract_address}")
         
+        blocklisted = self._check_blocklist('contract', contract_address)
+        if blocklisted:
+            return blocklisted
+        
         contract_analysis = self.analyzer.analyze_contract(contract_address)
         
         # Agregar recomendaciones
@@ -123,6 +146,91 @@ class CryptoShieldService:
         
         return contract_analysis
     
+    def _apply_counterparty_exposure(self, analysis: Dict, address: str):
+        """
+        Ajustar el riesgo según la exposición a contrapartes del blocklist
+        
+        Args:
+            analysis: Resultado de analyze_wallet (se modifica in place)
+            address: Dirección analizada
+        """
+        exposure = self.tx_graph.exposure_score(address, self.blocklist)
+        analysis['counterparty_exposure'] = exposure
+        
+        exposure_score = exposure['exposure_score']
+        if exposure_score == 0:
+            return
+        
+        direct = sum(1 for c in exposure['flagged_counterparties'] if c['hops'] == 1)
+        if direct:
+            analysis['risk_factors'].append(f"Transacted directly with {direct} flagged address(es)")
+        else:
+            analysis['risk_factors'].append("Indirect exposure to flagged addresses")
+        
+        risk_score = min(analysis.get('risk_score', 0) + exposure_score // 2, 100)
+        analysis['risk_score'] = risk_score
+        if risk_score >= 50:
+            analysis['risk_level'] = 'high'
+        elif risk_score >= 25 and analysis.get('risk_level') == 'low':
+            analysis['risk_level'] = 'medium'
+    
+    def _check_blocklist(self, scan_type: str, identifier: str) -> Optional[Dict]:
+        """
+        Pre-chequeo contra el blocklist local (sin llamadas a Etherscan)
+        
+        Args:
+            scan_type: wallet / transaction / contract
+            identifier: Dirección o hash de transacción
+        
+        Returns:
+            Resultado de alto riesgo si está listado, None en caso contrario
+        """
+        is_listed, source = self.blocklist.check(identifier)
+        if not is_listed:
+            return None
+        
+        now = datetime.now(timezone.utc).isoformat()
+        risk_factors = [f"Address listed in known-bad list: {source}"]
+        
+        if scan_type == 'wallet':
+            result = {
+                'address': identifier,
+                'balance_eth': 0.0,
+                'transaction_count': 0,
+                'is_contract': False,
+                'analyzed_at': now
+            }
+        elif scan_type == 'transaction':
+            result = {
+                'tx_hash': identifier,
+                'status': 'blocklisted',
+                'is_success': False,
+                'verified_at': now
+            }
+        else:
+            result = {
+                'contract_address': identifier,
+                'is_contract': True,
+                'is_verified': False,
+                'analyzed_at': now
+            }
+        
+        result.update({
+            'risk_score': 100,
+            'risk_level': 'high',
+            'risk_factors': risk_factors,
+            'blocklisted': True,
+            'blocklist_source': source
+        })
+        result['recommendations'] = self._generate_recommendations(result)
+        result['scan_type'] = scan_type
+        result['model_version'] = 'Blocklist'
+        result['is_mock'] = False
+        
+        print(f"🚫 Blocklist hit ({source}) - Risk Level: HIGH")
+        
+        return result
+    
     def _extract_features_from_wallet(self, wallet_data: Dict) -> np.ndarray:
         """
         Extraer features para el modelo Autoencoder
@@ -1,4 +1,8 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, monitoring
+from collections import defaultdict, deque
+import threading
+import logging
 import os
 from dotenv import load_dotenv
 from pathlib import Path
@@ -6,12 +10,88 @@ from pathlib import Path
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+logger = logging.getLogger(__name__)
+
 # MongoDB connection
 MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/guarani_appstore')
-DB_NAME = os.environ.get('DB_NAME', 'guarani_appstore')
 
-# Create MongoDB client
-client = AsyncIOMotorClient(MONGO_URL)
+# Pool compartido por la API, los routers de Suite Crypto y los bots del mismo proceso
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '50'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '5'))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '60000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+
+# Retención de documentos de análisis crudos (señales, sentimiento)
+MONGO_ANALYSIS_TTL_DAYS = int(os.environ.get('MONGO_ANALYSIS_TTL_DAYS', '90'))
+
+
+class CollectionLatencyListener(monitoring.CommandListener):
+    """Registra la latencia de cada comando agrupada por colección"""
+
+    WINDOW = 512
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._samples = defaultdict(lambda: deque(maxlen=self.WINDOW))
+        self._counts = defaultdict(int)
+        self._failures = defaultdict(int)
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if isinstance(collection, str):
+            with self._lock:
+                self._pending[event.request_id] = f'{collection}.{event.command_name}'
+
+    def _finish(self, event, failed: bool):
+        with self._lock:
+            key = self._pending.pop(event.request_id, None)
+            if key is None:
+                return
+            self._samples[key].append(event.duration_micros / 1000)
+            self._counts[key] += 1
+            if failed:
+                self._failures[key] += 1
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def snapshot(self) -> dict:
+        """Percentiles sobre la ventana reciente de cada colección.comando"""
+        with self._lock:
+            items = {key: sorted(samples) for key, samples in self._samples.items()}
+            counts = dict(self._counts)
+            failures = dict(self._failures)
+
+        metrics = {}
+        for key, samples in items.items():
+            if not samples:
+                continue
+            metrics[key] = {
+                'count': counts.get(key, 0),
+                'failures': failures.get(key, 0),
+                'p50_ms': round(samples[len(samples) // 2], 2),
+                'p95_ms': round(samples[min(int(len(samples) * 0.95), len(samples) - 1)], 2),
+                'max_ms': round(samples[-1], 2)
+            }
+        return metrics
+
+
+latency_listener = CollectionLatencyListener()
+
+# Create MongoDB client (único por proceso)
+client = AsyncIOMotorClient(
+    MONGO_URL,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    event_listeners=[latency_listener]
+)
+DB_NAME = os.environ.get('DB_NAME') or client.get_default_database(default='guarani_appstore').name
 db = client[DB_NAME]
 
 # Collections
@@ -25,6 +105,63 @@ blog_posts_collection = db['blog_posts']
 password_resets_collection = db['password_resets']
 payments_collection = db['payments']
 
+ANALYSIS_TTL_SECONDS = MONGO_ANALYSIS_TTL_DAYS * 86400
+
+# Índices por colección (creados en el arranque de la API y de los bots)
+INDEXES = {
+    'momentum_signals': [
+        IndexModel([('symbol', ASCENDING), ('predicted_at', DESCENDING)]),
+        IndexModel([('predicted_at', DESCENDING)]),
+        IndexModel([('requested_by_chat_id', ASCENDING), ('predicted_at', DESCENDING)], sparse=True),
+        IndexModel([('created_at', ASCENDING)], expireAfterSeconds=ANALYSIS_TTL_SECONDS),
+    ],
+    'pulse_sentiment_analysis': [
+        IndexModel([('symbol', ASCENDING), ('analyzed_at', DESCENDING)]),
+        IndexModel([('created_at', ASCENDING)], expireAfterSeconds=ANALYSIS_TTL_SECONDS),
+    ],
+    'cryptoshield_scans': [
+        IndexModel([('scanned_at', DESCENDING)]),
+        IndexModel([('scan_type', ASCENDING), ('scanned_at', DESCENDING)]),
+        IndexModel([('address_or_hash', ASCENDING), ('scanned_at', DESCENDING)]),
+    ],
+    'momentum_subscriptions': [
+        IndexModel([('telegram_chat_id', ASCENDING)], unique=True),
+    ],
+    'pulse_subscriptions': [
+        IndexModel([('telegram_chat_id', ASCENDING)], unique=True),
+    ],
+    'users': [
+        IndexModel([('email', ASCENDING)]),
+        # Paginación por cursor del panel admin (respaldo de /admin/users)
+        IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ],
+    'llm_response_cache': [
+        IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0),
+    ],
+}
+
+
+async def ensure_indexes():
+    """Crear los índices declarados en INDEXES (idempotente)"""
+    for collection_name, indexes in INDEXES.items():
+        try:
+            await db[collection_name].create_indexes(indexes)
+        except Exception as e:
+            logger.warning(f'⚠️ Mongo indexes for {collection_name} not created: {e}')
+
+
+def get_latency_metrics() -> dict:
+    """Métricas de latencia por colección y configuración del pool"""
+    return {
+        'pool': {
+            'max_pool_size': MONGO_MAX_POOL_SIZE,
+            'min_pool_size': MONGO_MIN_POOL_SIZE,
+            'max_idle_time_ms': MONGO_MAX_IDLE_TIME_MS
+        },
+        'collections': latency_listener.snapshot()
+    }
+
+
 # Dependency for FastAPI
 async def get_db():
     return db
@@ -0,0 +1,167 @@
+"""
+GuaraniAppStore V2.5 Pro - Datastore Router
+Circuit breaker de PostgreSQL para los endpoints con respaldo en MongoDB.
+
+Una tarea en segundo plano sondea PostgreSQL (SELECT 1 con timeout corto).
+Mientras el circuito está abierto las requests van directo a MongoDB, sin
+esperar el timeout de conexión de cada una. Uso en un endpoint:
+
+    try:
+        datastore_router.ensure_postgres()
+        ...consulta PostgreSQL...
+    except Exception as pg_error:
+        datastore_router.record_failure(pg_error)
+        ...respaldo MongoDB...
+"""
+
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, InterfaceError, DisconnectionError, TimeoutError as PoolTimeoutError
+
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+# Fallas de conexión (entre dos sondeos exitosos) que abren el circuito
+DATASTORE_FAILURE_THRESHOLD = int(os.environ.get('DATASTORE_FAILURE_THRESHOLD', '3'))
+DATASTORE_PROBE_SECONDS = float(os.environ.get('DATASTORE_PROBE_SECONDS', '5'))
+DATASTORE_PROBE_TIMEOUT_SECONDS = float(os.environ.get('DATASTORE_PROBE_TIMEOUT_SECONDS', '2'))
+
+# Errores que indican que PostgreSQL no está disponible (no errores de la consulta)
+CONNECTIVITY_ERRORS = (
+    OperationalError, InterfaceError, DisconnectionError, PoolTimeoutError,
+    OSError, asyncio.TimeoutError
+)
+
+CLOSED = 'closed'
+OPEN = 'open'
+
+
+class PostgresUnavailable(Exception):
+    """El circuito está abierto: usar el respaldo sin intentar PostgreSQL"""
+
+
+class DatastoreRouter:
+    """
+    closed: las requests usan PostgreSQL; DATASTORE_FAILURE_THRESHOLD fallas de
+    conexión seguidas (o un sondeo fallido) abren el circuito.
+    open: las requests van directo a MongoDB; el primer sondeo exitoso lo cierra.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = DATASTORE_FAILURE_THRESHOLD,
+        probe_seconds: float = DATASTORE_PROBE_SECONDS,
+        probe_timeout: float = DATASTORE_PROBE_TIMEOUT_SECONDS
+    ):
+        self.failure_threshold = failure_threshold
+        self.probe_seconds = probe_seconds
+        self.probe_timeout = probe_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self.last_probe_at: Optional[datetime] = None
+        self.last_probe_ms: Optional[float] = None
+        self.opens = 0
+        self.short_circuited = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def postgres_available(self) -> bool:
+        return self.state == CLOSED
+
+    def ensure_postgres(self):
+        """Lanzar PostgresUnavailable si el circuito está abierto"""
+        if self.state == OPEN:
+            self.short_circuited += 1
+            raise PostgresUnavailable('PostgreSQL circuit open')
+
+    def _open(self, error: str):
+        self.last_error = error
+        if self.state == OPEN:
+            return
+        self.state = OPEN
+        self.opened_at = datetime.utcnow()
+        self.opens += 1
+        logger.warning(f"⚠️ Circuito de PostgreSQL abierto, usando MongoDB: {error}")
+
+    def _close(self):
+        self.consecutive_failures = 0
+        if self.state == CLOSED:
+            return
+        down_for = (datetime.utcnow() - self.opened_at).total_seconds() if self.opened_at else 0
+        self.state = CLOSED
+        self.opened_at = None
+        logger.info(f"✅ Circuito de PostgreSQL cerrado tras {down_for:.0f}s")
+
+    def record_failure(self, error: BaseException):
+        """Contabilizar el error de una request; sólo cuentan los de conexión"""
+        if isinstance(error, PostgresUnavailable) or not isinstance(error, CONNECTIVITY_ERRORS):
+            return
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.failure_threshold:
+            self._open(f"{type(error).__name__}: {error}")
+
+    def mark_down(self, error: BaseException):
+        """Abrir el circuito de inmediato (sondeo fallido, arranque sin PostgreSQL)"""
+        self._open(f"{type(error).__name__}: {error}")
+
+    async def probe(self) -> bool:
+        async def ping():
+            async with engine.connect() as conn:
+                await conn.execute(text('SELECT 1'))
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(ping(), timeout=self.probe_timeout)
+        except Exception as e:
+            self.mark_down(e)
+            return False
+        finally:
+            self.last_probe_at = datetime.utcnow()
+            self.last_probe_ms = round((time.perf_counter() - started) * 1000, 1)
+        self._close()
+        return True
+
+    async def _run(self):
+        while True:
+            await self.probe()
+            await asyncio.sleep(self.probe_seconds)
+
+    def start(self):
+        """Arrancar el sondeo en segundo plano (idempotente)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'opened_at': self.opened_at.isoformat() if self.opened_at else None,
+            'opens': self.opens,
+            'short_circuited_requests': self.short_circuited,
+            'last_error': self.last_error,
+            'last_probe_at': self.last_probe_at.isoformat() if self.last_probe_at else None,
+            'last_probe_ms': self.last_probe_ms
+        }
+
+
+# Instancia global
+datastore_router = DatastoreRouter()
@@ -9,7 +9,9 @@ import base64
 import json
 from typing import Dict, Any, Optional, List
 from datetime import datetime, timezone
-import httpx
+
+from upstream_http import upstream_http
+from llm_scheduler import llm_scheduler, estimate_tokens, LLMBackpressureError, PRIORITY_DEFAULT
 
 # Google Cloud Vision
 try:
@@ -140,7 +142,10 @@ Ejemplo de formato esperado:
 Si algún campo no está presente, usa null como valor."""
             
             # Hacer request a OpenRouter
-            async with httpx.AsyncClient(timeout=60.0) as client:
+            # Imagen: ~1500 tokens de entrada aproximados
+            estimated = estimate_tokens(prompt, max_tokens=2000) + 1500
+            async with llm_scheduler.slot(self.pixtral_model, PRIORITY_DEFAULT, estimated) as slot, \
+                    upstream_http.session(timeout=60.0) as client:
                 response = await client.post(
                     'https://openrouter.ai/api/v1/chat/completions',
                     headers={
@@ -172,6 +177,8 @@ Si algún campo no está presente, usa null como valor."""
                 )
                 
                 if response.status_code != 200:
+                    if response.status_code == 429:
+                        slot.rate_limited(response.headers.get('retry-after'))
                     logger.error(f"❌ OpenRouter error: {response.status_code} - {response.text}")
                     return {
                         'success': False,
@@ -180,6 +187,7 @@ Si algún campo no está presente, usa null como valor."""
                     }
                 
                 data = response.json()
+                slot.record_usage(data.get('usage'))
                 
                 # Extraer contenido de respuesta
                 content = data['choices'][0]['message']['content']
@@ -217,6 +225,14 @@ Si algún campo no está presente, usa null como valor."""
                     'timestamp': datetime.now(timezone.utc).isoformat()
                 }
         
+        except LLMBackpressureError as e:
+            logger.warning(f"⚠️ Pixtral OCR en espera: {str(e)}")
+            return {
+                'success': False,
+                'error': 'Servicio de OCR saturado, intenta nuevamente en unos segundos',
+                'retry_after': round(e.retry_after),
+                'extracted_data': {}
+            }
         except Exception as e:
             logger.error(f"❌ Error en Pixtral OCR: {str(e)}")
             return {
@@ -0,0 +1,267 @@
+"""
+GuaraniAppStore V2.5 Pro - Job Queue
+Cola persistente (tabla background_jobs) para tareas largas fuera del ciclo de la request.
+
+Uso:
+    job_queue.register('blog.custom_article', handler)   # handler(payload, ctx) -> dict
+    job = await job_queue.enqueue(db, 'blog.custom_article', payload, user_id=...)
+    GET /api/jobs/{job.id}                                # estado y progreso
+
+Cada proceso corre JOB_QUEUE_CONCURRENCY workers que reclaman tareas con
+FOR UPDATE SKIP LOCKED, así que varias réplicas comparten la misma cola. Una
+tarea en ejecución tiene un lease (locked_until) que se renueva con cada
+progreso; si el proceso muere, otra réplica la retoma al vencer el lease.
+Los errores se reintentan con backoff exponencial hasta max_attempts.
+"""
+
+import os
+import random
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import text, bindparam, update, String, JSON
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from database import AsyncSessionLocal
+from datastore_router import datastore_router
+from models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_CONCURRENCY = int(os.environ.get('JOB_QUEUE_CONCURRENCY', '2'))
+JOB_QUEUE_POLL_SECONDS = float(os.environ.get('JOB_QUEUE_POLL_SECONDS', '2'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+JOB_RETRY_BASE_SECONDS = float(os.environ.get('JOB_RETRY_BASE_SECONDS', '30'))
+JOB_RETRY_MAX_SECONDS = float(os.environ.get('JOB_RETRY_MAX_SECONDS', '900'))
+# Sin progreso durante este tiempo, la tarea se considera abandonada y se retoma
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', '600'))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+CLAIM_SQL = text(
+    "UPDATE background_jobs SET status = 'running', attempts = attempts + 1, "
+    "started_at = :now, locked_until = :lease_until "
+    "WHERE id = ("
+    "  SELECT id FROM background_jobs WHERE kind = ANY(:kinds) AND ("
+    "    (status = 'queued' AND run_at <= :now) OR (status = 'running' AND locked_until < :now)"
+    "  ) ORDER BY run_at LIMIT 1 FOR UPDATE SKIP LOCKED"
+    ") RETURNING id, kind, payload, attempts, max_attempts"
+).bindparams(bindparam('kinds', type_=ARRAY(String))).columns(payload=JSON)
+
+JobHandler = Callable[[Dict[str, Any], 'JobContext'], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class JobPermanentError(Exception):
+    """Error que no tiene sentido reintentar (datos inválidos, recurso inexistente)"""
+
+
+class JobContext:
+    """Lo que recibe un handler para informar el progreso de su tarea"""
+
+    def __init__(self, queue: 'JobQueue', job_id: str, attempt: int):
+        self.queue = queue
+        self.job_id = job_id
+        self.attempt = attempt
+
+    async def progress(self, percent: int, message: Optional[str] = None):
+        """Actualizar el progreso (0-100) y renovar el lease"""
+        await self.queue._update(
+            self.job_id,
+            progress=max(0, min(int(percent), 100)),
+            progress_message=message[:255] if message else None,
+            locked_until=datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)
+        )
+
+
+def retry_delay(attempt: int) -> float:
+    """Backoff exponencial con jitter: base * 2^(intento-1), acotado"""
+    delay = JOB_RETRY_BASE_SECONDS * (2 ** max(attempt - 1, 0)) * random.uniform(0.8, 1.2)
+    return min(delay, JOB_RETRY_MAX_SECONDS)
+
+
+def job_to_dict(job: BackgroundJob) -> Dict[str, Any]:
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'progress_message': job.progress_message,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'next_attempt_at': job.run_at.isoformat() if job.status == QUEUED and job.run_at else None,
+        'last_error': job.last_error,
+        'result': job.result,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+class JobQueue:
+    def __init__(self, concurrency: int = JOB_QUEUE_CONCURRENCY, poll_seconds: float = JOB_QUEUE_POLL_SECONDS):
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self._handlers: Dict[str, JobHandler] = {}
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._running_jobs: Dict[str, str] = {}
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def register(self, kind: str, handler: JobHandler):
+        self._handlers[kind] = handler
+
+    async def enqueue(
+        self,
+        db,
+        kind: str,
+        payload: Dict[str, Any],
+        user_id: Optional[str] = None,
+        max_attempts: int = JOB_MAX_ATTEMPTS
+    ) -> BackgroundJob:
+        """Registrar una tarea (commit incluido) y despertar a los workers locales"""
+        if kind not in self._handlers:
+            raise ValueError(f"Tipo de tarea no registrado: {kind}")
+        job = BackgroundJob(
+            kind=kind,
+            payload=payload,
+            user_id=user_id,
+            status=QUEUED,
+            max_attempts=max_attempts,
+            run_at=datetime.utcnow()
+        )
+        db.add(job)
+        await db.commit()
+        await db.refresh(job)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, db, job_id: str) -> Optional[BackgroundJob]:
+        return await db.get(BackgroundJob, job_id)
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    async def _update(self, job_id: str, **values):
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(BackgroundJob).where(BackgroundJob.id == job_id).values(**values))
+            await db.commit()
+
+    async def _claim(self) -> Optional[Any]:
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(CLAIM_SQL, {
+                'kinds': list(self._handlers),
+                'now': now,
+                'lease_until': now + timedelta(seconds=JOB_LEASE_SECONDS)
+            })).first()
+            await db.commit()
+        return row
+
+    async def _finish_failure(self, job, error: BaseException):
+        message = f"{type(error).__name__}: {error}"[:2000]
+        if job.attempts < job.max_attempts and not isinstance(error, JobPermanentError):
+            delay = retry_delay(job.attempts)
+            self.retried += 1
+            logger.warning(f"Tarea {job.kind} {job.id} falló (intento {job.attempts}), reintento en {delay:.0f}s: {message}")
+            await self._update(
+                job.id, status=QUEUED, last_error=message, locked_until=None,
+                run_at=datetime.utcnow() + timedelta(seconds=delay)
+            )
+        else:
+            self.failed += 1
+            logger.error(f"Tarea {job.kind} {job.id} falló definitivamente: {message}")
+            await self._update(
+                job.id, status=FAILED, last_error=message, locked_until=None, finished_at=datetime.utcnow()
+            )
+
+    async def _execute(self, job):
+        if job.attempts > job.max_attempts:
+            # Lease vencido en el último intento (el proceso murió ejecutándola)
+            await self._finish_failure(job, RuntimeError('lease vencido sin completar'))
+            return
+
+        self._running_jobs[job.id] = job.kind
+        try:
+            result = await self._handlers[job.kind](job.payload or {}, JobContext(self, job.id, job.attempts))
+        except asyncio.CancelledError:
+            # Apagado (reload, deploy): devolverla a la cola sin esperar a que venza
+            # el lease y sin consumir el intento que sumó el claim
+            await asyncio.shield(self._update(
+                job.id, status=QUEUED, locked_until=None, run_at=datetime.utcnow(),
+                attempts=BackgroundJob.attempts - 1
+            ))
+            raise
+        except Exception as e:
+            await self._finish_failure(job, e)
+        else:
+            self.completed += 1
+            await self._update(
+                job.id, status=SUCCEEDED, result=result, progress=100,
+                locked_until=None, finished_at=datetime.utcnow()
+            )
+        finally:
+            self._running_jobs.pop(job.id, None)
+
+    async def _worker(self):
+        while True:
+            job = None
+            # Con el breaker abierto (PostgreSQL caído) no se intenta reclamar: el sondeo lo reabre
+            if datastore_router.postgres_available:
+                try:
+                    job = await self._claim()
+                except Exception as e:
+                    logger.warning(f"No se pudo reclamar tareas de background_jobs: {str(e)}")
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._execute(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error registrando el resultado de la tarea {job.id}: {str(e)}")
+
+    def start(self):
+        """Arrancar los workers (reclaman tareas cuando PostgreSQL está disponible)"""
+        if self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        logger.info(f"Cola de tareas iniciada con {self.concurrency} workers: {', '.join(self._handlers)}")
+
+    async def stop(self):
+        """Cancelar los workers; las tareas en curso vuelven a la cola"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'concurrency': self.concurrency,
+            'workers': len(self._workers),
+            'handlers': sorted(self._handlers),
+            'running': [{'id': job_id, 'kind': kind} for job_id, kind in self._running_jobs.items()],
+            'completed': self.completed,
+            'retried': self.retried,
+            'failed': self.failed
+        }
+
+
+# Instancia global
+job_queue = JobQueue()
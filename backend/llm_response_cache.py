@@ -0,0 +1,219 @@
+"""
+GuaraniAppStore V2.5 Pro - LLM Response Cache
+Cache de respuestas para prompts deterministas de LLMService (memoria + MongoDB).
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', 'false').lower() == 'true'
+LLM_CACHE_MEMORY_ENTRIES = int(os.environ.get('LLM_CACHE_MEMORY_ENTRIES', '1000'))
+LLM_CACHE_COLLECTION = 'llm_response_cache'
+
+# Reglas por endpoint: sólo se cachean los que aparecen aquí (TTL en segundos).
+# analyze_cv, extract_invoice_data y chat quedan fuera: datos personales o conversación libre.
+LLM_CACHE_RULES: Dict[str, Dict[str, Any]] = {
+    'generate_social_media_post': {'ttl': 6 * 3600},
+    'generate_blog': {'ttl': 24 * 3600},
+    'find_leads': {'ttl': 24 * 3600},
+    'technical_consultation': {'ttl': 3600},
+}
+# Override opcional: {"find_leads": {"ttl": 3600}, "generate_blog": {"ttl": 0}}  (ttl 0 = desactivado)
+LLM_CACHE_RULES.update(json.loads(os.environ.get('LLM_CACHE_RULES') or '{}'))
+
+# Resultado de una llamada compartida cuya solicitud líder se canceló
+_CALL_CANCELLED = object()
+
+
+def cache_key(model: str, system_message: str, prompt: str, temperature: Optional[float]) -> str:
+    """Hash estable de la entrada completa del modelo"""
+    payload = json.dumps(
+        [model, system_message, prompt, temperature],
+        ensure_ascii=False,
+        separators=(',', ':')
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Cache en dos niveles con coalescencia de solicitudes en vuelo.
+
+    - Memoria: LRU por proceso, con vencimiento propio de cada entrada.
+    - Persistente: colección MongoDB con índice TTL sobre expires_at, compartida
+      entre reinicios. Si Mongo no responde, se sigue sólo con memoria.
+
+    Si llegan varias solicitudes con la misma clave mientras la primera espera
+    al modelo, todas reciben el resultado de esa única llamada. Si la primera
+    se cancela, una de las que esperaban repite la llamada con su propio call.
+
+    Es opt-in: hace falta LLM_CACHE_ENABLED=true y que quien llama pida
+    use_cache en LLMService.
+    """
+
+    def __init__(self, max_entries: int = LLM_CACHE_MEMORY_ENTRIES):
+        self.max_entries = max_entries
+        self._memory: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.stats_counters = {
+            'memory_hits': 0,
+            'persistent_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'stores': 0,
+            'persistent_errors': 0
+        }
+
+    @staticmethod
+    def _collection():
+        from database_mongo import db
+        return db[LLM_CACHE_COLLECTION]
+
+    def _memory_get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_put(self, key: str, value: Dict[str, Any], ttl: int):
+        self._memory[key] = (time.monotonic() + ttl, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def _persistent_get(self, key: str) -> Optional[tuple]:
+        try:
+            doc = await self._collection().find_one(
+                {'_id': key, 'expires_at': {'$gt': datetime.now(timezone.utc)}},
+                {'response': 1, 'expires_at': 1}
+            )
+        except Exception as e:
+            self.stats_counters['persistent_errors'] += 1
+            logger.warning(f"Cache LLM persistente no disponible: {str(e)}")
+            return None
+        if doc is None:
+            return None
+        expires_at = doc['expires_at']
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        remaining = int((expires_at - datetime.now(timezone.utc)).total_seconds())
+        return doc['response'], max(remaining, 1)
+
+    async def _persistent_put(self, key: str, endpoint: str, value: Dict[str, Any], ttl: int):
+        now = datetime.now(timezone.utc)
+        try:
+            await self._collection().replace_one(
+                {'_id': key},
+                {
+                    '_id': key,
+                    'endpoint': endpoint,
+                    'response': value,
+                    'created_at': now,
+                    'expires_at': now + timedelta(seconds=ttl)
+                },
+                upsert=True
+            )
+        except Exception as e:
+            self.stats_counters['persistent_errors'] += 1
+            logger.warning(f"No se pudo guardar en cache LLM persistente: {str(e)}")
+
+    def rule_for(self, endpoint: str) -> Optional[Dict[str, Any]]:
+        if not LLM_CACHE_ENABLED:
+            return None
+        rule = LLM_CACHE_RULES.get(endpoint)
+        if not rule or not rule.get('ttl'):
+            return None
+        return rule
+
+    async def get_or_call(
+        self,
+        endpoint: str,
+        key: str,
+        call: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        Retorna la respuesta cacheada para key o ejecuta call y la guarda.
+
+        Sólo se guardan respuestas con success=True. Las respuestas servidas
+        desde la cache llevan cached=True.
+        """
+        rule = self.rule_for(endpoint)
+        if rule is None:
+            return await call()
+
+        while True:
+            value = self._memory_get(key)
+            if value is not None:
+                self.stats_counters['memory_hits'] += 1
+                return {**value, 'cached': True}
+
+            pending = self._in_flight.get(key)
+            if pending is None:
+                break
+            shared = await asyncio.shield(pending)
+            if shared is _CALL_CANCELLED:
+                # La solicitud líder se canceló: reintentar con el call propio
+                continue
+            self.stats_counters['coalesced'] += 1
+            return {**shared, 'coalesced': True}
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            persisted = await self._persistent_get(key)
+            if persisted is not None:
+                value, remaining = persisted
+                self.stats_counters['persistent_hits'] += 1
+                self._memory_put(key, value, remaining)
+                result = {**value, 'cached': True}
+            else:
+                self.stats_counters['misses'] += 1
+                result = await call()
+                if result.get('success'):
+                    self._memory_put(key, result, rule['ttl'])
+                    await self._persistent_put(key, endpoint, result, rule['ttl'])
+                    self.stats_counters['stores'] += 1
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            # La cancelación es de esta solicitud (p.ej. el cliente se desconectó), no de las que esperan
+            future.set_result(_CALL_CANCELLED)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Evitar "exception was never retrieved" si nadie más esperaba
+            future.exception()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = sum(self.stats_counters[k] for k in ('memory_hits', 'persistent_hits', 'misses', 'coalesced'))
+        hits = lookups - self.stats_counters['misses']
+        return {
+            'enabled': LLM_CACHE_ENABLED,
+            'memory_entries': len(self._memory),
+            'max_memory_entries': self.max_entries,
+            'in_flight': len(self._in_flight),
+            'hit_ratio': round(hits / lookups, 3) if lookups else None,
+            'rules': {endpoint: rule.get('ttl') for endpoint, rule in LLM_CACHE_RULES.items()},
+            **self.stats_counters
+        }
+
+
+# Instancia global
+llm_response_cache = LLMResponseCache()
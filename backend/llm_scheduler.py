@@ -0,0 +1,284 @@
+"""
+GuaraniAppStore V2.5 Pro - LLM Request Scheduler
+Límites por modelo (concurrencia, solicitudes y tokens por minuto) con colas por prioridad.
+
+Uso:
+    async with llm_scheduler.slot(model, priority=PRIORITY_INTERACTIVE, estimated_tokens=1500) as slot:
+        response = await ...
+        slot.record_usage(response_json.get('usage'))
+"""
+
+import os
+import json
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Clases de prioridad (menor = se atiende antes)
+PRIORITY_INTERACTIVE = 0   # Chat con agentes
+PRIORITY_DEFAULT = 1       # Endpoints de usuario (LLMService, OCR)
+PRIORITY_BATCH = 2         # Blog programado, resúmenes en segundo plano
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: 'interactive', PRIORITY_DEFAULT: 'default', PRIORITY_BATCH: 'batch'}
+
+LLM_MAX_CONCURRENCY_PER_MODEL = int(os.environ.get('LLM_MAX_CONCURRENCY_PER_MODEL', '8'))
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get('LLM_REQUESTS_PER_MINUTE', '120'))
+LLM_TOKENS_PER_MINUTE = int(os.environ.get('LLM_TOKENS_PER_MINUTE', '200000'))
+LLM_MAX_QUEUE_DEPTH = int(os.environ.get('LLM_MAX_QUEUE_DEPTH', '200'))
+# Espera máxima en cola por prioridad antes de devolver back-pressure (segundos)
+LLM_MAX_WAIT_SECONDS = {
+    PRIORITY_INTERACTIVE: float(os.environ.get('LLM_INTERACTIVE_MAX_WAIT_SECONDS', '20')),
+    PRIORITY_DEFAULT: float(os.environ.get('LLM_DEFAULT_MAX_WAIT_SECONDS', '60')),
+    PRIORITY_BATCH: float(os.environ.get('LLM_BATCH_MAX_WAIT_SECONDS', '600')),
+}
+# Límites específicos por modelo: {"anthropic/claude-3.5-sonnet": {"concurrency": 4, "rpm": 60, "tpm": 100000}}
+LLM_MODEL_LIMITS = json.loads(os.environ.get('LLM_MODEL_LIMITS') or '{}')
+
+
+class LLMBackpressureError(Exception):
+    """La cola del modelo está llena o la espera superó el máximo de su prioridad"""
+
+    def __init__(self, model: str, retry_after: float, reason: str):
+        super().__init__(f"LLM {model} saturado ({reason}), reintentar en {retry_after:.0f}s")
+        self.model = model
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def estimate_tokens(*texts: str, max_tokens: int = 0) -> int:
+    """Estimación rápida (~4 caracteres por token) de prompt + respuesta máxima"""
+    return sum(len(t or '') for t in texts) // 4 + max_tokens
+
+
+class TokenBucket:
+    """Bucket que se recarga linealmente hasta capacity por minuto"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Segundos hasta poder consumir amount (0 si ya se puede)"""
+        self._refill()
+        # Una solicitud mayor que el bucket entero sólo espera a tenerlo lleno
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+    def adjust(self, delta: float):
+        """Corregir tras conocer el uso real (delta > 0 devuelve tokens)"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + delta)
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'tokens', 'future', 'enqueued_at')
+
+    def __init__(self, priority: int, seq: int, tokens: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+    def __lt__(self, other: '_Waiter') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class ModelLane:
+    """Estado de un modelo: concurrencia, buckets y cola por prioridad"""
+
+    def __init__(self, model: str):
+        limits = LLM_MODEL_LIMITS.get(model, {})
+        self.model = model
+        self.max_concurrency = int(limits.get('concurrency', LLM_MAX_CONCURRENCY_PER_MODEL))
+        self.requests = TokenBucket(int(limits.get('rpm', LLM_REQUESTS_PER_MINUTE)))
+        self.tokens = TokenBucket(int(limits.get('tpm', LLM_TOKENS_PER_MINUTE)))
+        self.in_flight = 0
+        self.queue: List[_Waiter] = []
+        self.paused_until = 0.0
+        self.wakeup: Optional[asyncio.TimerHandle] = None
+        # Métricas
+        self.completed = 0
+        self.rejected = 0
+        self.rate_limited = 0
+        self.wait_ms = deque(maxlen=512)
+
+
+class LLMScheduler:
+    """
+    Planificador de llamadas a LLM por modelo.
+
+    Una solicitud se despacha cuando su modelo tiene un slot de concurrencia libre
+    y hay saldo en los buckets de solicitudes y tokens por minuto. Mientras tanto
+    espera en una cola ordenada por prioridad (FIFO dentro de cada clase). Si la
+    cola está llena o la espera supera el máximo de su prioridad, se devuelve
+    LLMBackpressureError con un retry_after en lugar de dejar que el proveedor
+    responda 429. Todo corre en el event loop, sin locks.
+    """
+
+    def __init__(self):
+        self._lanes: Dict[str, ModelLane] = {}
+        self._seq = itertools.count()
+
+    def _lane(self, model: str) -> ModelLane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            lane = self._lanes[model] = ModelLane(model)
+        return lane
+
+    def _dispatch(self, lane: ModelLane):
+        """Despachar en orden de prioridad mientras haya capacidad"""
+        if lane.wakeup is not None:
+            lane.wakeup.cancel()
+            lane.wakeup = None
+
+        while lane.queue and lane.in_flight < lane.max_concurrency:
+            head = lane.queue[0]
+            if head.future.done():
+                heapq.heappop(lane.queue)
+                continue
+
+            wait = max(
+                lane.paused_until - time.monotonic(),
+                lane.requests.wait_time(1),
+                lane.tokens.wait_time(head.tokens)
+            )
+            if wait > 0:
+                # Sin saldo: reintentar cuando se recargue (la cabeza conserva su turno)
+                lane.wakeup = asyncio.get_running_loop().call_later(wait, self._dispatch, lane)
+                return
+
+            heapq.heappop(lane.queue)
+            lane.requests.consume(1)
+            lane.tokens.consume(head.tokens)
+            lane.in_flight += 1
+            lane.wait_ms.append((time.monotonic() - head.enqueued_at) * 1000)
+            head.future.set_result(None)
+
+    def _retry_after(self, lane: ModelLane) -> float:
+        return max(1.0, lane.paused_until - time.monotonic(), len(lane.queue) * 60.0 / max(lane.requests.capacity, 1))
+
+    async def acquire(self, model: str, priority: int = PRIORITY_DEFAULT, estimated_tokens: int = 1000) -> int:
+        """Esperar un turno para el modelo; retorna los tokens reservados"""
+        lane = self._lane(model)
+        if len(lane.queue) >= LLM_MAX_QUEUE_DEPTH:
+            lane.rejected += 1
+            raise LLMBackpressureError(model, self._retry_after(lane), 'queue_full')
+
+        waiter = _Waiter(priority, next(self._seq), estimated_tokens, asyncio.get_running_loop().create_future())
+        heapq.heappush(lane.queue, waiter)
+        self._dispatch(lane)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), LLM_MAX_WAIT_SECONDS.get(priority, 60.0))
+        except asyncio.TimeoutError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                return estimated_tokens  # Se despachó justo al vencer
+            self._discard(lane, waiter)
+            lane.rejected += 1
+            raise LLMBackpressureError(model, self._retry_after(lane), 'wait_timeout')
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(model)
+            else:
+                self._discard(lane, waiter)
+            raise
+        return estimated_tokens
+
+    def _discard(self, lane: ModelLane, waiter: _Waiter):
+        """Sacar de la cola a un waiter que ya no espera"""
+        waiter.future.cancel()
+        if waiter in lane.queue:
+            lane.queue.remove(waiter)
+            heapq.heapify(lane.queue)
+            self._dispatch(lane)
+
+    def release(self, model: str):
+        lane = self._lane(model)
+        lane.in_flight -= 1
+        lane.completed += 1
+        self._dispatch(lane)
+
+    def report_rate_limited(self, model: str, retry_after: Optional[float] = None):
+        """El proveedor respondió 429: pausar el modelo antes de despachar más"""
+        lane = self._lane(model)
+        lane.rate_limited += 1
+        lane.paused_until = max(lane.paused_until, time.monotonic() + (retry_after or 5.0))
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        model: str,
+        priority: int = PRIORITY_DEFAULT,
+        estimated_tokens: int = 1000
+    ) -> AsyncIterator['LLMSlot']:
+        reserved = await self.acquire(model, priority, estimated_tokens)
+        slot = LLMSlot(self, model, reserved)
+        try:
+            yield slot
+        finally:
+            self.release(model)
+
+    def stats(self) -> Dict[str, Any]:
+        models = {}
+        for model, lane in self._lanes.items():
+            waits = sorted(lane.wait_ms)
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for waiter in lane.queue:
+                depth[PRIORITY_NAMES.get(waiter.priority, str(waiter.priority))] += 1
+            models[model] = {
+                'in_flight': lane.in_flight,
+                'max_concurrency': lane.max_concurrency,
+                'queue_depth': depth,
+                'completed': lane.completed,
+                'rejected': lane.rejected,
+                'rate_limited': lane.rate_limited,
+                'requests_per_minute': lane.requests.capacity,
+                'tokens_per_minute': lane.tokens.capacity,
+                'wait_p50_ms': round(waits[len(waits) // 2], 1) if waits else None,
+                'wait_p95_ms': round(waits[min(int(len(waits) * 0.95), len(waits) - 1)], 1) if waits else None
+            }
+        return {'max_queue_depth': LLM_MAX_QUEUE_DEPTH, 'models': models}
+
+
+class LLMSlot:
+    """Turno concedido; permite corregir la reserva de tokens con el uso real"""
+
+    def __init__(self, scheduler: LLMScheduler, model: str, reserved_tokens: int):
+        self._scheduler = scheduler
+        self.model = model
+        self.reserved_tokens = reserved_tokens
+
+    def record_usage(self, usage: Optional[Dict[str, Any]]):
+        if not usage or not usage.get('total_tokens'):
+            return
+        lane = self._scheduler._lane(self.model)
+        lane.tokens.adjust(self.reserved_tokens - usage['total_tokens'])
+        self.reserved_tokens = usage['total_tokens']
+
+    def rate_limited(self, retry_after: Optional[str] = None):
+        seconds = float(retry_after) if retry_after and retry_after.isdigit() else None
+        self._scheduler.report_rate_limited(self.model, seconds)
+
+
+# Instancia global
+llm_scheduler = LLMScheduler()
@@ -2,8 +2,12 @@
 LLM Service - Servicio compartido para integración con Claude, GPT y Gemini
 """
 import os
+from typing import Optional
 from dotenv import load_dotenv
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+from emergentintegrations.llm.chat import UserMessage
+from llm_scheduler import llm_scheduler, estimate_tokens, LLMBackpressureError, PRIORITY_DEFAULT, PRIORITY_BATCH
+from llm_response_cache import llm_response_cache, cache_key
+from llm_session_manager import llm_session_manager
 
 load_dotenv()
 
@@ -12,18 +16,53 @@ class LLMService:
         self.api_key = os.getenv('EMERGENT_LLM_KEY')
         self.provider = provider
         self.model = model
+        # None = temperatura por defecto del proveedor (forma parte de la clave de cache)
+        self.temperature: Optional[float] = None
     
-    async def chat(self, message: str, system_message: str = "You are a helpful AI assistant.", session_id: str = "default"):
-        """Send a chat message and get response"""
+    async def chat(
+        self,
+        message: str,
+        system_message: str = "You are a helpful AI assistant.",
+        session_id: Optional[str] = None,
+        priority: int = PRIORITY_DEFAULT,
+        cache_endpoint: Optional[str] = None,
+        use_cache: bool = False,
+        user_id: Optional[str] = None
+    ):
+        """
+        Send a chat message and get response.
+
+        Con session_id la conversación conserva su historial entre llamadas
+        (LlmChat reutilizado, aislado por user_id). Sin session_id el prompt es
+        aislado y, con cache_endpoint, puede servirse desde llm_response_cache.
+        """
+        if session_id:
+            session_key = f"{user_id}:{session_id}" if user_id else session_id
+            return await self._send(message, system_message, priority, session_key)
+        if cache_endpoint and use_cache:
+            key = cache_key(f"{self.provider}/{self.model}", system_message, message, self.temperature)
+            return await llm_response_cache.get_or_call(
+                cache_endpoint,
+                key,
+                lambda: self._send(message, system_message, priority)
+            )
+        return await self._send(message, system_message, priority)
+
+    async def _send(self, message: str, system_message: str, priority: int, session_key: Optional[str] = None):
         try:
-            chat = LlmChat(
-                api_key=self.api_key,
-                session_id=session_id,
-                system_message=system_message
-            ).with_model(self.provider, self.model)
-            
-            user_message = UserMessage(text=message)
-            response = await chat.send_message(user_message)
+            if session_key:
+                # El lock de la sesión se toma antes del turno del scheduler para no ocupar un slot esperando
+                async with llm_session_manager.conversation(
+                    self.api_key, self.provider, self.model, system_message, session_key
+                ) as chat:
+                    try:
+                        response = await self._complete(chat, message, system_message, priority)
+                    except Exception:
+                        llm_session_manager.discard(self.provider, self.model, session_key)
+                        raise
+            else:
+                chat = llm_session_manager.one_shot(self.api_key, self.provider, self.model, system_message)
+                response = await self._complete(chat, message, system_message, priority)
             
             return {
                 'success': True,
@@ -31,13 +70,34 @@ class LLMService:
                 'provider': self.provider,
                 'model': self.model
             }
+        except LLMBackpressureError as e:
+            return {
+                'success': False,
+                'error': 'Servicio de IA saturado, intenta nuevamente en unos segundos',
+                'retry_after': round(e.retry_after)
+            }
         except Exception as e:
             return {
                 'success': False,
                 'error': str(e)
             }
+
+    async def _complete(self, chat, message: str, system_message: str, priority: int) -> str:
+        async with llm_scheduler.slot(
+            f"{self.provider}/{self.model}",
+            priority,
+            estimate_tokens(system_message, message, max_tokens=2000)
+        ):
+            return await chat.send_message(UserMessage(text=message))
     
-    async def generate_blog(self, topic: str, keywords: str, tone: str = "professional", length: str = "medium"):
+    async def generate_blog(
+        self,
+        topic: str,
+        keywords: str,
+        tone: str = "professional",
+        length: str = "medium",
+        use_cache: bool = False
+    ):
         """Generate blog content"""
         word_counts = {
             'short': 500,
@@ -66,9 +126,16 @@ El artículo debe incluir:
 
 Formato en Markdown."""
 
-        return await self.chat(prompt, system_message, f"blog_{topic[:20]}")
+        return await self.chat(prompt, system_message, priority=PRIORITY_BATCH,
+                               cache_endpoint='generate_blog', use_cache=use_cache)
     
-    async def technical_consultation(self, question: str, session_id: str):
+    async def technical_consultation(
+        self,
+        question: str,
+        session_id: Optional[str] = None,
+        use_cache: bool = False,
+        user_id: Optional[str] = None
+    ):
         """Technical consultation with specialized knowledge"""
         system_message = """Eres un consultor técnico senior especializado en:
         - Arquitectura de software y diseño de sistemas
@@ -82,7 +149,8 @@ Formato en Markdown."""
         Proporciona respuestas técnicas detalladas, con ejemplos de código cuando sea apropiado,
         y mejores prácticas de la industria."""
         
-        return await self.chat(question, system_message, session_id)
+        return await self.chat(question, system_message, session_id,
+                               cache_endpoint='technical_consultation', use_cache=use_cache, user_id=user_id)
     
     async def analyze_cv(self, cv_text: str, position: str = ""):
         """Analyze CV/Resume and extract information"""
@@ -105,7 +173,7 @@ Proporciona:
 
 Responde en formato JSON."""
 
-        return await self.chat(prompt, system_message, f"cv_analysis_{position}")
+        return await self.chat(prompt, system_message)
     
     async def extract_invoice_data(self, invoice_text: str):
         """Extract data from invoice text (OCR result)"""
@@ -128,9 +196,15 @@ Información requerida:
 
 Responde en formato JSON con estos campos exactos."""
 
-        return await self.chat(prompt, system_message, "invoice_extraction")
+        return await self.chat(prompt, system_message)
     
-    async def generate_social_media_post(self, topic: str, platform: str, tone: str = "professional"):
+    async def generate_social_media_post(
+        self,
+        topic: str,
+        platform: str,
+        tone: str = "professional",
+        use_cache: bool = False
+    ):
         """Generate social media post"""
         platform_guides = {
             'facebook': 'Post de Facebook (máximo 300 caracteres, informal y enganchador)',
@@ -150,9 +224,10 @@ Tono: {tone}
 Incluye call-to-action y hashtags relevantes (si aplica).
 Solo el texto del post, sin explicaciones adicionales."""
 
-        return await self.chat(prompt, system_message, f"social_{platform}")
+        return await self.chat(prompt, system_message,
+                               cache_endpoint='generate_social_media_post', use_cache=use_cache)
     
-    async def find_leads(self, industry: str, location: str, size: str = ""):
+    async def find_leads(self, industry: str, location: str, size: str = "", use_cache: bool = False):
         """Generate lead search strategy and insights"""
         system_message = """Eres un experto en prospección comercial y generación de leads.
         Proporciona estrategias detalladas para encontrar clientes potenciales."""
@@ -172,7 +247,8 @@ Incluye:
 
 Responde de forma estructurada."""
 
-        return await self.chat(prompt, system_message, f"lead_search_{industry}")
+        return await self.chat(prompt, system_message,
+                               cache_endpoint='find_leads', use_cache=use_cache)
 
 
 # Singleton instance
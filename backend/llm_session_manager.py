@@ -0,0 +1,135 @@
+"""
+GuaraniAppStore V2.5 Pro - LlmChat Session Manager
+Reutiliza instancias de LlmChat por sesión real de usuario (LRU) en lugar de crear una por llamada.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Tuple
+
+from emergentintegrations.llm.chat import LlmChat
+
+logger = logging.getLogger(__name__)
+
+LLM_SESSION_MAX_ENTRIES = int(os.environ.get('LLM_SESSION_MAX_ENTRIES', '500'))
+LLM_SESSION_IDLE_SECONDS = float(os.environ.get('LLM_SESSION_IDLE_SECONDS', '1800'))
+# Turnos antes de reiniciar la conversación (acota el historial que viaja en cada prompt)
+LLM_SESSION_MAX_TURNS = int(os.environ.get('LLM_SESSION_MAX_TURNS', '20'))
+
+
+class _PooledChat:
+    __slots__ = ('chat', 'system_message', 'lock', 'last_used', 'turns')
+
+    def __init__(self, chat: LlmChat, system_message: str):
+        self.chat = chat
+        self.system_message = system_message
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self.turns = 0
+
+    def reusable(self, system_message: str) -> bool:
+        return (
+            self.system_message == system_message
+            and self.turns < LLM_SESSION_MAX_TURNS
+            and time.monotonic() - self.last_used < LLM_SESSION_IDLE_SECONDS
+        )
+
+
+class LlmChatSessionManager:
+    """
+    Pool de clientes LlmChat.
+
+    - Conversaciones: un LlmChat por (provider, model, sesión de usuario) que
+      conserva su historial entre turnos, en un LRU acotado y con vencimiento
+      por inactividad. Los turnos de una misma sesión se serializan con un lock
+      (el historial de LlmChat no admite dos envíos simultáneos); sesiones
+      distintas corren en paralelo.
+    - Prompts sin conversación: un LlmChat nuevo con session_id único, así
+      ningún historial se comparte entre usuarios.
+
+    Todo corre en el event loop, por lo que el LRU no necesita lock propio.
+    """
+
+    def __init__(self, max_entries: int = LLM_SESSION_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._sessions: 'OrderedDict[Tuple[str, str, str], _PooledChat]' = OrderedDict()
+        self.constructions = 0
+        self.reuses = 0
+        self.evictions = 0
+        self.construction_us = deque(maxlen=512)
+
+    def _construct(self, api_key: str, provider: str, model: str, session_id: str, system_message: str) -> LlmChat:
+        started = time.perf_counter()
+        chat = LlmChat(
+            api_key=api_key,
+            session_id=session_id,
+            system_message=system_message
+        ).with_model(provider, model)
+        self.construction_us.append((time.perf_counter() - started) * 1_000_000)
+        self.constructions += 1
+        return chat
+
+    def one_shot(self, api_key: str, provider: str, model: str, system_message: str) -> LlmChat:
+        """LlmChat sin historial previo para un prompt aislado"""
+        return self._construct(api_key, provider, model, f"oneshot_{uuid.uuid4().hex}", system_message)
+
+    @asynccontextmanager
+    async def conversation(
+        self,
+        api_key: str,
+        provider: str,
+        model: str,
+        system_message: str,
+        session_key: str
+    ) -> AsyncIterator[LlmChat]:
+        """LlmChat con el historial de session_key; se usa con `async with`"""
+        key = (provider, model, session_key)
+        entry = self._sessions.get(key)
+        if entry is not None and entry.reusable(system_message):
+            self.reuses += 1
+            self._sessions.move_to_end(key)
+        else:
+            entry = _PooledChat(
+                self._construct(api_key, provider, model, session_key, system_message),
+                system_message
+            )
+            self._sessions[key] = entry
+            while len(self._sessions) > self.max_entries:
+                # Quien esté usando la entrada expulsada conserva su referencia
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+        async with entry.lock:
+            try:
+                yield entry.chat
+                entry.turns += 1
+            finally:
+                entry.last_used = time.monotonic()
+
+    def discard(self, provider: str, model: str, session_key: str):
+        """Olvidar una conversación (p.ej. tras un error que dejó el historial inconsistente)"""
+        self._sessions.pop((provider, model, session_key), None)
+
+    def stats(self) -> Dict[str, Any]:
+        samples = sorted(self.construction_us)
+        requests = self.constructions + self.reuses
+        return {
+            'active_sessions': len(self._sessions),
+            'max_sessions': self.max_entries,
+            'constructions': self.constructions,
+            'reuses': self.reuses,
+            'evictions': self.evictions,
+            # Antes de este pool cada llamada construía un LlmChat (1.0)
+            'constructions_per_request': round(self.constructions / requests, 3) if requests else None,
+            'construction_p50_us': round(samples[len(samples) // 2], 1) if samples else None,
+            'construction_p95_us': round(samples[min(int(len(samples) * 0.95), len(samples) - 1)], 1) if samples else None
+        }
+
+
+# Instancia global
+llm_session_manager = LlmChatSessionManager()
@@ -0,0 +1,367 @@
+"""
+GuaraniAppStore V2.5 Pro - Model Router
+Elige entre modelos de OpenRouter según latencia y tasa de error, con hedging y failover.
+
+Módulo autocontenido (sólo stdlib): soporte_agent usa este mismo archivo (su imagen
+lo copia desde backend/, ver soporte_agent/Dockerfile).
+La salud se comparte con watcher_script/check_models.py a través de la colección
+Mongo `model_health`: el watcher escribe la disponibilidad de cada modelo y cada
+router publica ahí lo que observa en producción (campo observed.<router>).
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+MODEL_ROUTER_WINDOW = int(os.environ.get('MODEL_ROUTER_WINDOW', '200'))
+MODEL_ROUTER_MIN_SAMPLES = int(os.environ.get('MODEL_ROUTER_MIN_SAMPLES', '20'))
+# Tasa de error (sobre la ventana) a partir de la cual el modelo pasa a enfriamiento
+MODEL_ROUTER_MAX_ERROR_RATE = float(os.environ.get('MODEL_ROUTER_MAX_ERROR_RATE', '0.5'))
+MODEL_ROUTER_MAX_CONSECUTIVE_FAILURES = int(os.environ.get('MODEL_ROUTER_MAX_CONSECUTIVE_FAILURES', '3'))
+MODEL_ROUTER_COOLDOWN_SECONDS = float(os.environ.get('MODEL_ROUTER_COOLDOWN_SECONDS', '60'))
+MODEL_ROUTER_HEDGE = os.environ.get('MODEL_ROUTER_HEDGE', 'true').lower() == 'true'
+# El hedge nunca se lanza después de esta fracción del deadline
+MODEL_ROUTER_HEDGE_MAX_FRACTION = float(os.environ.get('MODEL_ROUTER_HEDGE_MAX_FRACTION', '0.5'))
+# Ventaja del orden de preferencia al rankear por latencia: score * (1 + sesgo * posición)
+MODEL_ROUTER_PREFERENCE_BIAS = float(os.environ.get('MODEL_ROUTER_PREFERENCE_BIAS', '0.1'))
+# Antigüedad máxima de un chequeo del watcher para tenerlo en cuenta
+MODEL_HEALTH_MAX_AGE_SECONDS = float(os.environ.get('MODEL_HEALTH_MAX_AGE_SECONDS', '7200'))
+
+MODEL_HEALTH_COLLECTION = 'model_health'
+
+# Cronómetro del intento en curso dentro de send: [inicio, contando]
+_attempt_clock: ContextVar[Optional[List[Any]]] = ContextVar('model_router_attempt_clock', default=None)
+
+
+@asynccontextmanager
+async def untimed(context_manager):
+    """
+    Entrar a context_manager dentro de send sin que la espera cuente como
+    latencia del modelo (p.ej. el turno de llm_scheduler): el cronómetro del
+    intento arranca al obtenerlo. Un intento que sigue esperando aquí cuando
+    vence el deadline o gana otro candidato no se registra.
+    """
+    clock = _attempt_clock.get()
+    if clock is not None:
+        clock[1] = False
+    async with context_manager as value:
+        if clock is not None:
+            clock[:] = [asyncio.get_running_loop().time(), True]
+        yield value
+
+
+class ModelRouterError(Exception):
+    """Ningún candidato respondió antes del deadline"""
+
+    def __init__(self, errors: List[Tuple[str, BaseException]], timed_out: bool = False):
+        detail = '; '.join(f"{model}: {type(e).__name__}: {e}" for model, e in errors) or 'sin respuestas'
+        super().__init__(f"{'Deadline vencido' if timed_out else 'Todos los modelos fallaron'} ({detail})")
+        self.errors = errors
+        self.timed_out = timed_out
+
+
+class ModelHealth:
+    """
+    Ventana deslizante de latencias y resultados de un modelo
+
+    Cada muestra es (ok, latency_ms):
+    - (True, ms): respuesta válida
+    - (False, None): error (su latencia no dice nada de la velocidad del modelo)
+    - (False, ms): deadline vencido; ms es una cota inferior de la latencia
+    - (None, ms): cancelado porque ganó el hedge; ni éxito ni error, ms es cota inferior
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self.samples = deque(maxlen=MODEL_ROUTER_WINDOW)  # (ok | None, latency_ms | None)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.external_available: Optional[bool] = None
+        self.external_status: Optional[str] = None
+        self.external_checked_at: Optional[datetime] = None
+
+    def record(self, ok: Optional[bool], latency_ms: Optional[float]):
+        self.samples.append((ok, latency_ms))
+        if ok is None:
+            return
+        if ok:
+            self.consecutive_failures = 0
+            return
+        self.consecutive_failures += 1
+        if (
+            self.consecutive_failures >= MODEL_ROUTER_MAX_CONSECUTIVE_FAILURES
+            or (len(self.samples) >= MODEL_ROUTER_MIN_SAMPLES and self.error_rate() >= MODEL_ROUTER_MAX_ERROR_RATE)
+        ):
+            if self.cooldown_until < time.monotonic():
+                logger.warning(f"Modelo {self.model} en enfriamiento por {MODEL_ROUTER_COOLDOWN_SECONDS:.0f}s")
+            self.cooldown_until = time.monotonic() + MODEL_ROUTER_COOLDOWN_SECONDS
+
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for ok, _ in self.samples if ok is False) / len(self.samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        # Las cotas inferiores (cancelados, deadline) cuentan: sin ellas un modelo
+        # lento sólo registraría sus respuestas rápidas
+        latencies = sorted(latency for _, latency in self.samples if latency is not None)
+        if not latencies:
+            return None
+        return latencies[min(int(len(latencies) * q), len(latencies) - 1)]
+
+    def latency_samples(self) -> int:
+        return sum(1 for _, latency in self.samples if latency is not None)
+
+    def score(self) -> Optional[float]:
+        """Costo esperado: p95 inflado por la tasa de error (None sin muestras suficientes)"""
+        if self.latency_samples() < MODEL_ROUTER_MIN_SAMPLES:
+            return None
+        return self.percentile(0.95) / max(1.0 - self.error_rate(), 0.05)
+
+    def external_down(self) -> bool:
+        if self.external_available is not False or self.external_checked_at is None:
+            return False
+        age = (datetime.now(timezone.utc) - self.external_checked_at).total_seconds()
+        return age < MODEL_HEALTH_MAX_AGE_SECONDS
+
+    def healthy(self) -> bool:
+        return self.cooldown_until <= time.monotonic() and not self.external_down()
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        return {
+            'healthy': self.healthy(),
+            'samples': len(self.samples),
+            'error_rate': round(self.error_rate(), 3),
+            'p50_ms': round(p50, 1) if p50 is not None else None,
+            'p95_ms': round(p95, 1) if p95 is not None else None,
+            'score': round(self.score(), 1) if self.score() is not None else None,
+            'cooldown_seconds': max(round(self.cooldown_until - time.monotonic(), 1), 0),
+            'watcher_status': self.external_status,
+            'watcher_checked_at': self.external_checked_at.isoformat() if self.external_checked_at else None
+        }
+
+
+class ModelRouter:
+    """
+    Enruta cada llamada a la lista de modelos candidatos.
+
+    - Los modelos sanos se ordenan por score (p95 reciente / (1 - tasa de
+      error)), con un leve sesgo a favor del orden de preferencia. Los que
+      aún no tienen MODEL_ROUTER_MIN_SAMPLES muestras van primero, en orden
+      de preferencia, hasta medirse.
+    - Los modelos en enfriamiento (errores recientes) o marcados como no
+      disponibles por el watcher pasan al final de la lista.
+    - Hedging: si el primario no respondió al llegar a su p95 (acotado a una
+      fracción del deadline), se lanza el siguiente candidato en paralelo y se
+      usa la primera respuesta válida; la otra se cancela y su tiempo
+      transcurrido se registra como cota inferior de su latencia.
+    - Failover: si un candidato falla, se lanza el siguiente de inmediato
+      mientras quede tiempo.
+
+    ignore_errors: excepciones que no cuentan como falla del modelo (p.ej.
+    back-pressure local); si todos los candidatos fallan así, se relanza la primera.
+    """
+
+    def __init__(self, name: str, ignore_errors: Tuple[type, ...] = ()):
+        self.name = name
+        self.ignore_errors = ignore_errors
+        self._models: Dict[str, ModelHealth] = {}
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self.deadline_exceeded = 0
+
+    def _health(self, model: str) -> ModelHealth:
+        health = self._models.get(model)
+        if health is None:
+            health = self._models[model] = ModelHealth(model)
+        return health
+
+    def record(self, model: str, ok: bool, latency_ms: Optional[float] = None):
+        self._health(model).record(ok, latency_ms)
+
+    def order(self, candidates: Sequence[str]) -> List[str]:
+        """Candidatos sanos primero, rankeados por score; el resto en orden de preferencia"""
+        unique = list(dict.fromkeys(candidates))
+        healthy = [m for m in unique if self._health(m).healthy()]
+
+        def rank(item: Tuple[int, str]) -> float:
+            index, model = item
+            score = self._health(model).score()
+            if score is None:
+                return float('-inf')
+            return score * (1 + MODEL_ROUTER_PREFERENCE_BIAS * index)
+
+        ranked = [m for _, m in sorted(enumerate(healthy), key=rank)]
+        return ranked + [m for m in unique if m not in healthy]
+
+    def hedge_delay(self, model: str, deadline: float) -> float:
+        cap = deadline * MODEL_ROUTER_HEDGE_MAX_FRACTION
+        health = self._health(model)
+        if health.latency_samples() < MODEL_ROUTER_MIN_SAMPLES:
+            return cap
+        return min(health.percentile(0.95) / 1000, cap)
+
+    async def call(
+        self,
+        candidates: Sequence[str],
+        send: Callable[[str], Awaitable[T]],
+        deadline: float,
+        hedge: bool = True
+    ) -> Tuple[T, str]:
+        """
+        Ejecutar send(model) sobre los candidatos hasta obtener una respuesta.
+
+        send debe lanzar una excepción ante cualquier respuesta no válida.
+        La latencia se mide desde el lanzamiento del intento, o desde que send
+        sale de untimed(...) si espera un turno local antes de llamar al modelo.
+        Retorna (resultado, modelo que respondió).
+        """
+        ordered = self.order(candidates)
+        loop = asyncio.get_running_loop()
+        end = loop.time() + deadline
+        pending: Dict[asyncio.Future, Tuple[str, List[Any]]] = {}
+        errors: List[Tuple[str, BaseException]] = []
+        next_index = 0
+        self.calls += 1
+
+        def launch():
+            nonlocal next_index
+            model = ordered[next_index]
+            next_index += 1
+            clock = [loop.time(), True]
+
+            async def attempt():
+                _attempt_clock.set(clock)
+                return await send(model)
+
+            task = asyncio.ensure_future(attempt())
+            # Los perdedores cancelados no deben dejar "exception was never retrieved"
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            pending[task] = (model, clock)
+
+        launch()
+        hedge_at = None
+        if hedge and MODEL_ROUTER_HEDGE and len(ordered) > 1:
+            hedge_at = loop.time() + self.hedge_delay(ordered[0], deadline)
+
+        try:
+            while pending:
+                now = loop.time()
+                timeout = end - now
+                if hedge_at is not None:
+                    timeout = min(timeout, hedge_at - now)
+                done, _ = await asyncio.wait(list(pending), timeout=max(timeout, 0), return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    if loop.time() >= end:
+                        break
+                    hedge_at = None
+                    if next_index < len(ordered):
+                        self.hedges += 1
+                        launch()
+                    continue
+
+                for task in done:
+                    model, clock = pending.pop(task)
+                    latency_ms = (loop.time() - clock[0]) * 1000
+                    error = task.exception()
+                    if error is None:
+                        self.record(model, True, latency_ms)
+                        if model != ordered[0]:
+                            if len(pending):
+                                self.hedge_wins += 1
+                            else:
+                                self.failovers += 1
+                        # Los perdedores se cancelan en el finally: registrar su tiempo como cota inferior
+                        for loser, loser_clock in pending.values():
+                            if loser_clock[1]:
+                                self.record(loser, None, (loop.time() - loser_clock[0]) * 1000)
+                        return task.result(), model
+                    errors.append((model, error))
+                    if not isinstance(error, self.ignore_errors):
+                        self.record(model, False)
+                    logger.warning(f"[{self.name}] {model} falló: {type(error).__name__}: {error}")
+
+                if not pending and next_index < len(ordered) and loop.time() < end:
+                    launch()
+
+            if pending:
+                self.deadline_exceeded += 1
+                for model, clock in pending.values():
+                    if clock[1]:
+                        self.record(model, False, (loop.time() - clock[0]) * 1000)
+                raise ModelRouterError(errors, timed_out=True)
+            if errors and all(isinstance(e, self.ignore_errors) for _, e in errors):
+                raise errors[0][1]
+            raise ModelRouterError(errors)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    # ------------------------------------------------------------------
+    # Salud compartida con el watcher
+    # ------------------------------------------------------------------
+
+    def apply_external_health(self, docs: List[Dict[str, Any]]):
+        for doc in docs:
+            health = self._health(doc['_id'])
+            health.external_available = doc.get('available')
+            health.external_status = doc.get('status')
+            checked_at = doc.get('checked_at')
+            if isinstance(checked_at, datetime) and checked_at.tzinfo is None:
+                checked_at = checked_at.replace(tzinfo=timezone.utc)
+            health.external_checked_at = checked_at if isinstance(checked_at, datetime) else None
+
+    async def sync_health(self, collection):
+        """
+        Leer la disponibilidad publicada por el watcher y publicar lo observado.
+
+        collection: colección Motor `model_health` (o cualquier objeto con la
+        misma interfaz asíncrona find/update_one).
+        """
+        try:
+            docs = await collection.find({}, {'available': 1, 'status': 1, 'checked_at': 1}).to_list(length=None)
+            self.apply_external_health(docs)
+            now = datetime.now(timezone.utc)
+            for model, health in self._models.items():
+                if not health.samples:
+                    continue
+                await collection.update_one(
+                    {'_id': model},
+                    {'$set': {f'observed.{self.name}': {**health.snapshot(), 'updated_at': now}}},
+                    upsert=True
+                )
+        except Exception as e:
+            logger.warning(f"[{self.name}] No se pudo sincronizar {MODEL_HEALTH_COLLECTION}: {str(e)}")
+
+    async def run_health_sync(self, collection, interval: float = 60.0):
+        """Bucle de sincronización para procesos sin scheduler"""
+        while True:
+            await self.sync_health(collection)
+            await asyncio.sleep(interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'router': self.name,
+            'calls': self.calls,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'failovers': self.failovers,
+            'deadline_exceeded': self.deadline_exceeded,
+            'hedging_enabled': MODEL_ROUTER_HEDGE,
+            'models': {model: health.snapshot() for model, health in self._models.items()}
+        }
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, Text, ForeignKey, Enum as SQLEnum, JSON, TIMESTAMP
+from sqlalchemy import Column, String, Integer, Float, Boolean, Date, DateTime, Text, ForeignKey, Enum as SQLEnum, JSON, TIMESTAMP
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -317,9 +317,11 @@ class ChatSession(Base):
     first_interaction_date = Column(DateTime, nullable=False, default=datetime.utcnow)
     last_interaction_date = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     total_messages = Column(Integer, default=0)
+    last_user_message_date = Column(Date, nullable=True)  # Fecha local (zona del usuario) del último mensaje del usuario
     
     # Contexto persistente
     context_summary = Column(Text, nullable=True)  # Resumen del contexto para cargar rápidamente
+    context_summary_until = Column(DateTime, nullable=True)  # Timestamp del último mensaje incluido en el resumen
     user_preferences = Column(JSON, nullable=True)  # Preferencias detectadas del usuario
     
     # Control de sesión
@@ -391,3 +393,65 @@ class GoogleOAuthToken(Base):
     
     # Relationships
     user = relationship('User', foreign_keys=[user_id])
+
+
+class AnalyticsDaily(Base):
+    """
+    Rollup diario para /api/admin/analytics (mantenido por analytics_service).
+    Un día se recalcula completo cuando cambia alguna de sus órdenes o usuarios.
+    """
+    __tablename__ = 'analytics_daily'
+    
+    day = Column(Date, primary_key=True)
+    revenue = Column(Float, default=0, nullable=False)
+    completed_orders = Column(Integer, default=0, nullable=False)
+    new_users = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class AnalyticsDailyService(Base):
+    """Órdenes completadas por día y servicio (ranking de servicios populares)"""
+    __tablename__ = 'analytics_daily_services'
+    
+    day = Column(Date, primary_key=True)
+    service_id = Column(String, ForeignKey('services.id', ondelete='CASCADE'), primary_key=True)
+    orders = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0, nullable=False)
+
+
+class AnalyticsRollupState(Base):
+    """Marca de agua del último refresco incremental de los rollups"""
+    __tablename__ = 'analytics_rollup_state'
+    
+    name = Column(String, primary_key=True)
+    watermark = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class BackgroundJob(Base):
+    """
+    Cola persistente de tareas largas (job_queue): generación de artículos, etc.
+    status: queued -> running -> succeeded | failed (los reintentos vuelven a queued)
+    """
+    __tablename__ = 'background_jobs'
+    
+    id = Column(String, primary_key=True, default=generate_uuid)
+    kind = Column(String(100), nullable=False)
+    payload = Column(JSON, nullable=False, default=dict)
+    user_id = Column(String, nullable=True, index=True)  # Dueño (sin FK: también usuarios de MongoDB)
+    
+    status = Column(String(20), nullable=False, default='queued')
+    progress = Column(Integer, default=0, nullable=False)
+    progress_message = Column(String(255), nullable=True)
+    result = Column(JSON, nullable=True)
+    last_error = Column(Text, nullable=True)
+    
+    # Reintentos y lease del worker que la ejecuta
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=3, nullable=False)
+    run_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    locked_until = Column(DateTime, nullable=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
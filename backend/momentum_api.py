@@ -4,18 +4,15 @@ API REST endpoints para Momentum Predictor
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from datetime import datetime, timezone
 
 from momentum_service import MomentumPredictorService
+from database_mongo import db as mongo_db
 
 router = APIRouter(prefix="/api/momentum", tags=["momentum"])
 
 # Inicializar servicio
 momentum_service = None
-db_client = None
-db = None
 
 def get_momentum_service():
     global momentum_service
@@ -24,12 +21,7 @@ def get_momentum_service():
     return momentum_service
 
 def get_db():
-    global db_client, db
-    if db_client is None:
-        MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/guarani_appstore')
-        db_client = AsyncIOMotorClient(MONGO_URL)
-        db = db_client.get_database()
-    return db
+    return mongo_db
 
 # Schemas
 class SignalResponse(BaseModel):
@@ -73,7 +65,10 @@ async def get_signal(symbol: str):
         
         # Guardar en base de datos
         database = get_db()
-        await database.momentum_signals.insert_one(prediction)
+        await database.momentum_signals.insert_one({
+            **prediction,
+            'created_at': datetime.now(timezone.utc)
+        })
         
         return prediction
         
@@ -8,24 +8,23 @@ from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 from telegram.constants import ParseMode
-from motor.motor_asyncio import AsyncIOMotorClient
+from datetime import datetime, timezone
 
 from momentum_service import MomentumPredictorService
+from database_mongo import db as mongo_db, ensure_indexes
 
 # Cargar variables de entorno
 load_dotenv()
 
 # Configuración
 BOT_TOKEN = os.environ.get('MOMENTUM_BOT_TOKEN', os.environ.get('TELEGRAM_BOT_TOKEN'))
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/guarani_appstore')
 
 # Servicio
 momentum_service = None
 
 class MomentumTelegramBot:
     def __init__(self):
-        self.db_client = AsyncIOMotorClient(MONGO_URL)
-        self.db = self.db_client.get_database()
+        self.db = mongo_db
         global momentum_service
         if momentum_service is None:
             momentum_service = MomentumPredictorService(use_mock=True)
@@ -286,7 +285,8 @@ _{last_signal['predicted_at'][:10]}_
         """Guardar señal"""
         await self.db.momentum_signals.insert_one({
             **prediction,
-            'requested_by_chat_id': chat_id
+            'requested_by_chat_id': chat_id,
+            'created_at': datetime.now(timezone.utc)
         })
     
     async def run(self):
@@ -297,6 +297,8 @@ _{last_signal['predicted_at'][:10]}_
         
         print("🤖 Inicializando Momentum Predictor Bot...")
         
+        await ensure_indexes()
+        
         app = Application.builder().token(BOT_TOKEN).build()
         
         # Comandos
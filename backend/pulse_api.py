@@ -4,18 +4,15 @@ API REST endpoints para Pulse IA
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from datetime import datetime, timezone
 
 from pulse_service import PulseIAService
+from database_mongo import db as mongo_db
 
 router = APIRouter(prefix="/api/pulse", tags=["pulse"])
 
 # Inicializar servicio
 pulse_service = None
-db_client = None
-db = None
 
 def get_pulse_service():
     global pulse_service
@@ -24,12 +21,7 @@ def get_pulse_service():
     return pulse_service
 
 def get_db():
-    global db_client, db
-    if db_client is None:
-        MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/guarani_appstore')
-        db_client = AsyncIOMotorClient(MONGO_URL)
-        db = db_client.get_database()
-    return db
+    return mongo_db
 
 # Schemas
 class SentimentAnalysisResponse(BaseModel):
@@ -76,7 +68,10 @@ async def analyze_sentiment(symbol: str):
         
         # Guardar en base de datos
         database = get_db()
-        await database.pulse_sentiment_analysis.insert_one(analysis)
+        await database.pulse_sentiment_analysis.insert_one({
+            **analysis,
+            'created_at': datetime.now(timezone.utc)
+        })
         
         return analysis
         
@@ -7,21 +7,20 @@ import asyncio
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 from telegram.constants import ParseMode
-from motor.motor_asyncio import AsyncIOMotorClient
+from datetime import datetime, timezone
 
 from pulse_service import PulseIAService
+from database_mongo import db as mongo_db, ensure_indexes
 
 # Configuración
 BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', os.environ.get('CRYPTO_BOTS_TOKEN'))
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/guarani_appstore')
 
 # Servicio de Pulse IA
 pulse_service = None
 
 class PulseTelegramBot:
     def __init__(self):
-        self.db_client = AsyncIOMotorClient(MONGO_URL)
-        self.db = self.db_client.get_database()
+        self.db = mongo_db
         global pulse_service
         if pulse_service is None:
             pulse_service = PulseIAService()
@@ -328,7 +327,8 @@ Usa `/track <SYMBOL>` para agregar símbolos.
         """Guardar análisis en base de datos"""
         await self.db.pulse_sentiment_analysis.insert_one({
             **analysis,
-            'requested_by_chat_id': chat_id
+            'requested_by_chat_id': chat_id,
+            'created_at': datetime.now(timezone.utc)
         })
     
     async def run(self):
@@ -340,6 +340,8 @@ Usa `/track <SYMBOL>` para agregar símbolos.
         
         print("🤖 Inicializando Pulse IA Bot...")
         
+        await ensure_indexes()
+        
         app = Application.builder().token(BOT_TOKEN).build()
         
         # Comandos
@@ -156,6 +156,7 @@ class ChatRequest(BaseModel):
     user_id: Optional[str] = None  # ID de usuario registrado
     visitor_id: Optional[str] = None  # ID de visitante anónimo
     user_agent: Optional[str] = None  # User-Agent del navegador
+    timezone: Optional[str] = None  # Zona horaria IANA del navegador (ej: America/Asuncion)
 
 class ChatResponse(BaseModel):
     response: str
@@ -1,10 +1,11 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from cloudflare_middleware import CloudflareMiddleware
 from dotenv import load_dotenv
 from pathlib import Path
 from typing import Optional
 import os
+import json
 import logging
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
@@ -13,8 +14,11 @@ from datetime import datetime, timezone, timedelta
 import secrets
 
 # Import modules
-from database import get_db, engine, Base
-from database_mongo import db as mongodb, services_collection, users_collection, orders_collection, transactions_collection
+from database import get_db, engine, Base, AsyncSessionLocal
+from datastore_router import datastore_router
+from catalog_cache import catalog_cache
+from job_queue import job_queue, job_to_dict
+from database_mongo import db as mongodb, services_collection, users_collection, orders_collection, transactions_collection, ensure_indexes as ensure_mongo_indexes
 from models import User, Service, Lead, Conversation, BlogPost, PasswordReset, Payment, UserRole, Order, Transaction, ChatSession, ChatMessage
 from schemas import (
     UserCreate, UserLogin, UserResponse, TokenResponse,
@@ -29,11 +33,13 @@ from schemas import (
     OrderCreate, OrderResponse, CryptoPaymentVerify
 )
 from auth import (
-    hash_password, verify_password, create_access_token,
+    hash_password, verify_password, create_user_token, user_cache,
     get_current_user, get_current_admin_user,
     generate_2fa_secret, verify_2fa_token, generate_reset_token
 )
-from ai_service import chat_with_claude, generate_blog_content
+from ai_service import chat_with_claude, stream_chat_with_claude, chat_stream_metrics, generate_blog_content, CHAT_MODEL
+from chat_context_builder import chat_context_builder
+from llm_scheduler import llm_scheduler, LLMBackpressureError
 from timezone_utils import get_timezone_for_country, SUPPORTED_COUNTRIES
 from google_auth import verify_google_token
 from payment_service import (
@@ -62,6 +68,17 @@ app = FastAPI(title='GuaraniAppStore API', version='2.5.0')
 # Create API router with /api prefix
 api_router = APIRouter(prefix='/api')
 
+
+@app.exception_handler(LLMBackpressureError)
+async def llm_backpressure_handler(request, exc: LLMBackpressureError):
+    """Cola del LLM saturada: 503 con Retry-After en lugar de un error genérico"""
+    from fastapi.responses import JSONResponse
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={'detail': 'Nuestros agentes están atendiendo muchas consultas, intenta nuevamente en unos segundos'},
+        headers={'Retry-After': str(int(exc.retry_after))}
+    )
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -76,6 +93,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=['*'],
     allow_headers=['*'],
+    expose_headers=['X-Next-Cursor'],
 )
 
 # Startup event
@@ -85,11 +103,18 @@ async def startup():
     
     # Create database tables (PostgreSQL)
     try:
-        from database import engine, Base
+        from database import engine, Base, apply_schema_upgrades, start_search_indexes
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            await apply_schema_upgrades(conn)
+            from stats_service import dashboard_stats
+            if dashboard_stats.materialized:
+                await dashboard_stats.ensure_summary(conn)
         logger.info('✅ PostgreSQL tables created successfully')
         
+        # pg_trgm e índices de búsqueda admin: en segundo plano y sin afectar el arranque
+        start_search_indexes()
+        
         # Iniciar Blog Scheduler (requiere PostgreSQL)
         try:
             from blog_scheduler import start_blog_scheduler
@@ -101,6 +126,29 @@ async def startup():
     except Exception as e:
         logger.warning(f'⚠️ PostgreSQL not available: {str(e)}')
         logger.info('📌 Running in MongoDB-only mode (Blog features disabled)')
+        datastore_router.mark_down(e)
+    
+    # Circuit breaker de PostgreSQL (sondeo en segundo plano)
+    datastore_router.start()
+    
+    # Workers de la cola de tareas largas (generación de artículos, etc.): arrancan
+    # aunque PostgreSQL no responda todavía; no reclaman mientras el breaker esté abierto
+    job_queue.start()
+    
+    # Vistas del blog con escritura diferida (UPDATE por lote)
+    from blog_views import blog_view_buffer
+    blog_view_buffer.start()
+    
+    # Índices de MongoDB (colecciones de Suite Crypto y bots)
+    await ensure_mongo_indexes()
+    
+    # Persistencia write-behind del chat (re-aplica el journal pendiente)
+    try:
+        from chat_memory_service import chat_memory_service
+        await chat_memory_service.start()
+        logger.info('✅ Chat write-behind queue started')
+    except Exception as e:
+        logger.warning(f'⚠️ Chat write-behind queue not started: {str(e)}')
     
     logger.info('✅ API started successfully')
 
@@ -117,7 +165,31 @@ async def shutdown():
     except Exception as e:
         logger.error(f'Error stopping Blog Scheduler: {str(e)}')
     
-    from database import engine
+    # Las tareas en curso vuelven a la cola (otra réplica o el próximo arranque las retoma).
+    # Antes de cerrar los pools HTTP: una solicitud cortada a mitad consumiría un intento
+    await job_queue.stop()
+    
+    # Vaciar mensajes de chat pendientes antes de cerrar el pool
+    try:
+        from chat_memory_service import chat_memory_service
+        await chat_memory_service.stop()
+    except Exception as e:
+        logger.error(f'Error stopping chat write-behind queue: {str(e)}')
+    
+    from upstream_http import upstream_http
+    await upstream_http.aclose()
+    
+    # Volcar vistas del blog pendientes antes de cerrar el pool
+    try:
+        from blog_views import blog_view_buffer
+        await blog_view_buffer.stop()
+    except Exception as e:
+        logger.error(f'Error flushing blog views: {str(e)}')
+    
+    await datastore_router.stop()
+    
+    from database import engine, stop_search_indexes
+    await stop_search_indexes()
     await engine.dispose()
 
 # ============================================
@@ -134,11 +206,16 @@ async def root():
 
 @api_router.get('/health')
 async def health_check():
-    return {'status': 'healthy', 'timestamp': datetime.utcnow().isoformat()}
+    # degraded: PostgreSQL caído, las requests se sirven desde MongoDB
+    return {
+        'status': 'healthy' if datastore_router.postgres_available else 'degraded',
+        'timestamp': datetime.utcnow().isoformat(),
+        'datastores': {
+            'postgres': datastore_router.stats()
+        }
+    }
 
-@api_router.get('/countries')
-async def get_countries():
-    """Get list of supported countries with their timezones"""
+async def _load_countries_catalog():
     from timezone_utils import COUNTRY_TIMEZONES
     return {
         'countries': [
@@ -146,7 +223,13 @@ async def get_countries():
             for country, tz in COUNTRY_TIMEZONES.items()
         ],
         'default': 'Paraguay'
-    }
+    }, True
+
+@api_router.get('/countries')
+async def get_countries(request: Request):
+    """Get list of supported countries with their timezones (JSON pre-serializado con ETag)"""
+    entry = await catalog_cache.get('countries', _load_countries_catalog)
+    return catalog_cache.response(entry, request)
 
 # ============================================
 # AUTHENTICATION ROUTES
@@ -160,6 +243,7 @@ async def register(
     """Register a new user - Works with both PostgreSQL and MongoDB"""
     try:
         # Try PostgreSQL first
+        datastore_router.ensure_postgres()
         result = await db.execute(select(User).filter(User.email == user_data.email))
         existing_user = result.scalar_one_or_none()
         
@@ -192,7 +276,7 @@ async def register(
         await db.refresh(new_user)
         
         # Create access token
-        access_token = create_access_token({'sub': new_user.id})
+        access_token = create_user_token(new_user.id, new_user.role, new_user.is_active)
         
         return TokenResponse(
             access_token=access_token,
@@ -200,6 +284,7 @@ async def register(
         )
         
     except Exception as pg_error:
+        datastore_router.record_failure(pg_error)
         # Fallback to MongoDB if PostgreSQL fails
         logger.warning(f'PostgreSQL registration failed, trying MongoDB: {str(pg_error)}')
         
@@ -243,7 +328,7 @@ async def register(
         result = await users_collection.insert_one(mongo_user_data)
         
         # Create access token with MongoDB user ID
-        access_token = create_access_token({'sub': user_id})
+        access_token = create_user_token(user_id, UserRole.USER)
         
         # Return response with MongoDB user data
         return TokenResponse(
@@ -276,6 +361,7 @@ async def login(
     """Login user - Works with both PostgreSQL and MongoDB"""
     try:
         # Try PostgreSQL first
+        datastore_router.ensure_postgres()
         result = await db.execute(select(User).filter(User.email == credentials.email))
         user = result.scalar_one_or_none()
         
@@ -310,7 +396,7 @@ async def login(
         await db.commit()
         
         # Create access token
-        access_token = create_access_token({'sub': user.id})
+        access_token = create_user_token(user.id, user.role, user.is_active)
         
         return TokenResponse(
             access_token=access_token,
@@ -318,6 +404,7 @@ async def login(
         )
         
     except Exception as pg_error:
+        datastore_router.record_failure(pg_error)
         # Fallback to MongoDB if PostgreSQL fails
         logger.warning(f'PostgreSQL login failed, trying MongoDB: {str(pg_error)}')
         
@@ -332,7 +419,11 @@ async def login(
         
         # Create access token with MongoDB user ID
         user_id = str(mongo_user.get('_id', mongo_user.get('id', '')))
-        access_token = create_access_token({'sub': user_id})
+        access_token = create_user_token(
+            user_id,
+            UserRole.ADMIN if mongo_user.get('is_admin') else UserRole.USER,
+            mongo_user.get('is_active', True)
+        )
         
         # Return response with MongoDB user data
         return TokenResponse(
@@ -409,9 +500,10 @@ async def google_login(
             user.last_login = datetime.utcnow()
             await db.commit()
             await db.refresh(user)
+            user_cache.invalidate(user.id)
         
         # Create access token
-        access_token = create_access_token({'sub': user.id})
+        access_token = create_user_token(user.id, user.role, user.is_active)
         
         return TokenResponse(
             access_token=access_token,
@@ -452,10 +544,14 @@ async def enable_2fa(
     
     # Generate secret
     secret = generate_2fa_secret()
-    current_user.two_factor_secret = secret
-    current_user.two_factor_enabled = True
+    
+    result = await db.execute(select(User).filter(User.id == current_user.id))
+    user = result.scalar_one_or_none()
+    user.two_factor_secret = secret
+    user.two_factor_enabled = True
     
     await db.commit()
+    user_cache.invalidate(current_user.id)
     
     import pyotp
     totp = pyotp.TOTP(secret)
@@ -558,6 +654,7 @@ async def confirm_password_reset(
     reset_record.used = True
     
     await db.commit()
+    user_cache.invalidate(user.id)
     
     return {'message': 'Password reset successfully'}
 
@@ -565,19 +662,19 @@ async def confirm_password_reset(
 # SERVICES ROUTES
 # ============================================
 
-@api_router.get('/services', response_model=list[ServiceResponse])
-async def get_services(db: AsyncSession = Depends(get_db)):
-    """Get all services - Works with both PostgreSQL and MongoDB"""
+async def _load_services_catalog(db: AsyncSession):
+    """Services list - Works with both PostgreSQL and MongoDB (el respaldo no se cachea)"""
     try:
         # Try PostgreSQL first
-        from database import get_db
+        datastore_router.ensure_postgres()
         result = await db.execute(
             select(Service).order_by(Service.order, Service.name)
         )
         services = result.scalars().all()
-        return [ServiceResponse.model_validate(s) for s in services]
+        return [ServiceResponse.model_validate(s) for s in services], True
         
     except Exception as pg_error:
+        datastore_router.record_failure(pg_error)
         # Fallback to MongoDB if PostgreSQL fails
         logger.warning(f'PostgreSQL services query failed, using MongoDB: {str(pg_error)}')
         
@@ -624,7 +721,13 @@ async def get_services(db: AsyncSession = Depends(get_db)):
                 created_at=service.get('created_at', datetime.utcnow())
             ))
         
-        return response_services
+        return response_services, False
+
+@api_router.get('/services', response_model=list[ServiceResponse])
+async def get_services(request: Request, db: AsyncSession = Depends(get_db)):
+    """Get all services (JSON pre-serializado con ETag; 304 si no cambió)"""
+    entry = await catalog_cache.get('services', lambda: _load_services_catalog(db))
+    return catalog_cache.response(entry, request)
 
 @api_router.get('/services/{slug}', response_model=ServiceResponse)
 async def get_service(
@@ -654,6 +757,7 @@ async def create_service(
     db.add(new_service)
     await db.commit()
     await db.refresh(new_service)
+    catalog_cache.invalidate()
     
     return ServiceResponse.model_validate(new_service)
 
@@ -698,60 +802,174 @@ async def chat(
     """Chat with AI agent - Con sistema de memoria persistente (30 días)"""
     from chat_memory_service import chat_memory_service
     
-    # Obtener o crear sesión de chat
-    session = await chat_memory_service.get_or_create_session(
+    user_timestamp = datetime.utcnow()
+    
+    # Sesión, historial (últimos 50 mensajes) y primer mensaje del día en una sola consulta
+    turn = await chat_memory_service.load_turn_context(
         agent_name=chat_data.agent_name,
-        user_id=chat_data.user_id if hasattr(chat_data, 'user_id') else None,
-        visitor_id=chat_data.visitor_id if hasattr(chat_data, 'visitor_id') else None,
+        user_id=chat_data.user_id,
+        visitor_id=chat_data.visitor_id,
+        user_timezone=chat_data.timezone,
         session_metadata={
             'channel': 'web_chat',
-            'user_agent': chat_data.user_agent if hasattr(chat_data, 'user_agent') else None
-        }
-    )
-    
-    # Obtener historial de la sesión (últimos 50 mensajes)
-    conversation_history = await chat_memory_service.get_session_history(
-        session_id=session.id,
-        limit=50
-    )
-    
-    # Verificar si es el primer mensaje del día
-    is_first_today = await chat_memory_service.is_first_message_today(
-        agent_name=chat_data.agent_name,
-        user_id=chat_data.user_id if hasattr(chat_data, 'user_id') else None,
-        visitor_id=chat_data.visitor_id if hasattr(chat_data, 'visitor_id') else None
+            'user_agent': chat_data.user_agent
+        },
+        history_limit=50
     )
     
-    # Guardar mensaje del usuario
-    await chat_memory_service.add_message(
-        session_id=session.id,
-        role='user',
-        content=chat_data.message,
-        message_metadata={'channel': 'web_chat'}
+    # Ventana de historial dentro del presupuesto de tokens + resumen acumulado
+    context = chat_context_builder.build(
+        turn['history'],
+        model=CHAT_MODEL,
+        summary=turn['context_summary'],
+        summary_until=turn['context_summary_until']
     )
     
     # Get AI response con contexto mejorado
-    ai_response = await chat_with_claude(
+    ai_response, model_used = await chat_with_claude(
         message=chat_data.message,
         agent_name=chat_data.agent_name,
-        conversation_history=conversation_history,
-        is_first_message_today=is_first_today
+        conversation_history=context['history'],
+        is_first_message_today=turn['is_first_message_today'],
+        context_summary=context['summary']
     )
     
-    # Guardar respuesta del agente
-    await chat_memory_service.add_message(
-        session_id=session.id,
-        role='assistant',
-        content=ai_response,
-        model_used='claude-3.5-sonnet',
-        message_metadata={'channel': 'web_chat'}
+    # Guardar mensaje del usuario, respuesta y contadores en una transacción
+    await chat_memory_service.persist_turn(
+        session_id=turn['session_id'],
+        user_message=chat_data.message,
+        assistant_message=ai_response,
+        user_timestamp=user_timestamp,
+        user_local_date=turn['local_date'],
+        model_used=model_used,
+        message_metadata={
+            'channel': 'web_chat',
+            'context_tokens': context['tokens_sent'],
+            'context_tokens_saved': context['tokens_saved']
+        }
     )
     
+    # Plegar en el resumen los turnos que quedaron fuera de la ventana (fuera del camino crítico)
+    if context['to_summarize']:
+        chat_memory_service.schedule_rolling_summary(
+            session_id=turn['session_id'],
+            agent_name=chat_data.agent_name,
+            messages=context['to_summarize'],
+            previous_summary=turn['context_summary']
+        )
+    
     return ChatResponse(
         response=ai_response,
         agent_name=chat_data.agent_name,
-        conversation_id=session.id,
-        timestamp=now
+        conversation_id=turn['session_id'],
+        timestamp=datetime.now(timezone.utc)
+    )
+
+@api_router.post('/chat/stream')
+async def chat_stream(chat_data: ChatRequest):
+    """
+    Chat con el agente en streaming (Server-Sent Events).
+    
+    Eventos: start (conversation_id), token (fragmento de texto), done
+    (respuesta completa guardada, ttft_ms) o error. Si el cliente se
+    desconecta, se cancela la solicitud a OpenRouter y el turno no se guarda.
+    """
+    from fastapi.responses import StreamingResponse
+    from chat_memory_service import chat_memory_service
+    
+    user_timestamp = datetime.utcnow()
+    
+    turn = await chat_memory_service.load_turn_context(
+        agent_name=chat_data.agent_name,
+        user_id=chat_data.user_id,
+        visitor_id=chat_data.visitor_id,
+        user_timezone=chat_data.timezone,
+        session_metadata={
+            'channel': 'web_chat',
+            'user_agent': chat_data.user_agent
+        },
+        history_limit=50
+    )
+    context = chat_context_builder.build(
+        turn['history'],
+        model=CHAT_MODEL,
+        summary=turn['context_summary'],
+        summary_until=turn['context_summary_until']
+    )
+    
+    def sse(event: str, data: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    
+    async def event_stream():
+        stats = {}
+        parts = []
+        yield sse('start', {'conversation_id': turn['session_id'], 'agent_name': chat_data.agent_name})
+        
+        upstream = stream_chat_with_claude(
+            message=chat_data.message,
+            agent_name=chat_data.agent_name,
+            conversation_history=context['history'],
+            is_first_message_today=turn['is_first_message_today'],
+            context_summary=context['summary'],
+            stats=stats
+        )
+        try:
+            async for delta in upstream:
+                parts.append(delta)
+                yield sse('token', {'content': delta})
+        except LLMBackpressureError as e:
+            yield sse('error', {
+                'message': 'Nuestros agentes están atendiendo muchas consultas, intenta nuevamente en unos segundos',
+                'retry_after': int(e.retry_after)
+            })
+            return
+        except Exception as e:
+            logger.error(f"Error en chat streaming: {str(e)}")
+            yield sse('error', {'message': 'Lo siento, hubo un error al procesar tu mensaje. Por favor, intenta nuevamente.'})
+            return
+        finally:
+            # Desconexión del cliente: cierra el stream hacia OpenRouter
+            await upstream.aclose()
+        
+        ai_response = ''.join(parts)
+        await chat_memory_service.persist_turn(
+            session_id=turn['session_id'],
+            user_message=chat_data.message,
+            assistant_message=ai_response,
+            user_timestamp=user_timestamp,
+            user_local_date=turn['local_date'],
+            model_used=stats.get('model'),
+            message_metadata={
+                'channel': 'web_chat',
+                'streamed': True,
+                'ttft_ms': stats.get('ttft_ms'),
+                'context_tokens': context['tokens_sent'],
+                'context_tokens_saved': context['tokens_saved']
+            }
+        )
+        
+        if context['to_summarize']:
+            chat_memory_service.schedule_rolling_summary(
+                session_id=turn['session_id'],
+                agent_name=chat_data.agent_name,
+                messages=context['to_summarize'],
+                previous_summary=turn['context_summary']
+            )
+        
+        yield sse('done', {
+            'conversation_id': turn['session_id'],
+            'response': ai_response,
+            'ttft_ms': stats.get('ttft_ms'),
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        })
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Nginx: no bufferizar el stream
+        }
     )
 
 @api_router.get('/conversations/{conversation_id}', response_model=ConversationResponse)
@@ -819,74 +1037,97 @@ async def get_blog_post(
     slug: str,
     db: AsyncSession = Depends(get_db)
 ):
-    """Get blog post by slug (público, incrementa views)"""
-    result = await db.execute(select(BlogPost).filter(BlogPost.slug == slug))
-    post = result.scalar_one_or_none()
+    """Get blog post by slug (público, incrementa views con escritura diferida)"""
+    from blog_views import blog_post_cache
     
-    if not post or not post.published:
+    async def load():
+        result = await db.execute(select(BlogPost).filter(BlogPost.slug == slug))
+        post = result.scalar_one_or_none()
+        if not post or not post.published:
+            return None
+        return BlogPostResponse.model_validate(post)
+    
+    post = await blog_post_cache.view(slug, load)
+    if post is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail='Blog post not found'
         )
     
-    # Increment views
-    post.views += 1
-    await db.commit()
-    
-    return BlogPostResponse.model_validate(post)
+    return post
 
 
 # ============================================
 # BLOG ADMIN ROUTES (Generación bajo demanda)
 # ============================================
 
-@api_router.post('/blog/generate/custom')
+async def _run_custom_article_job(payload: dict, ctx):
+    """Tarea 'blog.custom_article': genera el artículo y lo deja en cola de aprobación"""
+    from blog_generator_service import blog_generator
+    
+    async with AsyncSessionLocal() as db:
+        blog_post = await blog_generator.generate_custom_article(
+            search_query=payload['search_query'],
+            target_keywords=payload.get('target_keywords') or [],
+            agent_id=payload.get('agent_id'),
+            tone=payload.get('tone', 'profesional'),
+            length=payload.get('length', 'medium'),
+            include_faq=payload.get('include_faq', True),
+            db=db,
+            progress=ctx.progress
+        )
+    
+    if not blog_post:
+        # Se reintenta con backoff (errores del LLM o de la imagen)
+        raise RuntimeError('Error generando artículo')
+    
+    return {
+        "article_id": blog_post.id,
+        "status": "pending_approval",
+        "message": "Artículo generado. En cola de aprobación."
+    }
+
+job_queue.register('blog.custom_article', _run_custom_article_job)
+
+
+@api_router.post('/blog/generate/custom', status_code=status.HTTP_202_ACCEPTED)
 async def generate_custom_article(
     request: 'ManualArticleRequest',
     current_user: User = Depends(get_current_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
-    Generar artículo personalizado bajo demanda (requiere admin)
-    El artículo queda en cola de aprobación
+    Encolar la generación de un artículo personalizado (requiere admin)
+    Responde de inmediato con el job_id; el progreso se consulta en /api/jobs/{job_id}
+    y el artículo queda en cola de aprobación
     """
-    from blog_generator_service import blog_generator
-    from database import SessionLocal
+    job = await job_queue.enqueue(db, 'blog.custom_article', request.model_dump(), user_id=current_user.id)
     
-    # Usar SessionLocal para operación síncrona
-    sync_db = SessionLocal()
+    return {
+        "success": True,
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/jobs/{job.id}",
+        "message": "Generación encolada. El artículo quedará en cola de aprobación."
+    }
+
+
+@api_router.get('/jobs/{job_id}')
+async def get_job_status(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Estado, progreso y resultado de una tarea en segundo plano (dueño o admin)"""
+    job = await job_queue.get(db, job_id)
     
-    try:
-        blog_post = await blog_generator.generate_custom_article(
-            search_query=request.search_query,
-            target_keywords=request.target_keywords or [],
-            agent_id=request.agent_id,
-            tone=request.tone,
-            length=request.length,
-            include_faq=request.include_faq,
-            db=sync_db
-        )
-        
-        if blog_post:
-            return {
-                "success": True,
-                "article_id": blog_post.id,
-                "status": "pending_approval",
-                "message": "Artículo generado. En cola de aprobación."
-            }
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Error generando artículo"
-            )
-    except Exception as e:
-        logger.error(f"Error en generate_custom_article: {str(e)}")
+    if not job or (job.user_id != current_user.id and current_user.role != UserRole.ADMIN):
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=str(e)
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Job not found'
         )
-    finally:
-        sync_db.close()
+    
+    return job_to_dict(job)
 
 
 @api_router.get('/blog/posts/{post_id}/preview', response_model=BlogPostResponse)
@@ -939,6 +1180,9 @@ async def approve_article(
     await db.commit()
     await db.refresh(post)
     
+    from blog_views import blog_post_cache
+    blog_post_cache.invalidate(post.slug)
+    
     return {
         "success": True,
         "message": "Artículo aprobado y publicado",
@@ -972,6 +1216,9 @@ async def reject_article(
     await db.delete(post)
     await db.commit()
     
+    from blog_views import blog_post_cache
+    blog_post_cache.invalidate(post.slug)
+    
     return {
         "success": True,
         "message": f"Artículo rechazado y eliminado. Razón: {reason or 'No especificada'}"
@@ -1289,34 +1536,18 @@ async def get_user_dashboard_stats(
     db: AsyncSession = Depends(get_db)
 ):
     """Get dashboard statistics for current user"""
+    from stats_service import dashboard_stats
     
-    # Total orders
-    orders_result = await db.execute(
-        select(Order).filter(Order.user_id == current_user.id)
-    )
-    all_orders = orders_result.scalars().all()
-    total_orders = len(all_orders)
-    
-    # Orders by status
-    completed_orders = len([o for o in all_orders if o.payment_status == 'completed'])
-    pending_orders = len([o for o in all_orders if o.payment_status == 'pending'])
-    
-    # Total spent
-    total_spent = sum([o.final_price for o in all_orders if o.payment_status == 'completed'])
-    
-    # Active subscriptions (completed orders)
-    active_subscriptions = completed_orders
-    
-    # Recent orders (last 5)
-    recent_orders = sorted(all_orders, key=lambda x: x.created_at, reverse=True)[:5]
+    stats = await dashboard_stats.user_stats(db, current_user.id)
     
     return {
-        'total_orders': total_orders,
-        'completed_orders': completed_orders,
-        'pending_orders': pending_orders,
-        'active_subscriptions': active_subscriptions,
-        'total_spent': total_spent,
-        'recent_orders': [OrderResponse.model_validate(o) for o in recent_orders]
+        'total_orders': stats['total_orders'],
+        'completed_orders': stats['completed_orders'],
+        'pending_orders': stats['pending_orders'],
+        # Active subscriptions (completed orders)
+        'active_subscriptions': stats['completed_orders'],
+        'total_spent': stats['total_spent'],
+        'recent_orders': [OrderResponse.model_validate(o) for o in stats['recent_orders']]
     }
 
 
@@ -1329,6 +1560,7 @@ async def get_user_subscriptions(
     
     try:
         # Try PostgreSQL first
+        datastore_router.ensure_postgres()
         # Get completed orders (active subscriptions)
         orders_result = await db.execute(
             select(Order).filter(
@@ -1367,6 +1599,7 @@ async def get_user_subscriptions(
         return subscriptions
         
     except Exception as e:
+        datastore_router.record_failure(e)
         # MongoDB fallback - return empty subscriptions for now
         logger.warning(f"PostgreSQL not available for subscriptions, using MongoDB fallback: {str(e)}")
         
@@ -1428,6 +1661,7 @@ async def update_user_profile(
         user.timezone = profile_data['timezone']
     
     await db.commit()
+    user_cache.invalidate(user.id)
     await db.refresh(user)
     
     return {'message': 'Profile updated successfully', 'user': UserResponse.model_validate(user)}
@@ -1443,8 +1677,10 @@ async def delete_account(
     """
     try:
         # Eliminar usuario y todas sus relaciones (cascade en DB)
-        await db.delete(current_user)
+        result = await db.execute(select(User).filter(User.id == current_user.id))
+        await db.delete(result.scalar_one())
         await db.commit()
+        user_cache.invalidate(current_user.id)
         
         logger.info(f"Cuenta eliminada: {current_user.email}")
         
@@ -1555,6 +1791,7 @@ async def enable_2fa_user(
     user.two_factor_secret = secret
     
     await db.commit()
+    user_cache.invalidate(user.id)
     
     # Generate QR code
     import pyotp
@@ -1607,6 +1844,7 @@ async def verify_enable_2fa(
     
     user.two_factor_enabled = True
     await db.commit()
+    user_cache.invalidate(user.id)
     
     return {'message': '2FA enabled successfully'}
 
@@ -1635,6 +1873,7 @@ async def disable_2fa_user(
     user.two_factor_secret = None
     
     await db.commit()
+    user_cache.invalidate(user.id)
     
     return {'message': '2FA disabled successfully'}
 
@@ -1648,62 +1887,15 @@ async def get_admin_stats(
     db: AsyncSession = Depends(get_db)
 ):
     """Get admin dashboard statistics"""
+    from stats_service import dashboard_stats
     
     try:
-        # Try PostgreSQL first
-        # Total users
-        users_result = await db.execute(select(User))
-        all_users = users_result.scalars().all()
-        total_users = len(all_users)
-        
-        # Total orders
-        orders_result = await db.execute(select(Order))
-        all_orders = orders_result.scalars().all()
-        total_orders = len(all_orders)
-        
-        # Orders by status
-        completed_orders = len([o for o in all_orders if o.payment_status == 'completed'])
-        pending_orders = len([o for o in all_orders if o.payment_status == 'pending'])
-        failed_orders = len([o for o in all_orders if o.payment_status == 'failed'])
-        
-        # Total revenue (completed orders)
-        total_revenue = sum([o.final_price for o in all_orders if o.payment_status == 'completed'])
-        
-        # Revenue by payment method
-        revenue_by_method = {}
-        for order in all_orders:
-            if order.payment_status == 'completed':
-                method = order.payment_method
-                if method not in revenue_by_method:
-                    revenue_by_method[method] = 0
-                revenue_by_method[method] += order.final_price
-        
-        # Total services
-        services_result = await db.execute(select(Service))
-        total_services = len(services_result.scalars().all())
-        
-        return {
-            'users': {
-                'total': total_users,
-                'verified': len([u for u in all_users if u.is_verified]),
-                'with_2fa': len([u for u in all_users if u.two_factor_enabled])
-            },
-            'orders': {
-                'total': total_orders,
-                'completed': completed_orders,
-                'pending': pending_orders,
-                'failed': failed_orders
-            },
-            'revenue': {
-                'total': total_revenue,
-                'by_method': revenue_by_method
-            },
-            'services': {
-                'total': total_services
-            }
-        }
+        # Try PostgreSQL first (agregados SQL, sin cargar tablas completas)
+        datastore_router.ensure_postgres()
+        return await dashboard_stats.admin_stats(db)
         
     except Exception as e:
+        datastore_router.record_failure(e)
         # MongoDB fallback
         logger.warning(f"PostgreSQL not available for admin stats, using MongoDB fallback: {str(e)}")
         
@@ -1741,29 +1933,38 @@ async def get_admin_stats(
 
 @api_router.get('/admin/users')
 async def get_all_users(
-    skip: int = 0,
+    response: Response,
+    cursor: Optional[str] = None,
     limit: int = 50,
     current_user: User = Depends(get_current_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get all users (Admin only)"""
+    """Get all users (Admin only). La página siguiente se pide con el header X-Next-Cursor como cursor"""
+    from admin_search import keyset_page, mongo_keyset_page, InvalidCursor
+    
     try:
         # Try PostgreSQL first
-        result = await db.execute(
-            select(User)
-            .order_by(User.created_at.desc())
-            .offset(skip)
-            .limit(limit)
-        )
-        users = result.scalars().all()
+        datastore_router.ensure_postgres()
+        users, next_cursor = await keyset_page(db, select(User), User, cursor, limit)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
         return [UserResponse.model_validate(user) for user in users]
+    
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
         
     except Exception as e:
+        datastore_router.record_failure(e)
         # MongoDB fallback
         logger.warning(f"PostgreSQL not available for admin users, using MongoDB fallback: {str(e)}")
         
-        # Get users from MongoDB with pagination
-        mongo_users = await users_collection.find().skip(skip).limit(limit).to_list(length=limit)
+        # Get users from MongoDB with the same keyset pagination
+        try:
+            mongo_users, next_cursor = await mongo_keyset_page(users_collection, cursor, limit)
+        except InvalidCursor:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
         
         # Convert MongoDB users to UserResponse format
         user_responses = []
@@ -1817,6 +2018,7 @@ async def update_user_role(
     
     user.role = UserRole(new_role)
     await db.commit()
+    user_cache.invalidate(user.id)
     
     return {'message': 'Role updated successfully', 'user': UserResponse.model_validate(user)}
 
@@ -1844,25 +2046,33 @@ async def update_user_status(
         user.is_verified = status_data['is_verified']
     
     await db.commit()
+    user_cache.invalidate(user.id)
     
     return {'message': 'Status updated successfully', 'user': UserResponse.model_validate(user)}
 
 @api_router.get('/admin/orders')
 async def get_all_orders_admin(
-    skip: int = 0,
+    response: Response,
+    cursor: Optional[str] = None,
     limit: int = 50,
     payment_status: Optional[str] = None,
     current_user: User = Depends(get_current_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get all orders (Admin only)"""
-    query = select(Order).order_by(Order.created_at.desc())
+    """Get all orders (Admin only). La página siguiente se pide con el header X-Next-Cursor como cursor"""
+    from admin_search import keyset_page, InvalidCursor
+    
+    query = select(Order)
     
     if payment_status:
         query = query.filter(Order.payment_status == payment_status)
     
-    result = await db.execute(query.offset(skip).limit(limit))
-    orders = result.scalars().all()
+    try:
+        orders, next_cursor = await keyset_page(db, query, Order, cursor, limit)
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
     
     return [OrderResponse.model_validate(order) for order in orders]
 
@@ -2168,6 +2378,7 @@ async def update_service_admin(
     
     await db.commit()
     await db.refresh(service)
+    catalog_cache.invalidate()
     
     return {'message': 'Service updated successfully', 'service': ServiceResponse.model_validate(service)}
 
@@ -2183,6 +2394,7 @@ async def create_service_admin(
     db.add(new_service)
     await db.commit()
     await db.refresh(new_service)
+    catalog_cache.invalidate()
     
     return {'message': 'Service created successfully', 'service': ServiceResponse.model_validate(new_service)}
 
@@ -2204,25 +2416,34 @@ async def delete_service_admin(
     
     await db.delete(service)
     await db.commit()
+    catalog_cache.invalidate()
     
     return {'message': 'Service deleted successfully'}
 
 @api_router.get('/admin/transactions')
 async def get_all_transactions_admin(
-    skip: int = 0,
+    response: Response,
+    cursor: Optional[str] = None,
     limit: int = 50,
     payment_method: Optional[str] = None,
     current_user: User = Depends(get_current_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get all transactions (Admin only)"""
-    query = select(Transaction).order_by(Transaction.created_at.desc())
+    """Get all transactions (Admin only). La página siguiente se pide con el header X-Next-Cursor como cursor"""
+    from admin_search import keyset_page, InvalidCursor
+    
+    query = select(Transaction)
     
     if payment_method:
-        query = query.filter(Transaction.payment_method == payment_method)
+        # Transaction no tiene payment_method: el método de pago es el gateway
+        query = query.filter(Transaction.gateway == payment_method)
     
-    result = await db.execute(query.offset(skip).limit(limit))
-    transactions = result.scalars().all()
+    try:
+        transactions, next_cursor = await keyset_page(db, query, Transaction, cursor, limit)
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
     
     return [{
         'id': str(t.id),
@@ -2240,33 +2461,27 @@ async def get_all_transactions_admin(
 async def admin_search(
     q: str,
     type: str = 'users',  # 'users', 'orders', 'services'
+    limit: int = 20,
     current_user: User = Depends(get_current_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Search functionality for admin panel"""
+    """Search functionality for admin panel (índices pg_trgm, resultados ordenados por relevancia)"""
+    from admin_search import search_users, search_orders, search_services
+    
+    q = q.strip()
+    if not q:
+        return []
+    
     if type == 'users':
-        result = await db.execute(
-            select(User).filter(
-                (User.email.ilike(f'%{q}%')) | (User.full_name.ilike(f'%{q}%'))
-            ).limit(20)
-        )
-        items = result.scalars().all()
+        items = await search_users(db, q, limit)
         return [UserResponse.model_validate(u) for u in items]
     
     elif type == 'orders':
-        result = await db.execute(
-            select(Order).filter(Order.id.ilike(f'%{q}%')).limit(20)
-        )
-        items = result.scalars().all()
+        items = await search_orders(db, q, limit)
         return [OrderResponse.model_validate(o) for o in items]
     
     elif type == 'services':
-        result = await db.execute(
-            select(Service).filter(
-                (Service.title.ilike(f'%{q}%')) | (Service.description.ilike(f'%{q}%'))
-            ).limit(20)
-        )
-        items = result.scalars().all()
+        items = await search_services(db, q, limit)
         return [ServiceResponse.model_validate(s) for s in items]
     
     return []
@@ -2278,63 +2493,9 @@ async def get_admin_analytics(
     db: AsyncSession = Depends(get_db)
 ):
     """Get analytics data for charts"""
-    from datetime import timedelta
-    
-    start_date = datetime.utcnow() - timedelta(days=days)
-    
-    # Revenue over time
-    result = await db.execute(
-        select(Order).filter(
-            Order.created_at >= start_date,
-            Order.payment_status == 'completed'
-        ).order_by(Order.created_at)
-    )
-    orders = result.scalars().all()
-    
-    # Group by date
-    revenue_by_date = {}
-    for order in orders:
-        date_key = order.created_at.strftime('%Y-%m-%d')
-        if date_key not in revenue_by_date:
-            revenue_by_date[date_key] = 0
-        revenue_by_date[date_key] += order.final_price
-    
-    # Users growth
-    result = await db.execute(
-        select(User).filter(User.created_at >= start_date).order_by(User.created_at)
-    )
-    users = result.scalars().all()
-    
-    users_by_date = {}
-    for user in users:
-        date_key = user.created_at.strftime('%Y-%m-%d')
-        if date_key not in users_by_date:
-            users_by_date[date_key] = 0
-        users_by_date[date_key] += 1
-    
-    # Most popular services
-    service_orders = {}
-    for order in orders:
-        if order.service_id not in service_orders:
-            service_orders[order.service_id] = 0
-        service_orders[order.service_id] += 1
-    
-    # Get service details
-    popular_services = []
-    for service_id, count in sorted(service_orders.items(), key=lambda x: x[1], reverse=True)[:5]:
-        result = await db.execute(select(Service).filter(Service.id == service_id))
-        service = result.scalar_one_or_none()
-        if service:
-            popular_services.append({
-                'service': service.title,
-                'orders': count
-            })
+    from analytics_service import analytics_service
     
-    return {
-        'revenue_by_date': revenue_by_date,
-        'users_by_date': users_by_date,
-        'popular_services': popular_services
-    }
+    return await analytics_service.admin_analytics(db, days)
 
 
 
@@ -2438,9 +2599,9 @@ async def llm_chat(
     
     message = request.get('message')
     system_message = request.get('system_message', 'You are a helpful AI assistant.')
-    session_id = request.get('session_id', f"user_{current_user.id}")
+    session_id = request.get('session_id', 'default')
     
-    result = await llm_service.chat(message, system_message, session_id)
+    result = await llm_service.chat(message, system_message, session_id, user_id=str(current_user.id))
     return result
 
 
@@ -2449,22 +2610,44 @@ async def technical_consultation(
     request: dict,
     current_user: User = Depends(get_current_user)
 ):
-    """Technical consultation"""
+    """Technical consultation (con session_id mantiene la conversación; sin él, respuesta cacheable)"""
     from llm_service import llm_service
     
     question = request.get('question')
-    session_id = request.get('session_id', f"tech_{current_user.id}")
+    session_id = request.get('session_id')
     
-    result = await llm_service.technical_consultation(question, session_id)
+    result = await llm_service.technical_consultation(
+        question, session_id, use_cache=request.get('use_cache', False), user_id=str(current_user.id)
+    )
     return result
 
 
+async def _run_generate_blog_job(payload: dict, ctx):
+    """Tarea 'llm.generate_blog': mismo resultado que /user/llm/generate-blog"""
+    from llm_service import llm_service
+    
+    await ctx.progress(10, 'Generando contenido')
+    result = await llm_service.generate_blog(
+        payload.get('topic'),
+        payload.get('keywords', ''),
+        payload.get('tone', 'professional'),
+        payload.get('length', 'medium'),
+        use_cache=payload.get('use_cache', False)
+    )
+    if not result.get('success'):
+        raise RuntimeError(result.get('error') or 'Error generando contenido')
+    return result
+
+job_queue.register('llm.generate_blog', _run_generate_blog_job)
+
+
 @api_router.post('/user/llm/generate-blog', tags=["User - LLM"])
 async def generate_blog(
     request: dict,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Generate blog content"""
+    """Generate blog content (con background=true se encola y responde con el job_id)"""
     from llm_service import llm_service
     
     topic = request.get('topic')
@@ -2472,7 +2655,19 @@ async def generate_blog(
     tone = request.get('tone', 'professional')
     length = request.get('length', 'medium')
     
-    result = await llm_service.generate_blog(topic, keywords, tone, length)
+    if request.get('background'):
+        job = await job_queue.enqueue(db, 'llm.generate_blog', {
+            'topic': topic,
+            'keywords': keywords,
+            'tone': tone,
+            'length': length,
+            'use_cache': request.get('use_cache', False)
+        }, user_id=current_user.id)
+        return {'success': True, 'job_id': job.id, 'status': job.status, 'status_url': f'/api/jobs/{job.id}'}
+    
+    result = await llm_service.generate_blog(
+        topic, keywords, tone, length, use_cache=request.get('use_cache', False)
+    )
     return result
 
 
@@ -2517,7 +2712,9 @@ async def generate_social_post(
     platform = request.get('platform', 'facebook')
     tone = request.get('tone', 'professional')
     
-    result = await llm_service.generate_social_media_post(topic, platform, tone)
+    result = await llm_service.generate_social_media_post(
+        topic, platform, tone, use_cache=request.get('use_cache', False)
+    )
     return result
 
 
@@ -2533,7 +2730,9 @@ async def find_leads(
     location = request.get('location')
     size = request.get('size', '')
     
-    result = await llm_service.find_leads(industry, location, size)
+    result = await llm_service.find_leads(
+        industry, location, size, use_cache=request.get('use_cache', False)
+    )
     return result
 
     
@@ -2633,6 +2832,79 @@ async def stop_all_telegram_bots(current_user: User = Depends(get_current_admin_
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ============================================
+# ADMIN - DATABASE METRICS
+# ============================================
+
+@api_router.get('/admin/db/mongo-metrics', tags=["Admin - Database"])
+async def get_mongo_metrics(current_user: User = Depends(get_current_admin_user)):
+    """Latencia por colección (p50/p95) y configuración del pool de MongoDB"""
+    from database_mongo import get_latency_metrics
+    return get_latency_metrics()
+
+
+@api_router.get('/admin/upstream/metrics', tags=["Admin - Database"])
+async def get_upstream_metrics(current_user: User = Depends(get_current_admin_user)):
+    """Reutilización de conexiones, HTTP/2 y reintentos hacia APIs externas (OpenRouter)"""
+    from upstream_http import upstream_http
+    return upstream_http.stats()
+
+
+@api_router.get('/admin/llm/scheduler', tags=["Admin - LLM"])
+async def get_llm_scheduler_metrics(current_user: User = Depends(get_current_admin_user)):
+    """Concurrencia, profundidad de cola por prioridad y esperas por modelo LLM"""
+    return llm_scheduler.stats()
+
+
+@api_router.get('/admin/llm/models', tags=["Admin - LLM"])
+async def get_llm_model_health(current_user: User = Depends(get_current_admin_user)):
+    """Latencia p50/p95, tasa de error, hedging y failover por modelo de chat"""
+    from ai_service import model_router, CHAT_MODELS
+    return {'candidates': CHAT_MODELS, **model_router.stats()}
+
+
+@api_router.get('/admin/jobs', tags=["Admin - Database"])
+async def get_job_queue_metrics(current_user: User = Depends(get_current_admin_user)):
+    """Workers, tareas en curso y contadores de la cola de tareas"""
+    return job_queue.stats()
+
+
+@api_router.get('/admin/blog/views', tags=["Admin - Database"])
+async def get_blog_views_metrics(current_user: User = Depends(get_current_admin_user)):
+    """Vistas pendientes de volcar y aciertos de la cache de artículos"""
+    from blog_views import blog_view_buffer, blog_post_cache
+    return {
+        'views': blog_view_buffer.stats(),
+        'posts_cache': blog_post_cache.stats()
+    }
+
+
+@api_router.get('/admin/catalog/cache', tags=["Admin - Database"])
+async def get_catalog_cache_metrics(current_user: User = Depends(get_current_admin_user)):
+    """Versión, tamaño y ETag del catálogo pre-serializado"""
+    return catalog_cache.stats()
+
+
+@api_router.get('/admin/auth/user-cache', tags=["Admin - Database"])
+async def get_user_cache_metrics(current_user: User = Depends(get_current_admin_user)):
+    """Aciertos e invalidaciones de la cache de usuarios autenticados"""
+    return user_cache.stats()
+
+
+@api_router.get('/admin/llm/cache', tags=["Admin - LLM"])
+async def get_llm_cache_metrics(current_user: User = Depends(get_current_admin_user)):
+    """Aciertos por nivel, coalescencia y reglas de la cache de respuestas LLM"""
+    from llm_response_cache import llm_response_cache
+    return llm_response_cache.stats()
+
+
+@api_router.get('/admin/llm/sessions', tags=["Admin - LLM"])
+async def get_llm_session_metrics(current_user: User = Depends(get_current_admin_user)):
+    """Conversaciones LlmChat activas, reutilización y costo de construcción"""
+    from llm_session_manager import llm_session_manager
+    return llm_session_manager.stats()
+
+
 # ============================================
 # EXTERNAL APIS ENDPOINTS - Google Vision, CoinGecko, Blockchain
 # ============================================
@@ -2929,7 +3201,7 @@ async def receive_telegram_webhook(
 async def cleanup_old_chat_messages(current_user: User = Depends(get_current_admin_user)):
     """
     Limpia mensajes de chat con más de 30 días.
-    Debe ejecutarse periódicamente (ej: cron diario).
+    El scheduler la ejecuta a diario (02:00 AM); este endpoint permite forzarla.
     """
     from chat_memory_service import chat_memory_service
     
@@ -2983,47 +3255,47 @@ async def get_chat_statistics(current_user: User = Depends(get_current_admin_use
             'active_sessions': active_sessions,
             'total_messages': total_messages,
             'messages_by_agent': messages_by_agent,
-            'retention_days': 30
+            'retention_days': 30,
+            'context_builder': chat_context_builder.stats(),
+            'streaming': chat_stream_metrics.snapshot()
         }
 
 
 @api_router.get('/user/chat/history', tags=["User - Chat"])
 async def get_user_chat_history(
     agent_name: Optional[str] = None,
+    session_id: Optional[str] = None,
     limit: int = 50,
+    before: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
-    """Obtiene el historial de chat del usuario"""
+    """
+    Obtiene el historial de chat del usuario (últimas 10 sesiones).
+    
+    Para ver mensajes anteriores de una sesión, enviar session_id y el
+    next_cursor de esa sesión como before.
+    """
     from chat_memory_service import chat_memory_service
-    from sqlalchemy import and_
     
-    async with AsyncSessionLocal() as db:
-        query = select(ChatSession).where(ChatSession.user_id == current_user.id)
-        
-        if agent_name:
-            query = query.where(ChatSession.agent_name == agent_name)
-        
-        query = query.order_by(ChatSession.last_interaction_date.desc()).limit(10)
-        
-        result = await db.execute(query)
-        sessions = result.scalars().all()
-        
-        sessions_data = []
-        for session in sessions:
-            messages = await chat_memory_service.get_session_history(
-                session_id=session.id,
-                limit=limit
-            )
-            
-            sessions_data.append({
-                'session_id': session.id,
-                'agent_name': session.agent_name,
-                'first_interaction': session.first_interaction_date.isoformat(),
-                'last_interaction': session.last_interaction_date.isoformat(),
-                'total_messages': session.total_messages,
-                'messages': messages
-            })
-        
+    try:
+        sessions_data = await chat_memory_service.get_user_chat_history(
+            user_id=current_user.id,
+            agent_name=agent_name,
+            session_id=session_id,
+            session_limit=10,
+            messages_per_session=min(max(limit, 1), 200),
+            before=before
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor inválido"
+        )
+    
+    return {
+        'sessions': sessions_data,
+        'total_sessions': len(sessions_data)
+    }
 
 
 # ========================================
@@ -3071,7 +3343,6 @@ async def google_oauth_callback(
     Callback de Google OAuth. Procesa el código y crea/actualiza el usuario.
     """
     from google_oauth_service import google_oauth_service
-    from auth import create_access_token
     from fastapi.responses import RedirectResponse
     import base64
     
@@ -3125,6 +3396,7 @@ async def google_oauth_callback(
             user.is_verified = True
             user.last_login = datetime.now(timezone.utc)
             await db.commit()
+            user_cache.invalidate(user.id)
             
             logger.info(f"Usuario existente autenticado vía Google OAuth: {email}")
         
@@ -3135,7 +3407,7 @@ async def google_oauth_callback(
         )
         
         # Generar JWT token para nuestra aplicación
-        access_token = create_access_token(data={'sub': user.email})
+        access_token = create_user_token(user.id, user.role, user.is_active)
         
         # Redirigir al frontend con el token
         frontend_url = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
@@ -0,0 +1,230 @@
+"""
+GuaraniAppStore V2.5 Pro - Dashboard Stats
+Estadísticas de /api/admin/stats y /api/user/dashboard/stats con agregados SQL.
+
+Benchmark (PostgreSQL de prueba, nunca producción):
+    python stats_service.py --seed 1000000    # sembrar órdenes sintéticas
+    python stats_service.py --benchmark       # agregados SQL (y vista materializada si existe)
+    python stats_service.py --benchmark --legacy   # incluye la versión anterior (carga todas las filas)
+"""
+
+import os
+import time
+import asyncio
+import logging
+import tracemalloc
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, func, text
+
+from models import User, Order, Service
+from database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Vista materializada opcional con los totales de órdenes (refrescada por el scheduler)
+ADMIN_STATS_MATERIALIZED = os.environ.get('ADMIN_STATS_MATERIALIZED', 'false').lower() == 'true'
+ADMIN_STATS_REFRESH_MINUTES = int(os.environ.get('ADMIN_STATS_REFRESH_MINUTES', '5'))
+
+ORDER_STATS_VIEW = 'order_stats_summary'
+
+ORDER_STATS_VIEW_SQL = [
+    f"CREATE MATERIALIZED VIEW IF NOT EXISTS {ORDER_STATS_VIEW} AS "
+    "SELECT payment_method, coalesce(payment_status, '') AS payment_status, "
+    "count(*) AS orders, coalesce(sum(final_price), 0) AS amount "
+    "FROM orders GROUP BY 1, 2",
+    # Índice único (sólo columnas) requerido por REFRESH ... CONCURRENTLY
+    f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{ORDER_STATS_VIEW} ON {ORDER_STATS_VIEW} (payment_method, payment_status)",
+]
+
+
+class DashboardStatsService:
+    """
+    Agregados en la base de datos: la memoria usada no depende del número de
+    órdenes ni de usuarios, sólo de la cantidad de combinaciones
+    (método de pago, estado), que es pequeña y acotada.
+    """
+
+    def __init__(self, materialized: bool = ADMIN_STATS_MATERIALIZED):
+        self.materialized = materialized
+        self.last_refresh: Optional[datetime] = None
+
+    async def _order_groups(self, db) -> List[Any]:
+        if self.materialized:
+            result = await db.execute(text(
+                f"SELECT payment_method, payment_status, orders, amount FROM {ORDER_STATS_VIEW}"
+            ))
+        else:
+            result = await db.execute(
+                select(
+                    Order.payment_method,
+                    Order.payment_status,
+                    func.count().label('orders'),
+                    func.coalesce(func.sum(Order.final_price), 0).label('amount')
+                ).group_by(Order.payment_method, Order.payment_status)
+            )
+        return result.all()
+
+    async def admin_stats(self, db) -> Dict[str, Any]:
+        users = (await db.execute(
+            select(
+                func.count().label('total'),
+                func.count().filter(User.is_verified == True).label('verified'),
+                func.count().filter(User.two_factor_enabled == True).label('with_2fa')
+            ).select_from(User)
+        )).one()
+        total_services = await db.scalar(select(func.count()).select_from(Service))
+
+        orders = {'total': 0, 'completed': 0, 'pending': 0, 'failed': 0}
+        total_revenue = 0.0
+        revenue_by_method: Dict[str, float] = {}
+        for method, status, count, amount in await self._order_groups(db):
+            orders['total'] += count
+            if status in orders:
+                orders[status] += count
+            if status == 'completed':
+                total_revenue += float(amount)
+                revenue_by_method[method] = revenue_by_method.get(method, 0) + float(amount)
+
+        return {
+            'users': {
+                'total': users.total,
+                'verified': users.verified,
+                'with_2fa': users.with_2fa
+            },
+            'orders': orders,
+            'revenue': {
+                'total': total_revenue,
+                'by_method': revenue_by_method
+            },
+            'services': {
+                'total': total_services
+            }
+        }
+
+    async def user_stats(self, db, user_id: str) -> Dict[str, Any]:
+        """Totales del usuario y sus 5 órdenes más recientes (índice ix_orders_user_created)"""
+        totals = (await db.execute(
+            select(
+                func.count().label('total'),
+                func.count().filter(Order.payment_status == 'completed').label('completed'),
+                func.count().filter(Order.payment_status == 'pending').label('pending'),
+                func.coalesce(
+                    func.sum(Order.final_price).filter(Order.payment_status == 'completed'), 0
+                ).label('spent')
+            ).where(Order.user_id == user_id)
+        )).one()
+        recent = await db.execute(
+            select(Order)
+            .where(Order.user_id == user_id)
+            .order_by(Order.created_at.desc())
+            .limit(5)
+        )
+        return {
+            'total_orders': totals.total,
+            'completed_orders': totals.completed,
+            'pending_orders': totals.pending,
+            'total_spent': float(totals.spent),
+            'recent_orders': recent.scalars().all()
+        }
+
+    async def ensure_summary(self, conn):
+        """Crear la vista materializada (arranque, sólo si está habilitada)"""
+        for statement in ORDER_STATS_VIEW_SQL:
+            await conn.execute(text(statement))
+
+    async def refresh_summary(self):
+        """Refrescar la vista sin bloquear lecturas"""
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            await db.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {ORDER_STATS_VIEW}"))
+            await db.commit()
+        self.last_refresh = datetime.utcnow()
+        logger.info(f"{ORDER_STATS_VIEW} refrescada en {time.perf_counter() - started:.2f}s")
+
+
+# Instancia global
+dashboard_stats = DashboardStatsService()
+
+
+# ----------------------------------------------------------------------
+# Benchmark
+# ----------------------------------------------------------------------
+
+BENCH_USER_EMAIL = 'benchmark-stats@guaraniappstore.test'
+BENCH_SERVICE_SLUG = 'benchmark-stats'
+
+
+async def _seed(count: int):
+    async with AsyncSessionLocal() as db:
+        user_id = await db.scalar(select(User.id).where(User.email == BENCH_USER_EMAIL))
+        if user_id is None:
+            user = User(email=BENCH_USER_EMAIL, full_name='Benchmark Stats')
+            db.add(user)
+            await db.flush()
+            user_id = user.id
+        service_id = await db.scalar(select(Service.id).where(Service.slug == BENCH_SERVICE_SLUG))
+        if service_id is None:
+            service = Service(name='Benchmark', slug=BENCH_SERVICE_SLUG, description='Benchmark', price_monthly=10)
+            db.add(service)
+            await db.flush()
+            service_id = service.id
+        await db.execute(text(
+            "INSERT INTO orders (id, user_id, service_id, order_number, plan_type, base_price, "
+            "discount_percentage, final_price, currency, payment_method, payment_status, created_at, updated_at) "
+            "SELECT gen_random_uuid()::text, :user_id, :service_id, 'BENCH-' || g || '-' || md5(random()::text), "
+            "'monthly', 100, 0, (random() * 500)::numeric(10,2), 'PYG', "
+            "(ARRAY['pagopar','btc','eth','usdt'])[1 + g % 4], "
+            "(ARRAY['completed','pending','failed','expired'])[1 + (g / 4) % 4], "
+            "now() - (g % 365) * interval '1 day', now() "
+            "FROM generate_series(1, :count) AS g"
+        ), {'user_id': user_id, 'service_id': service_id, 'count': count})
+        await db.commit()
+    print(f"{count} órdenes sembradas")
+
+
+async def _legacy_admin_stats(db) -> Dict[str, Any]:
+    """Implementación anterior: carga todas las órdenes y suma en Python"""
+    all_orders = (await db.execute(select(Order))).scalars().all()
+    return {
+        'total': len(all_orders),
+        'revenue': sum(o.final_price for o in all_orders if o.payment_status == 'completed')
+    }
+
+
+async def _measure(label: str, coro_factory):
+    async with AsyncSessionLocal() as db:
+        tracemalloc.start()
+        started = time.perf_counter()
+        await coro_factory(db)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    print(f"{label:<28} {elapsed * 1000:>10.1f} ms   pico {peak / 1024 / 1024:>8.2f} MiB")
+
+
+async def _benchmark(legacy: bool):
+    async with AsyncSessionLocal() as db:
+        orders = await db.scalar(select(func.count()).select_from(Order))
+        user_id = await db.scalar(select(User.id).where(User.email == BENCH_USER_EMAIL))
+        has_view = await db.scalar(text(f"SELECT to_regclass('{ORDER_STATS_VIEW}') IS NOT NULL"))
+    print(f"órdenes en la base: {orders}")
+
+    await _measure('admin_stats (SQL)', DashboardStatsService(materialized=False).admin_stats)
+    if has_view:
+        await _measure('admin_stats (materializada)', DashboardStatsService(materialized=True).admin_stats)
+    if user_id:
+        await _measure('user_stats (SQL)', lambda db: dashboard_stats.user_stats(db, user_id))
+    if legacy:
+        await _measure('admin_stats (anterior)', _legacy_admin_stats)
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if '--seed' in sys.argv:
+        asyncio.run(_seed(int(sys.argv[sys.argv.index('--seed') + 1])))
+    if '--benchmark' in sys.argv:
+        asyncio.run(_benchmark('--legacy' in sys.argv))
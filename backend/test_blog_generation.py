@@ -1,6 +1,18 @@
 """
 Script de testing para generación de artículos de blog
+
+    python test_blog_generation.py                     # genera el artículo del día
+    python test_blog_generation.py --load 20           # prueba de carga (20 generaciones concurrentes)
+    python test_blog_generation.py --load 20 --real-llm
+
+La prueba de carga mide, mientras corren las generaciones, el retraso del
+event loop y la latencia de consultas ajenas (SELECT 1) sobre el mismo pool.
+Por defecto simula el LLM con una espera (sin costo); los artículos de prueba
+quedan en cola de aprobación y se eliminan al terminar.
 """
+import sys
+import time
+import uuid
 import asyncio
 from blog_scheduler import test_generate_article
 
@@ -41,5 +53,85 @@ async def main():
         print("Revisa los logs del backend para más detalles")
         print()
 
+def _percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+    return f"p50 {pick(0.5):7.1f} ms   p99 {pick(0.99):7.1f} ms   max {ordered[-1]:7.1f} ms"
+
+async def load_test(concurrency: int, real_llm: bool):
+    from sqlalchemy import text, delete
+    from database import AsyncSessionLocal
+    from models import BlogPost
+    from blog_generator_service import BlogGeneratorService
+    
+    generator = BlogGeneratorService()
+    marker = f"loadtest-{uuid.uuid4().hex[:8]}"
+    
+    if not real_llm:
+        async def fake_content(topic, **kwargs):
+            await asyncio.sleep(2)
+            return {
+                'success': True,
+                'title': f"{topic} {uuid.uuid4().hex[:8]}",
+                'excerpt': 'Artículo de prueba de carga',
+                'content': 'Contenido de prueba.\n' * 200
+            }
+        
+        async def fake_image(article_content, article_title):
+            await asyncio.sleep(1)
+            return {}
+        
+        generator.generate_article_content = fake_content
+        generator.generate_image = fake_image
+    
+    async def generate(i):
+        async with AsyncSessionLocal() as db:
+            return await generator.generate_custom_article(
+                search_query=f"{marker} {i}", target_keywords=[], agent_id=None,
+                tone='profesional', length='medium', include_faq=False, db=db
+            )
+    
+    loop_lag, query_latency = [], []
+    done = asyncio.Event()
+    
+    async def probe_loop():
+        # Un tick de 10 ms que llega tarde indica que algo bloqueó el event loop
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            loop_lag.append((time.perf_counter() - started - 0.01) * 1000)
+    
+    async def probe_queries():
+        # Requests ajenas a la generación sobre el mismo pool
+        while not done.is_set():
+            started = time.perf_counter()
+            async with AsyncSessionLocal() as db:
+                await db.execute(text('SELECT 1'))
+            query_latency.append((time.perf_counter() - started) * 1000)
+            await asyncio.sleep(0.05)
+    
+    print(f"Prueba de carga: {concurrency} generaciones concurrentes ({'LLM real' if real_llm else 'LLM simulado'})")
+    probes = [asyncio.create_task(probe_loop()), asyncio.create_task(probe_queries())]
+    started = time.perf_counter()
+    results = await asyncio.gather(*[generate(i) for i in range(concurrency)], return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    done.set()
+    await asyncio.gather(*probes)
+    
+    failures = [r for r in results if isinstance(r, Exception)]
+    ok = sum(1 for r in results if r is not None and not isinstance(r, Exception))
+    print(f"Generaciones OK: {ok}/{concurrency} en {elapsed:.1f}s")
+    if failures:
+        print(f"Primer error: {type(failures[0]).__name__}: {failures[0]}")
+    print(f"Retraso del event loop:  {_percentiles(loop_lag)}")
+    print(f"SELECT 1 concurrente:    {_percentiles(query_latency)}")
+    
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(BlogPost).where(BlogPost.search_query.like(f"{marker} %")))
+        await db.commit()
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    if '--load' in sys.argv:
+        asyncio.run(load_test(int(sys.argv[sys.argv.index('--load') + 1]), '--real-llm' in sys.argv))
+    else:
+        asyncio.run(main())
@@ -1,9 +1,12 @@
 """
 Utilidades para manejo de zonas horarias por país
 """
-from datetime import datetime
+from datetime import datetime, date
+from typing import Optional
 import pytz
 
+DEFAULT_TIMEZONE = 'America/Asuncion'
+
 # Mapeo de países a zonas horarias (principales países de América Latina)
 COUNTRY_TIMEZONES = {
     'Paraguay': 'America/Asuncion',
@@ -27,7 +30,7 @@ def get_timezone_for_country(country: str) -> str:
     Obtiene la zona horaria para un país específico.
     Por defecto retorna America/Asuncion (Paraguay)
     """
-    return COUNTRY_TIMEZONES.get(country, 'America/Asuncion')
+    return COUNTRY_TIMEZONES.get(country, DEFAULT_TIMEZONE)
 
 def convert_to_user_timezone(utc_datetime: datetime, user_timezone: str) -> datetime:
     """
@@ -56,6 +59,17 @@ def get_current_time_for_user(user_timezone: str) -> datetime:
     user_tz = pytz.timezone(user_timezone)
     return datetime.now(user_tz)
 
+def get_local_date_for_user(user_timezone: Optional[str]) -> date:
+    """
+    Obtiene la fecha actual en la zona horaria del usuario.
+    Si la zona no es válida usa DEFAULT_TIMEZONE
+    """
+    try:
+        user_tz = pytz.timezone(user_timezone or DEFAULT_TIMEZONE)
+    except pytz.UnknownTimeZoneError:
+        user_tz = pytz.timezone(DEFAULT_TIMEZONE)
+    return datetime.now(user_tz).date()
+
 def format_datetime_for_user(dt: datetime, user_timezone: str, format_str: str = '%Y-%m-%d %H:%M:%S') -> str:
     """
     Formatea un datetime para mostrar al usuario en su zona horaria
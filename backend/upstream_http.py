@@ -0,0 +1,257 @@
+"""
+GuaraniAppStore V2.5 Pro - Cliente HTTP compartido para APIs externas (OpenRouter)
+Un pool por host con HTTP/2 y keep-alive: evita un handshake TLS por cada llamada.
+"""
+
+import os
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (requerido por httpx para HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_HTTP2 = os.environ.get('UPSTREAM_HTTP2', 'true').lower() == 'true'
+UPSTREAM_MAX_CONNECTIONS_PER_HOST = int(os.environ.get('UPSTREAM_MAX_CONNECTIONS_PER_HOST', '20'))
+UPSTREAM_MAX_KEEPALIVE_PER_HOST = int(os.environ.get('UPSTREAM_MAX_KEEPALIVE_PER_HOST', '10'))
+UPSTREAM_KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get('UPSTREAM_KEEPALIVE_EXPIRY_SECONDS', '120'))
+UPSTREAM_CONNECT_TIMEOUT_SECONDS = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT_SECONDS', '10'))
+UPSTREAM_DEFAULT_TIMEOUT_SECONDS = float(os.environ.get('UPSTREAM_DEFAULT_TIMEOUT_SECONDS', '60'))
+UPSTREAM_MAX_RETRIES = int(os.environ.get('UPSTREAM_MAX_RETRIES', '2'))
+# Hosts cuyos 429 gestiona llm_scheduler (slot.rate_limited): no se reintentan aquí
+UPSTREAM_SCHEDULED_HOSTS = {
+    host.strip().lower()
+    for host in os.environ.get('UPSTREAM_SCHEDULED_HOSTS', 'openrouter.ai').split(',')
+    if host.strip()
+}
+
+# Respuestas transitorias que vale la pena reintentar
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+SCHEDULED_RETRY_STATUS_CODES = RETRY_STATUS_CODES - {429}
+# Errores de transporte sin respuesta (incluye conexiones keep-alive cerradas por el servidor)
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+MAX_RETRY_AFTER_SECONDS = 10.0
+
+
+class UpstreamMetrics:
+    """Solicitudes, conexiones nuevas y reintentos por host"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, Dict[str, int]] = defaultdict(lambda: {
+            'requests': 0,
+            'new_connections': 0,
+            'http2_responses': 0,
+            'retries': 0,
+            'failures': 0
+        })
+
+    def incr(self, host: str, field: str, amount: int = 1):
+        with self._lock:
+            self._hosts[host][field] += amount
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            hosts = {host: dict(values) for host, values in self._hosts.items()}
+        for values in hosts.values():
+            requests = values['requests']
+            reused = max(requests - values['new_connections'], 0)
+            values['reused_connections'] = reused
+            values['reuse_ratio'] = round(reused / requests, 3) if requests else None
+        return hosts
+
+
+class UpstreamSession:
+    """Vista del cliente compartido con un timeout por defecto (no cierra el pool)"""
+
+    def __init__(self, owner: 'UpstreamHTTPClient', timeout: Any = None):
+        self._owner = owner
+        self._timeout = timeout
+
+    async def __aenter__(self) -> 'UpstreamSession':
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        kwargs.setdefault('timeout', self._timeout)
+        return await self._owner.request('POST', url, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        kwargs.setdefault('timeout', self._timeout)
+        return await self._owner.request('GET', url, **kwargs)
+
+    def stream(self, method: str, url: str, **kwargs):
+        kwargs.setdefault('timeout', self._timeout)
+        return self._owner.stream(method, url, **kwargs)
+
+
+class UpstreamHTTPClient:
+    """
+    Cliente httpx de alcance de aplicación.
+
+    Mantiene un AsyncClient por host, cada uno con su propio límite de
+    conexiones, así un proveedor lento no agota el pool de los demás. Los
+    clientes quedan ligados al event loop donde se crearon; si se usa desde
+    otro loop (scripts con asyncio.run) se crea uno nuevo para ese loop.
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+        self.metrics = UpstreamMetrics()
+        self.http2 = UPSTREAM_HTTP2 and HTTP2_AVAILABLE
+
+    def _client_for(self, host: str) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(host)
+        if entry is not None and entry[0] is loop and not entry[1].is_closed:
+            return entry[1]
+
+        client = httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS_PER_HOST,
+                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE_PER_HOST,
+                keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY_SECONDS
+            ),
+            timeout=httpx.Timeout(UPSTREAM_DEFAULT_TIMEOUT_SECONDS, connect=UPSTREAM_CONNECT_TIMEOUT_SECONDS)
+        )
+        self._clients[host] = (loop, client)
+        return client
+
+    def _trace(self, host: str):
+        async def trace(event: str, info: dict):
+            if event == 'connection.connect_tcp.complete':
+                self.metrics.incr(host, 'new_connections')
+        return trace
+
+    @staticmethod
+    def _timeout(timeout: Any) -> Any:
+        if timeout is None or isinstance(timeout, httpx.Timeout):
+            return timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+        return httpx.Timeout(timeout, connect=UPSTREAM_CONNECT_TIMEOUT_SECONDS)
+
+    def _record_response(self, host: str, response: httpx.Response):
+        if response.http_version == 'HTTP/2':
+            self.metrics.incr(host, 'http2_responses')
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        timeout: Any = None,
+        max_retries: Optional[int] = None,
+        **kwargs
+    ) -> httpx.Response:
+        """
+        Enviar una solicitud por el pool del host, con reintentos y backoff.
+
+        Se reintenta ante errores de conexión y respuestas 429/502/503/504
+        (respetando Retry-After si es corto). Otros errores se propagan igual
+        que con httpx.
+
+        En los hosts de UPSTREAM_SCHEDULED_HOSTS el 429 se devuelve sin
+        reintentar: quien llama tiene un slot de llm_scheduler y el backoff
+        por rate limit lo aplica el scheduler para todo el modelo, no este
+        slot reintentando mientras lo retiene.
+        """
+        host = httpx.URL(url).host
+        client = self._client_for(host)
+        retries = UPSTREAM_MAX_RETRIES if max_retries is None else max_retries
+        retry_statuses = SCHEDULED_RETRY_STATUS_CODES if host in UPSTREAM_SCHEDULED_HOSTS else RETRY_STATUS_CODES
+        extensions = {**kwargs.pop('extensions', {}), 'trace': self._trace(host)}
+        timeout = self._timeout(timeout)
+
+        attempt = 0
+        while True:
+            self.metrics.incr(host, 'requests')
+            try:
+                response = await client.request(method, url, timeout=timeout, extensions=extensions, **kwargs)
+            except RETRY_EXCEPTIONS as e:
+                if attempt >= retries:
+                    self.metrics.incr(host, 'failures')
+                    raise
+                delay = 0.5 * 2 ** attempt
+                logger.warning(f"Reintentando {method} {host} en {delay:.1f}s: {type(e).__name__}")
+            except httpx.HTTPError:
+                self.metrics.incr(host, 'failures')
+                raise
+            else:
+                self._record_response(host, response)
+                if response.status_code not in retry_statuses or attempt >= retries:
+                    return response
+                await response.aclose()
+                delay = 0.5 * 2 ** attempt
+                retry_after = response.headers.get('retry-after', '')
+                if retry_after.isdigit():
+                    delay = min(float(retry_after), MAX_RETRY_AFTER_SECONDS)
+                logger.warning(f"Reintentando {method} {host} en {delay:.1f}s: HTTP {response.status_code}")
+
+            attempt += 1
+            self.metrics.incr(host, 'retries')
+            await asyncio.sleep(delay)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request('POST', url, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request('GET', url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, timeout: Any = None, **kwargs) -> AsyncIterator[httpx.Response]:
+        """Respuesta en streaming (sin reintentos: el cuerpo ya pudo consumirse)"""
+        host = httpx.URL(url).host
+        client = self._client_for(host)
+        extensions = {**kwargs.pop('extensions', {}), 'trace': self._trace(host)}
+        self.metrics.incr(host, 'requests')
+        try:
+            async with client.stream(
+                method, url, timeout=self._timeout(timeout), extensions=extensions, **kwargs
+            ) as response:
+                self._record_response(host, response)
+                yield response
+        except httpx.HTTPError:
+            self.metrics.incr(host, 'failures')
+            raise
+
+    def session(self, timeout: Any = None) -> UpstreamSession:
+        """
+        Uso equivalente a `async with httpx.AsyncClient(timeout=...) as client`,
+        pero sobre el pool compartido.
+        """
+        return UpstreamSession(self, timeout)
+
+    async def aclose(self):
+        """Cerrar los pools del loop actual (apagado de la API)"""
+        loop = asyncio.get_running_loop()
+        for host, (client_loop, client) in list(self._clients.items()):
+            if client_loop is loop:
+                await client.aclose()
+                del self._clients[host]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'http2_enabled': self.http2,
+            'scheduled_hosts': sorted(UPSTREAM_SCHEDULED_HOSTS),
+            'limits_per_host': {
+                'max_connections': UPSTREAM_MAX_CONNECTIONS_PER_HOST,
+                'max_keepalive_connections': UPSTREAM_MAX_KEEPALIVE_PER_HOST,
+                'keepalive_expiry_seconds': UPSTREAM_KEEPALIVE_EXPIRY_SECONDS
+            },
+            'hosts': self.metrics.snapshot()
+        }
+
+
+# Instancia global
+upstream_http = UpstreamHTTPClient()
@@ -1,5 +1,4 @@
 import React, { useState, useRef, useEffect } from 'react';
-import axios from 'axios';
 import './ChatWidget.css';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
@@ -51,35 +50,88 @@ const ChatWidget = ({ isOpen, onToggle }) => {
     setInput('');
     setLoading(true);
 
-    try {
-      const response = await axios.post(`${API}/chat`, {
-        message: input,
-        agent_name: selectedAgent,
-        conversation_id: conversationId,
-      });
-
+    // El mensaje del asistente se agrega una sola vez, fuera de los updaters:
+    // StrictMode ejecuta los updaters dos veces, así que deben ser puros
+    const assistantId = `assistant-${Date.now()}`;
+    let assistantAdded = false;
+    const ensureAssistant = () => {
+      if (assistantAdded) return;
+      assistantAdded = true;
       setMessages((prev) => [
         ...prev,
-        {
-          role: 'assistant',
-          content: response.data.response,
-          agent: selectedAgent,
-        },
+        { id: assistantId, role: 'assistant', content: '', agent: selectedAgent },
       ]);
+    };
+    const appendToAssistant = (text) => {
+      ensureAssistant();
+      setMessages((prev) =>
+        prev.map((msg) => (msg.id === assistantId ? { ...msg, content: msg.content + text } : msg))
+      );
+    };
 
-      if (!conversationId) {
-        setConversationId(response.data.conversation_id);
+    try {
+      // Respuesta en streaming (SSE): el texto aparece a medida que se genera
+      const response = await fetch(`${API}/chat/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          message: input,
+          agent_name: selectedAgent,
+          conversation_id: conversationId,
+          timezone: Intl.DateTimeFormat().resolvedOptions().timeZone,
+        }),
+      });
+      if (!response.ok || !response.body) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let finished = false;
+
+      while (!finished) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const raw of events) {
+          const eventLine = raw.split('\n').find((l) => l.startsWith('event: '));
+          const dataLine = raw.split('\n').find((l) => l.startsWith('data: '));
+          if (!eventLine || !dataLine) continue;
+          const event = eventLine.slice(7);
+          const data = JSON.parse(dataLine.slice(6));
+
+          if (event === 'start') {
+            setLoading(false);
+            ensureAssistant();
+            if (!conversationId) {
+              setConversationId(data.conversation_id);
+            }
+          } else if (event === 'token') {
+            appendToAssistant(data.content);
+          } else if (event === 'error') {
+            appendToAssistant(data.message);
+            finished = true;
+          } else if (event === 'done') {
+            finished = true;
+          }
+        }
       }
     } catch (error) {
       console.error('Error sending message:', error);
-      setMessages((prev) => [
-        ...prev,
-        {
-          role: 'assistant',
-          content: 'Lo siento, hubo un error. Por favor, intenta nuevamente.',
-          agent: selectedAgent,
-        },
-      ]);
+      if (!assistantAdded) {
+        setMessages((prev) => [
+          ...prev,
+          {
+            role: 'assistant',
+            content: 'Lo siento, hubo un error. Por favor, intenta nuevamente.',
+            agent: selectedAgent,
+          },
+        ]);
+      }
     } finally {
       setLoading(false);
     }
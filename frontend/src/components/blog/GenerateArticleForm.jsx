@@ -1,6 +1,6 @@
 import React, { useState } from 'react';
 import { Button, Input, Select, Checkbox, message, Tag } from 'antd';
-import { generateCustomArticle } from '../../utils/blogApi';
+import { generateCustomArticle, waitForJob } from '../../utils/blogApi';
 
 const { TextArea } = Input;
 const { Option } = Select;
@@ -52,9 +52,10 @@ const GenerateArticleForm = ({ onSuccess, onCancel }) => {
 
     setLoading(true);
     try {
-      const result = await generateCustomArticle(formData);
+      const { job_id } = await generateCustomArticle(formData);
+      const job = await waitForJob(job_id);
       message.success('¡Artículo generado! Revísalo en la cola de aprobación.');
-      if (onSuccess) onSuccess(result);
+      if (onSuccess) onSuccess(job.result);
     } catch (error) {
       console.error('Error generando artículo:', error);
       message.error(error.message || 'Error al generar el artículo');
@@ -114,7 +114,8 @@ const LandingPage = ({ services }) => {
     try {
       const response = await axios.post(`${API}/chat`, {
         message: chatInput,
-        agent_name: 'Rocío'
+        agent_name: 'Rocío',
+        timezone: Intl.DateTimeFormat().resolvedOptions().timeZone
       });
 
       const aiMsg = { role: 'assistant', content: response.data.response };
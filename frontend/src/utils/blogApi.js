@@ -31,6 +31,48 @@ export const generateCustomArticle = async (data) => {
   return response.json();
 };
 
+/**
+ * Estado de una tarea en segundo plano (p.ej. la generación de un artículo)
+ */
+export const getJobStatus = async (jobId) => {
+  const response = await fetch(`${API_URL}/api/jobs/${jobId}`, {
+    method: 'GET',
+    headers: getAuthHeaders()
+  });
+  
+  if (!response.ok) {
+    throw new Error('Error obteniendo el estado de la tarea');
+  }
+  
+  return response.json();
+};
+
+/**
+ * Esperar a que una tarea termine. Consulta cada `intervalMs`, espaciando
+ * hasta `maxIntervalMs`, y se rinde a los `timeoutMs` (la tarea sigue en
+ * el servidor y su resultado queda en la cola de aprobación)
+ */
+export const waitForJob = async (
+  jobId,
+  { intervalMs = 3000, maxIntervalMs = 15000, timeoutMs = 15 * 60 * 1000, onProgress } = {}
+) => {
+  const deadline = Date.now() + timeoutMs;
+  let delay = intervalMs;
+  for (;;) {
+    const job = await getJobStatus(jobId);
+    if (onProgress) onProgress(job);
+    if (job.status === 'succeeded') return job;
+    if (job.status === 'failed') {
+      throw new Error(job.last_error || 'La tarea falló');
+    }
+    if (Date.now() + delay > deadline) {
+      throw new Error('La tarea sigue en curso; revisa la cola de aprobación más tarde');
+    }
+    await new Promise((resolve) => setTimeout(resolve, delay));
+    delay = Math.min(delay * 1.5, maxIntervalMs);
+  }
+};
+
 /**
  * Obtener artículos en cola de aprobación (Admin)
  */
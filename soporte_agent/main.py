@@ -12,7 +12,15 @@ from sqlalchemy import create_engine, Column, String, Text, DateTime
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from datetime import datetime
+import asyncio
 import logging
+import sys
+from pathlib import Path
+
+# model_router es el módulo del backend: la imagen lo copia junto a main.py;
+# fuera de Docker se toma de ../backend
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+from model_router import ModelRouter, ModelRouterError, MODEL_HEALTH_COLLECTION
 
 # Configuración
 logging.basicConfig(level=logging.INFO)
@@ -74,6 +82,54 @@ OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_MODEL_HIGH = os.getenv("OPENROUTER_MODEL_ID_HIGH", "anthropic/claude-sonnet-4.5")
 OPENROUTER_MODEL_LOW = os.getenv("OPENROUTER_MODEL_ID_LOW", "openai/gpt-4o-mini")
 ANTHROPIC_FALLBACK = os.getenv("ANTHROPIC_API_KEY_FALLBACK")
+OPENROUTER_DEADLINE_SECONDS = float(os.getenv("OPENROUTER_DEADLINE_SECONDS", "45"))
+MONGO_URL = os.getenv("MONGO_URL")
+
+# Routing por latencia/errores con failover entre HIGH y LOW; salud compartida con el watcher vía Mongo
+model_router = ModelRouter("soporte_agent")
+health_sync_task: Optional[asyncio.Task] = None
+
+class UpstreamModelError(Exception):
+    """OpenRouter respondió con un estado distinto de 200"""
+
+# Cliente HTTP compartido hacia OpenRouter (HTTP/2 + keep-alive, sin handshake TLS por consulta)
+openrouter_client: Optional[httpx.AsyncClient] = None
+openrouter_stats = {"requests": 0, "new_connections": 0}
+
+async def _trace_connections(event: str, info: dict):
+    if event == "connection.connect_tcp.complete":
+        openrouter_stats["new_connections"] += 1
+
+@app.on_event("startup")
+async def start_openrouter_client():
+    global openrouter_client
+    openrouter_client = httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(
+            http2=True,
+            retries=2,  # Reintentos de conexión
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120)
+        ),
+        timeout=httpx.Timeout(60.0, connect=10.0)
+    )
+
+@app.on_event("startup")
+async def start_model_health_sync():
+    global health_sync_task
+    if not MONGO_URL:
+        logger.info("MONGO_URL no configurada: routing sin salud compartida con el watcher")
+        return
+    from motor.motor_asyncio import AsyncIOMotorClient
+    mongo_db = AsyncIOMotorClient(MONGO_URL).get_default_database("guarani_appstore")
+    health_sync_task = asyncio.create_task(
+        model_router.run_health_sync(mongo_db[MODEL_HEALTH_COLLECTION])
+    )
+
+@app.on_event("shutdown")
+async def close_openrouter_client():
+    if health_sync_task is not None:
+        health_sync_task.cancel()
+    if openrouter_client is not None:
+        await openrouter_client.aclose()
 
 # Routes
 @app.get("/health")
@@ -94,8 +150,11 @@ async def query_agent(
     Procesa una consulta usando el agente con routing inteligente
     """
     try:
-        # Determinar qué modelo usar
-        model_id = OPENROUTER_MODEL_HIGH if request.use_high_model else OPENROUTER_MODEL_LOW
+        # Modelo preferido y respaldo (el router reordena si el preferido está lento o caído)
+        if request.use_high_model:
+            candidates = [OPENROUTER_MODEL_HIGH, OPENROUTER_MODEL_LOW]
+        else:
+            candidates = [OPENROUTER_MODEL_LOW, OPENROUTER_MODEL_HIGH]
         
         # Buscar contexto relevante en la base de conocimiento (RAG)
         # TODO: Implementar búsqueda vectorial real
@@ -120,36 +179,40 @@ Responde de manera clara y precisa."""
             "Content-Type": "application/json"
         }
         
-        data = {
-            "model": model_id,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ]
-        }
-        
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
+        async def send(model_id: str) -> str:
+            data = {
+                "model": model_id,
+                "messages": [
+                    {"role": "user", "content": prompt}
+                ]
+            }
+            
+            openrouter_stats["requests"] += 1
+            response = await openrouter_client.post(
                 "https://openrouter.ai/api/v1/chat/completions",
                 headers=headers,
-                json=data
+                json=data,
+                timeout=OPENROUTER_DEADLINE_SECONDS,
+                extensions={"trace": _trace_connections}
             )
             
-            if response.status_code == 200:
-                result = response.json()
-                answer = result["choices"][0]["message"]["content"]
-                
-                return QueryResponse(
-                    answer=answer,
-                    model_used=model_id,
-                    confidence=0.95,
-                    sources=[]
-                )
-            else:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Error from OpenRouter: {response.text}"
-                )
-                
+            if response.status_code != 200:
+                raise UpstreamModelError(f"Error from OpenRouter ({response.status_code}): {response.text}")
+            result = response.json()
+            return result["choices"][0]["message"]["content"]
+        
+        answer, model_id = await model_router.call(candidates, send, OPENROUTER_DEADLINE_SECONDS)
+        
+        return QueryResponse(
+            answer=answer,
+            model_used=model_id,
+            confidence=0.95,
+            sources=[]
+        )
+    
+    except ModelRouterError as e:
+        logger.error(f"Error processing query: {str(e)}")
+        raise HTTPException(status_code=503 if e.timed_out else 502, detail=str(e))
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -196,6 +259,11 @@ async def get_stats(db: Session = Depends(get_db)):
         return {
             "knowledge_base_entries": knowledge_count,
             "models_available": [OPENROUTER_MODEL_HIGH, OPENROUTER_MODEL_LOW],
+            "openrouter_connections": {
+                **openrouter_stats,
+                "reused": max(openrouter_stats["requests"] - openrouter_stats["new_connections"], 0)
+            },
+            "model_router": model_router.stats(),
             "status": "operational"
         }
         
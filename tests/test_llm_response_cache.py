@@ -0,0 +1,102 @@
+"""
+Tests de LLMResponseCache (backend/llm_response_cache.py): coalescencia de llamadas en vuelo
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import llm_response_cache as cache_module  # noqa: E402
+from llm_response_cache import LLMResponseCache  # noqa: E402
+
+
+def make_cache(monkeypatch) -> LLMResponseCache:
+    monkeypatch.setattr(cache_module, 'LLM_CACHE_ENABLED', True)
+    cache = LLMResponseCache(max_entries=10)
+
+    # Sólo el nivel de memoria: sin MongoDB
+    async def persistent_get(key):
+        return None
+
+    async def persistent_put(key, endpoint, value, ttl):
+        return None
+
+    monkeypatch.setattr(cache, '_persistent_get', persistent_get)
+    monkeypatch.setattr(cache, '_persistent_put', persistent_put)
+    return cache
+
+
+def test_concurrent_calls_share_one_request(monkeypatch):
+    cache = make_cache(monkeypatch)
+
+    async def scenario():
+        calls = 0
+
+        async def call():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {'success': True, 'response': 'ok'}
+
+        results = await asyncio.gather(*[cache.get_or_call('find_leads', 'k1', call) for _ in range(5)])
+        return calls, results
+
+    calls, results = asyncio.run(scenario())
+    assert calls == 1
+    assert all(r['response'] == 'ok' for r in results)
+    assert sum(1 for r in results if r.get('coalesced')) == 4
+
+
+def test_cancelled_leader_does_not_cancel_waiters(monkeypatch):
+    cache = make_cache(monkeypatch)
+
+    async def scenario():
+        started = asyncio.Event()
+        calls = 0
+
+        async def call():
+            nonlocal calls
+            calls += 1
+            started.set()
+            await asyncio.sleep(0.05)
+            return {'success': True, 'response': 'ok'}
+
+        leader = asyncio.create_task(cache.get_or_call('find_leads', 'k1', call))
+        await started.wait()
+        waiter = asyncio.create_task(cache.get_or_call('find_leads', 'k1', call))
+        await asyncio.sleep(0)
+
+        # El cliente de la primera solicitud se desconecta mientras espera al modelo
+        leader.cancel()
+        try:
+            await leader
+        except asyncio.CancelledError:
+            pass
+        else:
+            raise AssertionError('la solicitud líder debía cancelarse')
+
+        result = await waiter
+        return calls, result
+
+    calls, result = asyncio.run(scenario())
+    assert result['response'] == 'ok'
+    # El waiter repitió la llamada con su propio call
+    assert calls == 2
+    assert not cache._in_flight
+
+
+def test_call_errors_reach_waiters(monkeypatch):
+    cache = make_cache(monkeypatch)
+
+    async def scenario():
+        async def call():
+            await asyncio.sleep(0.01)
+            raise RuntimeError('upstream down')
+
+        return await asyncio.gather(
+            *[cache.get_or_call('find_leads', 'k1', call) for _ in range(3)], return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
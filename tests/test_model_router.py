@@ -0,0 +1,74 @@
+"""
+Tests de ModelRouter (backend/model_router.py): qué se registra como latencia del modelo
+"""
+import asyncio
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from model_router import ModelRouter, ModelRouterError, untimed  # noqa: E402
+
+
+@asynccontextmanager
+async def local_turn(wait: float):
+    """Turno local (como llm_scheduler.slot) que tarda wait segundos en obtenerse"""
+    await asyncio.sleep(wait)
+    yield
+
+
+def test_untimed_wait_is_not_model_latency():
+    async def scenario():
+        router = ModelRouter('test')
+
+        async def send(model):
+            async with untimed(local_turn(0.2)):
+                await asyncio.sleep(0.01)
+                return 'ok'
+
+        result = await router.call(['m1'], send, deadline=5.0, hedge=False)
+        return router, result
+
+    router, result = asyncio.run(scenario())
+    assert result == ('ok', 'm1')
+    [(ok, latency_ms)] = router._health('m1').samples
+    assert ok is True
+    assert latency_ms < 150
+
+
+def test_deadline_while_waiting_locally_is_not_a_model_failure():
+    async def scenario():
+        router = ModelRouter('test')
+
+        async def send(model):
+            async with untimed(local_turn(1.0)):
+                return 'ok'
+
+        try:
+            await router.call(['m1'], send, deadline=0.05, hedge=False)
+        except ModelRouterError as e:
+            assert e.timed_out
+        else:
+            raise AssertionError('el deadline debía vencer')
+        return router
+
+    router = asyncio.run(scenario())
+    assert not router._health('m1').samples
+    assert router._health('m1').healthy()
+
+
+def test_latency_without_untimed_counts_from_launch():
+    async def scenario():
+        router = ModelRouter('test')
+
+        async def send(model):
+            await asyncio.sleep(0.1)
+            return 'ok'
+
+        await router.call(['m1'], send, deadline=5.0, hedge=False)
+        return router
+
+    router = asyncio.run(scenario())
+    [(ok, latency_ms)] = router._health('m1').samples
+    assert ok is True and latency_ms >= 90
@@ -0,0 +1,85 @@
+"""
+Tests de UserCache (backend/auth.py): carga compartida entre requests concurrentes
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from auth import UserCache  # noqa: E402
+from models import User, UserRole  # noqa: E402
+
+
+def make_user(user_id: str) -> User:
+    return User(id=user_id, email=f'{user_id}@example.com', full_name='Test', role=UserRole.USER, is_active=True)
+
+
+def test_concurrent_loads_share_one_query():
+    async def scenario():
+        cache = UserCache(ttl_seconds=30)
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return make_user('u1')
+
+        users = await asyncio.gather(*[cache.load('u1', loader) for _ in range(5)])
+        return calls, users
+
+    calls, users = asyncio.run(scenario())
+    assert calls == 1
+    assert all(user.id == 'u1' for user in users)
+
+
+def test_cancelled_leader_does_not_cancel_waiters():
+    async def scenario():
+        cache = UserCache(ttl_seconds=30)
+        started = asyncio.Event()
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            started.set()
+            await asyncio.sleep(0.05)
+            return make_user('u1')
+
+        leader = asyncio.create_task(cache.load('u1', loader))
+        await started.wait()
+        waiter = asyncio.create_task(cache.load('u1', loader))
+        await asyncio.sleep(0)
+
+        # El cliente de la primera request se desconecta a mitad de la carga
+        leader.cancel()
+        try:
+            await leader
+        except asyncio.CancelledError:
+            pass
+        else:
+            raise AssertionError('la request líder debía cancelarse')
+
+        user = await waiter
+        return calls, user, cache
+
+    calls, user, cache = asyncio.run(scenario())
+    assert user is not None and user.id == 'u1'
+    # El waiter repitió la carga con su propio loader
+    assert calls == 2
+    assert not cache._inflight
+
+
+def test_loader_errors_reach_waiters():
+    async def scenario():
+        cache = UserCache(ttl_seconds=30)
+
+        async def loader():
+            await asyncio.sleep(0.01)
+            raise RuntimeError('db down')
+
+        return await asyncio.gather(*[cache.load('u1', loader) for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
@@ -1,12 +1,16 @@
 """
 Model Watcher - Verificación de Modelos OpenRouter
 Monitorea la disponibilidad y estado de los modelos configurados
+
+Publica cada resultado en la colección Mongo `model_health`, que leen los
+routers de modelos del backend y de soporte_agent; ellos a su vez dejan ahí
+la latencia y tasa de error que observan (campo observed.<router>).
 """
 import os
-import time
+import asyncio
 import httpx
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 
 logging.basicConfig(
     level=logging.INFO,
@@ -21,74 +25,136 @@ MODELS_TO_CHECK = [
     os.getenv("OPENROUTER_MODEL_ID_HIGH", "anthropic/claude-sonnet-4.5"),
     os.getenv("OPENROUTER_MODEL_ID_LOW", "openai/gpt-4o-mini")
 ]
+# Modelos adicionales (p.ej. CHAT_MODEL y CHAT_FALLBACK_MODELS del backend), separados por coma
+MODELS_TO_CHECK += [
+    m.strip() for m in os.getenv("WATCHER_EXTRA_MODELS", "").split(",")
+    if m.strip() and m.strip() not in MODELS_TO_CHECK
+]
+MONGO_URL = os.getenv("MONGO_URL")
+MODEL_HEALTH_COLLECTION = "model_health"
+
+# Cliente compartido entre verificaciones (HTTP/2 + keep-alive)
+connection_stats = {"requests": 0, "new_connections": 0}
+
+async def _trace_connections(event: str, info: dict):
+    if event == "connection.connect_tcp.complete":
+        connection_stats["new_connections"] += 1
 
-async def check_model_availability(model_id: str) -> dict:
-    """Verifica la disponibilidad de un modelo"""
+def create_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(
+            http2=True,
+            retries=2,  # Reintentos de conexión
+            limits=httpx.Limits(max_connections=5, max_keepalive_connections=2)
+        ),
+        timeout=httpx.Timeout(30.0, connect=10.0)
+    )
+
+async def check_model_availability(client: httpx.AsyncClient, model_id: str) -> dict:
+    """
+    Verifica la disponibilidad de un modelo
+
+    available es None cuando la verificación misma falló (API de OpenRouter
+    caída, red, credenciales): eso no dice nada de este modelo en particular.
+    """
     try:
         headers = {
             "Authorization": f"Bearer {OPENROUTER_API_KEY}",
             "Content-Type": "application/json"
         }
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # Obtener lista de modelos disponibles
-            response = await client.get(
-                "https://openrouter.ai/api/v1/models",
-                headers=headers
-            )
+        # Obtener lista de modelos disponibles
+        connection_stats["requests"] += 1
+        response = await client.get(
+            "https://openrouter.ai/api/v1/models",
+            headers=headers,
+            extensions={"trace": _trace_connections}
+        )
+        
+        if response.status_code == 200:
+            models = response.json().get("data", [])
+            model_info = next((m for m in models if m["id"] == model_id), None)
             
-            if response.status_code == 200:
-                models = response.json().get("data", [])
-                model_info = next((m for m in models if m["id"] == model_id), None)
-                
-                if model_info:
-                    return {
-                        "model_id": model_id,
-                        "available": True,
-                        "status": "operational",
-                        "context_length": model_info.get("context_length"),
-                        "pricing": model_info.get("pricing"),
-                        "checked_at": datetime.utcnow().isoformat()
-                    }
-                else:
-                    return {
-                        "model_id": model_id,
-                        "available": False,
-                        "status": "not_found",
-                        "checked_at": datetime.utcnow().isoformat()
-                    }
+            if model_info:
+                return {
+                    "model_id": model_id,
+                    "available": True,
+                    "status": "operational",
+                    "context_length": model_info.get("context_length"),
+                    "pricing": model_info.get("pricing"),
+                    "checked_at": datetime.utcnow().isoformat()
+                }
             else:
                 return {
                     "model_id": model_id,
                     "available": False,
-                    "status": "api_error",
-                    "error": response.text,
+                    "status": "not_found",
                     "checked_at": datetime.utcnow().isoformat()
                 }
-                
+        else:
+            return {
+                "model_id": model_id,
+                "available": None,
+                "status": "api_error",
+                "error": response.text,
+                "checked_at": datetime.utcnow().isoformat()
+            }
+            
     except Exception as e:
         logger.error(f"❌ Error verificando modelo {model_id}: {str(e)}")
         return {
             "model_id": model_id,
-            "available": False,
+            "available": None,
             "status": "error",
             "error": str(e),
             "checked_at": datetime.utcnow().isoformat()
         }
 
-async def run_health_check():
+async def publish_health(health_collection, result: dict):
+    """Guarda el resultado en model_health y registra lo que observan los routers"""
+    now = datetime.now(timezone.utc)
+    if result["available"] is None:
+        # Falla del watcher, no del modelo: se conserva el último veredicto
+        # (los routers lo descartan solo al superar MODEL_HEALTH_MAX_AGE_SECONDS)
+        update = {"last_error": result.get("error"), "last_error_status": result["status"], "last_error_at": now}
+    else:
+        update = {
+            "available": result["available"],
+            "status": result["status"],
+            "context_length": result.get("context_length"),
+            "checked_at": now
+        }
+    try:
+        await health_collection.update_one({"_id": result["model_id"]}, {"$set": update}, upsert=True)
+        doc = await health_collection.find_one({"_id": result["model_id"]}, {"observed": 1})
+        for router, observed in ((doc or {}).get("observed") or {}).items():
+            logger.info(
+                f"   [{router}] p50={observed.get('p50_ms')}ms p95={observed.get('p95_ms')}ms "
+                f"errores={observed.get('error_rate')}"
+            )
+    except Exception as e:
+        logger.error(f"❌ Error publicando salud de {result['model_id']}: {str(e)}")
+
+async def run_health_check(client: httpx.AsyncClient, health_collection=None):
     """Ejecuta verificación de salud de modelos"""
     logger.info("🔍 Iniciando verificación de modelos...")
     
     for model_id in MODELS_TO_CHECK:
-        result = await check_model_availability(model_id)
+        result = await check_model_availability(client, model_id)
         
         if result["available"]:
             logger.info(f"✅ {model_id}: Disponible")
             logger.info(f"   Context: {result.get('context_length', 'N/A')}")
+        elif result["available"] is None:
+            logger.warning(f"⚠️ {model_id}: No se pudo verificar - {result['status']}")
         else:
             logger.warning(f"⚠️ {model_id}: No disponible - {result['status']}")
+        
+        if health_collection is not None:
+            await publish_health(health_collection, result)
     
+    reused = connection_stats["requests"] - connection_stats["new_connections"]
+    logger.info(f"   Conexiones: {connection_stats['new_connections']} nuevas, {reused} reutilizadas")
     logger.info(f"✅ Verificación completada. Próxima verificación en {CHECK_INTERVAL} segundos")
 
 async def main():
@@ -97,19 +163,27 @@ async def main():
     logger.info(f"📋 Modelos a monitorear: {MODELS_TO_CHECK}")
     logger.info(f"⏱️ Intervalo de verificación: {CHECK_INTERVAL} segundos")
     
-    while True:
-        try:
-            await run_health_check()
-            time.sleep(CHECK_INTERVAL)
-            
-        except KeyboardInterrupt:
-            logger.info("🛑 Watcher detenido por el usuario")
-            break
-            
-        except Exception as e:
-            logger.error(f"❌ Error en el watcher: {str(e)}")
-            time.sleep(60)  # Esperar 1 minuto antes de reintentar
+    health_collection = None
+    if MONGO_URL:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        mongo_db = AsyncIOMotorClient(MONGO_URL).get_default_database("guarani_appstore")
+        health_collection = mongo_db[MODEL_HEALTH_COLLECTION]
+    else:
+        logger.warning("⚠️ MONGO_URL no configurada: la salud no se comparte con los routers")
+    
+    async with create_client() as client:
+        while True:
+            try:
+                await run_health_check(client, health_collection)
+                await asyncio.sleep(CHECK_INTERVAL)
+                
+            except KeyboardInterrupt:
+                logger.info("🛑 Watcher detenido por el usuario")
+                break
+                
+            except Exception as e:
+                logger.error(f"❌ Error en el watcher: {str(e)}")
+                await asyncio.sleep(60)  # Esperar 1 minuto antes de reintentar
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())